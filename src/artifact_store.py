@@ -0,0 +1,211 @@
+# coding=utf-8
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import ctrl_extractor
+import data_extractor
+import graph_compaction
+import reachability_extractor
+import tracing
+from batch_extractor import get_batch_extractor
+from batch_runner import run_mutants
+from emd_analysis import extract_mutant, judge_mutant, tracing_llm
+from graph_store import get_graph_store
+from llm_cache import parse_llm_string
+
+DEFAULT_ARTIFACT_PATH = "/Users/swan/bishe/LLM4EMD/cache/artifacts.sqlite"
+
+# 提取结果依赖的提示词，改动任一提示词都会使已有产物过期
+EXTRACTOR_PROMPTS = (
+    reachability_extractor.REACHABILITY_SYSTEM_PROMPT, reachability_extractor.REACHABILITY_HUMAN_TEMPLATE,
+    data_extractor.DATA_SYSTEM_PROMPT, data_extractor.DATA_HUMAN_TEMPLATE,
+    ctrl_extractor.CTRL_SYSTEM_PROMPT, ctrl_extractor.CTRL_HUMAN_TEMPLATE,
+)
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def model_identity(llm):
+    """提取所用模型的标识(模型, base_url, temperature)，无法解析时为llm_string本身"""
+    llm_string = llm._get_llm_string()
+    parsed = parse_llm_string(llm_string)
+    return list(parsed[:3]) if parsed else llm_string
+
+
+def artifact_inputs(program_path, mutant, graph_store=None):
+    """决定提取结果的输入：程序源码、变异体、依赖图、提取器配置与图压缩方式的哈希；任一变化时已有产物过期"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    graph_store = graph_store or get_graph_store()
+    graphs = {}
+    for kind in ("CFG", "PDG-DATA", "PDG-CTRL"):
+        try:
+            graphs[kind] = graph_store.base_fingerprint(program_name, kind)
+        except OSError:
+            graphs[kind] = None
+    with open(program_path, "r", encoding="utf-8") as f:
+        program_hash = sha256_text(f.read())
+    return {
+        "program": program_hash,
+        "mutant": sha256_text(json.dumps(mutant, sort_keys=True, ensure_ascii=False)),
+        "graphs": graphs,
+        "modes": [reachability_extractor.REACHABILITY_MODE, data_extractor.DATA_MODE, ctrl_extractor.CTRL_MODE],
+        "compaction": graph_compaction.PROMPT_COMPACTION,
+        "prompts": sha256_text("\n".join(EXTRACTOR_PROMPTS)),
+    }
+
+
+def inputs_key(inputs):
+    return sha256_text(json.dumps(inputs, sort_keys=True))
+
+
+class ArtifactStore:
+    """基于SQLite的提取产物存储：每个(程序, 变异体)一条，保存可达性约束、数据/控制依赖路径、
+    分级执行已得出的结论，以及来源信息（输入哈希、提取模型与提取选项）
+
+    判定阶段只读取输入哈希与当前一致的产物，程序、变异体、依赖图或提取提示词变化后的产物视为过期。
+    """
+
+    def __init__(self, path=DEFAULT_ARTIFACT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "writes": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "program TEXT NOT NULL, mutant_id TEXT NOT NULL, inputs_key TEXT NOT NULL, value TEXT NOT NULL, "
+            "created REAL NOT NULL, PRIMARY KEY (program, mutant_id))"
+        )
+        self.conn.commit()
+
+    def get(self, program_name, mutant_id, key=None):
+        """返回产物；key与保存时的输入哈希不一致（已过期）或不存在时返回None"""
+        with self.lock:
+            row = self.conn.execute("SELECT inputs_key, value FROM artifacts WHERE program = ? AND mutant_id = ?",
+                                    (program_name, mutant_id)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            if key is not None and row[0] != key:
+                self.counters["stale"] += 1
+                return None
+            self.counters["hits"] += 1
+        return json.loads(row[1])
+
+    def put(self, program_name, mutant_id, artifact):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO artifacts (program, mutant_id, inputs_key, value, created) VALUES (?, ?, ?, ?, ?)",
+                (program_name, mutant_id, artifact["provenance"]["inputs_key"], json.dumps(artifact, ensure_ascii=False),
+                 time.time()))
+            self.conn.commit()
+            self.counters["writes"] += 1
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+            return dict(self.counters, entries=entries)
+
+
+def extract_to_store(store, program_path, mutant, llm=None, concurrent=False, cascade=False, solver=False,
+                     force=False):
+    """提取一个变异体并写入产物存储，返回产物；已有输入哈希与提取选项都一致的产物时直接复用（force为True时重新提取）"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    llm = tracing_llm(llm)
+    inputs = artifact_inputs(program_path, mutant)
+    options = {"model": model_identity(llm), "cascade": cascade, "solver": solver}
+    if not force:
+        artifact = store.get(program_name, mutant["mutant_id"], inputs_key(inputs))
+        if artifact is not None and artifact["provenance"]["options"] == options:
+            return artifact
+
+    start_time = time.time()
+    artifact = extract_mutant(program_path, mutant, llm, concurrent, cascade, solver)
+    return save_artifact(store, program_path, mutant, artifact, llm, cascade, solver, time.time() - start_time, inputs)
+
+
+def save_artifact(store, program_path, mutant, artifact, llm, cascade=False, solver=False, extract_seconds=None,
+                  inputs=None):
+    """附上来源信息后写入产物存储，返回产物"""
+    inputs = inputs or artifact_inputs(program_path, mutant)
+    artifact["provenance"] = {"inputs_key": inputs_key(inputs), "inputs": inputs,
+                              "options": {"model": model_identity(llm), "cascade": cascade, "solver": solver},
+                              "extract_seconds": round(extract_seconds, 4) if extract_seconds is not None else None}
+    store.put(os.path.splitext(os.path.basename(program_path))[0], mutant["mutant_id"], artifact)
+    return artifact
+
+
+def analyze_to_store(store, program_path, mutant, llm=None, concurrent=False, cascade=False, solver=False,
+                     **judge_options):
+    """完整流程的单个变异体：与analyze_mutant相同地提取并判定，同时把提取产物写入产物存储，
+    之后的增量重跑（见incremental.py）据此只重算输入变化的提取链"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    with tracing.span("mutant", program=program_name, mutant_id=mutant["mutant_id"]):
+        artifact = extract_to_store(store, program_path, mutant, llm, concurrent, cascade, solver, force=True)
+        return judge_mutant(program_path, mutant, artifact, llm, **judge_options)
+
+
+def run_extraction_stage(store, program_path, mutants, llm=None, max_workers=4, concurrent=False, cascade=False,
+                         solver=False, batch_extraction=False, force=False):
+    """提取阶段：并发提取全部变异体并写入产物存储，不调用分析链；返回 {"extracted", "failed", "seconds"}"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    if batch_extraction:
+        get_batch_extractor().prefetch(program_name, mutants, llm)
+    failed = []
+
+    def extract(mutant):
+        try:
+            extract_to_store(store, program_path, mutant, llm, concurrent, cascade, solver, force)
+        except Exception as e:
+            logging.error(f"变异体 {mutant['mutant_id']} 提取失败: {e}")
+            failed.append(mutant["mutant_id"])
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(extract, mutants))
+    elapsed = time.time() - start_time
+    logging.info(f"提取阶段 {program_name}: {len(mutants)} 个变异体, 失败 {len(failed)} 个, "
+                 f"耗时: {elapsed:.4f} 秒, 产物存储: {json.dumps(store.stats(), ensure_ascii=False)}")
+    return {"extracted": len(mutants) - len(failed), "failed": failed, "seconds": round(elapsed, 4)}
+
+
+def load_artifact(store, program_path, mutant):
+    """读取与当前输入一致的产物，没有时报错"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    artifact = store.get(program_name, mutant["mutant_id"], inputs_key(artifact_inputs(program_path, mutant)))
+    if artifact is None:
+        raise LookupError(f"变异体 {mutant['mutant_id']} 没有可用的提取产物（未提取或输入已变化）")
+    return artifact
+
+
+def judge_from_store(store, program_path, mutant, llm=None, extract_missing=False, extract_options=None,
+                     **judge_options):
+    """判定阶段的单个变异体：读取与当前输入一致的产物后调用分析链；
+    没有可用产物时，extract_missing为True则按extract_options先提取，否则报错"""
+    try:
+        artifact = load_artifact(store, program_path, mutant)
+    except LookupError:
+        if not extract_missing:
+            raise
+        artifact = extract_to_store(store, program_path, mutant, llm, **(extract_options or {}))
+    return judge_mutant(program_path, mutant, artifact, llm, **judge_options)
+
+
+def run_judge_stage(store, program_path, mutants, llm=None, max_workers=4, max_in_flight=None, journal=None,
+                    model=None, extract_missing=False, extract_options=None, **judge_options):
+    """判定阶段：只读取产物并调用分析链（每个变异体一次判定请求），结果日志与run_mutants一致"""
+    analyze_fn = partial(judge_from_store, store, llm=llm, extract_missing=extract_missing,
+                         extract_options=extract_options, **judge_options)
+    results = run_mutants(program_path, mutants, analyze_fn, max_workers=max_workers, max_in_flight=max_in_flight,
+                          journal=journal, model=model)
+    logging.info(f"产物存储统计: {json.dumps(store.stats(), ensure_ascii=False)}")
+    return results
@@ -0,0 +1,265 @@
+# coding=utf-8
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+import ctrl_extractor
+import data_extractor
+import tracing
+from ctrl_extractor import CTRL_SYSTEM_PROMPT
+from ctrl_slicer import extract_ctrl_paths
+from data_extractor import DATA_SYSTEM_PROMPT
+from data_slicer import slice_data_paths
+from graph_compaction import compact_to_lines
+from graph_store import canonical, get_graph_store
+from llm_client import get_llm
+from program_graph import ProgramGraph, node_code, parse_mutated_line
+from prompt_stage import BATCH_END, BATCH_HEADER, BATCH_HEADER_PATTERN
+from reachability_memo import parse_original_line
+from token_counter import count_message_tokens
+from tracing import TracingChatModel
+
+# 每个请求最多包含的变异体数，以及单个请求的输入token预算（超出时对半拆分）
+BATCH_SIZE = 8
+BATCH_TOKEN_BUDGET = 12000
+BATCH_WORKERS = 4
+
+# 批量提取的输出要求，接在单变异体提取要求之后（系统消息仍是固定前缀）
+BATCH_INSTRUCTION = f"""
+## 批量提取：以下同一程序的多个变异体共用一张依赖图，请对每个变异体分别按上述要求提取。
+输出时每个变异体先单独输出一行“{BATCH_HEADER}变异体id”，紧接着输出该变异体的提取结果；全部变异体输出完毕后单独输出一行“{BATCH_END}”。
+"""
+BATCH_HUMAN_TEMPLATE = """依赖图信息:
+{graph_info}
+
+变异体列表:
+{mutants}
+"""
+BATCH_PROMPTS = {
+    kind: ChatPromptTemplate.from_messages([SystemMessage(content=system_prompt + BATCH_INSTRUCTION),
+                                            ("human", BATCH_HUMAN_TEMPLATE)])
+    for kind, system_prompt in (("PDG-DATA", DATA_SYSTEM_PROMPT), ("PDG-CTRL", CTRL_SYSTEM_PROMPT))
+}
+# 运行时读取各提取器当前的提取方式
+BATCH_MODES = {"PDG-DATA": lambda: data_extractor.DATA_MODE, "PDG-CTRL": lambda: ctrl_extractor.CTRL_MODE}
+
+
+def parse_batch_response(text, mutant_ids):
+    """按分隔行拆分应答，返回 {变异体id: 提取结果}；只保留请求中的、内容非空的变异体"""
+    text = (text or "").split(BATCH_END)[0]
+    matches = list(BATCH_HEADER_PATTERN.finditer(text))
+    results = {}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        content = text[match.end():end].strip()
+        if match.group(1) in mutant_ids and content:
+            results[match.group(1)] = content
+    return results
+
+
+def mutated_statements(graph_store, program_name, kind, mutant, base_graph):
+    """变异行在原程序图与变异体图中的语句：[(原程序行号, 原语句, 变异体行号, 变异语句)]，只含有变化的节点"""
+    difference = mutant.get("difference", "")
+    original_line, mutated_line = parse_original_line(difference), parse_mutated_line(difference)
+    if original_line is None or mutated_line is None:
+        return []
+    mutant_graph = graph_store.get_program_graph(program_name, mutant["mutant_id"], kind)
+    before = [node_code(base_graph.nodes[node_id]) for node_id in base_graph.nodes_at_line(original_line)]
+    after = [node_code(mutant_graph.nodes[node_id]) for node_id in mutant_graph.nodes_at_line(mutated_line)]
+    return [(original_line, old, mutated_line, new) for old, new in zip(before, after) if old != new]
+
+
+def substitute_statements(text, replacements):
+    """把共用原程序图提取出的路径中的变异行节点 (行号: 原语句) 替换为 (行号: 变异语句)，与单变异体提取一致"""
+    for original_line, old, mutated_line, new in replacements:
+        pattern = re.compile(r"\(\s*" + str(original_line) + r"\s*:\s*" + re.escape(old) + r"\s*\)")
+        text = pattern.sub(lambda match: f"({mutated_line}: {new})", text)
+    return text
+
+
+def graph_skeleton(graph_info, line):
+    """图的结构指纹：去掉第line行节点的语句文本，保留其余节点、定义/使用变量与全部边"""
+    nodes = [{key: value for key, value in node.items() if node.get("line") != line or key not in ("label", "code")}
+             for node in graph_info.get("nodes", [])]
+    return canonical({"nodes": nodes, "edges": graph_info.get("edges", [])})
+
+
+def label_only_mutant(graph_store, program_name, mutant, kind):
+    """变异体图与原程序图是否只在变异行节点的语句文本上不同：只有这样的变异体能共用原程序图批量提取，
+    删除语句、新增定义（如 b--）等改变了依赖边或定义/使用变量的变异体交给单变异体流程"""
+    difference = mutant.get("difference", "")
+    line = parse_original_line(difference)
+    if line is None or parse_mutated_line(difference) != line:
+        return False
+    try:
+        base = graph_store.get_base(program_name, kind)[0]
+        graph = graph_store.get_graph(program_name, mutant["mutant_id"], kind)
+    except OSError:
+        return False
+    return graph_skeleton(graph, line) == graph_skeleton(base, line)
+
+
+def needs_llm(graph_store, program_name, mutant, kind, mode):
+    """该变异体的依赖路径是否需要LLM提取（本地切片器/图遍历无法处理，或配置为llm模式）"""
+    try:
+        graph_store.get_base(program_name, kind)
+        if mode == "llm":
+            return True
+        graph = graph_store.get_program_graph(program_name, mutant["mutant_id"], kind)
+        if kind == "PDG-DATA":
+            try:
+                ctrl_graph = graph_store.get_program_graph(program_name, mutant["mutant_id"], "PDG-CTRL")
+            except OSError:
+                ctrl_graph = None
+            return slice_data_paths(graph, mutant.get("difference", ""), ctrl_graph) is None
+        return extract_ctrl_paths(graph, mutant.get("difference", "")) is None
+    except OSError:
+        return False  # 没有图文件时单变异体提取同样无法进行，交给原流程报错
+
+
+class BatchExtractor:
+    """把同一程序的多个变异体合并到一个提取请求中：共用原程序依赖图（裁剪到各变异行相关子图的并集），
+    按分隔行逐个输出，每个变异体结果中的变异行再替换为其变异语句。只有图结构与原程序图一致（仅变异行语句文本不同）的
+    变异体参与批量提取；应答缺少某些变异体、或提示词超出token预算时对半拆分重试，拆到单个仍失败的变异体
+    不写入结果，之后由原有的单变异体流程提取。
+
+    结果按(程序, 图类型, 变异体id)保存在进程内，emd_analysis在调用单变异体提取前先查询。
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, token_budget=BATCH_TOKEN_BUDGET, max_workers=BATCH_WORKERS,
+                 graph_store=None):
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.max_workers = max_workers
+        self.graph_store = graph_store
+        self.lock = threading.Lock()
+        self.results = {}
+        self.counters = {"requests": 0, "mutants": 0, "extracted": 0, "splits": 0, "unparsed": 0}
+
+    def prefetch(self, program_name, mutants, llm=None, kinds=("PDG-DATA", "PDG-CTRL")):
+        """批量提取需要LLM的变异体的数据/控制依赖路径，返回本次得到结果的变异体数"""
+        llm = llm or get_llm("deepseek-v3")
+        if not isinstance(llm, TracingChatModel):
+            llm = TracingChatModel(llm=llm)
+        graph_store = self.graph_store or get_graph_store()
+        extracted = 0
+        for kind in kinds:
+            pending = [mutant for mutant in mutants if (program_name, kind, mutant["mutant_id"]) not in self.results
+                       and needs_llm(graph_store, program_name, mutant, kind, BATCH_MODES[kind]())
+                       and label_only_mutant(graph_store, program_name, mutant, kind)]
+            # 按变异行排序，相邻行的变异体放在同一批，共用的子图更小
+            pending.sort(key=lambda mutant: parse_original_line(mutant.get("difference", "")) or 0)
+            batches = [pending[index:index + self.batch_size] for index in range(0, len(pending), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for results in executor.map(lambda batch: self._extract(program_name, kind, batch, llm), batches):
+                    extracted += len(results)
+        logging.info(f"批量提取 {program_name}: {extracted} 个依赖路径结果, 统计: "
+                     f"{json.dumps(self.stats(), ensure_ascii=False)}")
+        return extracted
+
+    def render(self, program_name, kind, batch):
+        graph_store = self.graph_store or get_graph_store()
+        lines = [parse_original_line(mutant.get("difference", "")) for mutant in batch]
+        graph = compact_to_lines(graph_store.get_base(program_name, kind)[0], kind,
+                                 [line for line in lines if line is not None])
+        mutant_text = "\n".join(f"{BATCH_HEADER}{mutant['mutant_id']}\n{json.dumps(mutant, indent=2)}"
+                                for mutant in batch)
+        return BATCH_PROMPTS[kind].invoke({"graph_info": json.dumps(graph, ensure_ascii=False, separators=(",", ":")),
+                                           "mutants": mutant_text})
+
+    def _extract(self, program_name, kind, batch, llm):
+        """提取一批变异体，返回 {变异体id: 结果}；失败的部分对半拆分后递归重试"""
+        prompt = self.render(program_name, kind, batch)
+        if len(batch) > 1 and count_message_tokens(prompt.to_messages()) > self.token_budget:
+            return self._split(program_name, kind, batch, llm)
+
+        mutant_ids = [mutant["mutant_id"] for mutant in batch]
+        with tracing.span("batch_extraction", program=program_name):
+            try:
+                response = llm.invoke(prompt)
+                results = self._substitute(program_name, kind, batch,
+                                           parse_batch_response(response.content, mutant_ids))
+            except Exception as e:
+                logging.warning(f"批量提取 {program_name} {kind} {mutant_ids} 失败: {e}")
+                results = {}
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["mutants"] += len(batch)
+            self.counters["extracted"] += len(results)
+            for mutant_id, result in results.items():
+                self.results[(program_name, kind, mutant_id)] = result
+
+        missing = [mutant for mutant in batch if mutant["mutant_id"] not in results]
+        if not missing:
+            return results
+        if len(missing) == 1 and len(batch) == 1:
+            with self.lock:
+                self.counters["unparsed"] += 1
+            return results
+        return dict(results, **self._split(program_name, kind, missing, llm))
+
+    def _substitute(self, program_name, kind, batch, results):
+        """批量提示词中的图是原程序图，路径中的变异行是原语句；逐个变异体替换为其变异语句，
+        无法读取变异体图的变异体不保留结果，交给单变异体流程"""
+        graph_store = self.graph_store or get_graph_store()
+        base_graph = ProgramGraph(graph_store.get_base(program_name, kind)[0])
+        substituted = {}
+        for mutant in batch:
+            if mutant["mutant_id"] not in results:
+                continue
+            try:
+                replacements = mutated_statements(graph_store, program_name, kind, mutant, base_graph)
+            except OSError:
+                continue
+            substituted[mutant["mutant_id"]] = substitute_statements(results[mutant["mutant_id"]], replacements)
+        return substituted
+
+    def _split(self, program_name, kind, batch, llm):
+        if len(batch) == 1:
+            return self._extract(program_name, kind, batch, llm)
+        with self.lock:
+            self.counters["splits"] += 1
+        middle = len(batch) // 2
+        results = self._extract(program_name, kind, batch[:middle], llm)
+        results.update(self._extract(program_name, kind, batch[middle:], llm))
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            for name in self.counters:
+                self.counters[name] = 0
+
+    def get(self, program_name, kind, mutant_id):
+        with self.lock:
+            return self.results.get((program_name, kind, mutant_id))
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["mutants_per_request"] = round(stats["mutants"] / stats["requests"], 2) if stats["requests"] else 0.0
+        return stats
+
+
+_default_extractor = None
+_default_extractor_lock = threading.Lock()
+
+
+def get_batch_extractor():
+    """进程内共享的批量提取器"""
+    global _default_extractor
+    with _default_extractor_lock:
+        if _default_extractor is None:
+            _default_extractor = BatchExtractor()
+        return _default_extractor
+
+
+def with_prefetched(kind, extractor):
+    """包装单变异体提取函数：批量提取已有结果时直接返回，否则调用原提取函数"""
+    def extract(program_name, mutant, llm=None):
+        result = get_batch_extractor().get(program_name, kind, mutant["mutant_id"])
+        return result if result is not None else extractor(program_name, mutant, llm)
+    return extract
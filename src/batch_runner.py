@@ -0,0 +1,165 @@
+# coding=utf-8
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from delegating_chat_model import DelegatingChatModel
+from token_counter import count_message_tokens, count_tokens
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按秒匀速补充；允许先透支（用于事后补记的输出token）"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """阻塞直到桶内令牌足够，超过容量的请求在桶满时放行"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def charge(self, amount):
+        """直接扣除令牌（可透支），不阻塞"""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """同时限制每分钟请求数(RPM)与每分钟token数(TPM)，未配置的维度不限制"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, prompt_tokens=0):
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket and prompt_tokens:
+            self.token_bucket.acquire(prompt_tokens)
+
+    def record_completion(self, completion_tokens):
+        """输出token在响应返回后才能得知，事后计入TPM配额"""
+        if self.token_bucket and completion_tokens:
+            self.token_bucket.charge(completion_tokens)
+
+
+class RateLimitedChatModel(DelegatingChatModel):
+    """为任意聊天模型加上RPM/TPM限流，每次LLM请求（含三条提取链与判定链）都经过限流器，缓存命中不占配额"""
+
+    limiter: RateLimiter
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.limiter.acquire(count_message_tokens(messages))
+        result = self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self.limiter.record_completion(sum(count_tokens(generation.text) for generation in result.generations))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.limiter.acquire(count_message_tokens(messages))
+        completion_tokens = 0
+        try:
+            for chunk in self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                completion_tokens += count_tokens(chunk.text)
+                yield chunk
+        finally:  # 流被提前关闭时只计入已收到的输出token
+            self.limiter.record_completion(completion_tokens)
+
+
+class OrderedResultLogger:
+    """按变异体原始顺序写日志：先完成的结果暂存，待其之前的变异体全部写出后再依次输出"""
+
+    def __init__(self, mutant_ids, logger=None):
+        self.mutant_ids = list(mutant_ids)
+        self.logger = logger or logging.getLogger()  # 多模型判定时每个模型写各自的日志
+        self.pending = {}
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def submit(self, index, record):
+        """登记第index个变异体的结果，返回本次写出的变异体数量"""
+        with self.lock:
+            self.pending[index] = record
+            flushed = 0
+            while self.next_index in self.pending:
+                self._write(self.mutant_ids[self.next_index], self.pending.pop(self.next_index))
+                self.next_index += 1
+                flushed += 1
+            return flushed
+
+    def _write(self, mutant_id, record):
+        # 与串行版本保持相同的日志格式
+        self.logger.info(f"开始分析变异体 {mutant_id}...")
+        if record["error"] is None:
+            self.logger.info(json.dumps({mutant_id: record["result"]}, ensure_ascii=False))
+            self.logger.info(f"完成变异体 {mutant_id} 的分析, 耗时: {record['time_cost']:.4f} 秒\n")
+        else:
+            self.logger.error(f"变异体 {mutant_id} 分析失败！耗时: {record['time_cost']:.4f} 秒，错误: {record['error']}")
+
+
+def run_mutants(program_path, mutants, analyze_fn, max_workers=4, max_in_flight=None, journal=None, model=None,
+                provenance=None, fingerprints=None):
+    """并发分析一个程序的全部变异体，按原始顺序写日志，返回 {mutant_id: 分析结果}
+
+    max_workers为同时执行的变异体数；max_in_flight限制已提交但尚未写出日志的变异体数，
+    避免个别慢变异体阻塞时结果无限堆积。analyze_fn(program_path, mutant)返回分析文本。
+    传入journal(ResultJournal)时每个变异体完成后立即写入结果日志，不等待按序输出；
+    provenance(program_path, mutant)返回该结果的来源信息（如去重时的代表变异体），一并写入结果日志；
+    fingerprints(program_path, mutant)返回影响该结果的输入指纹，同样写入结果日志。
+    """
+    max_in_flight = max_in_flight or max_workers * 4
+    in_flight = threading.Semaphore(max(max_in_flight, max_workers))
+    ordered_logger = OrderedResultLogger(mutant["mutant_id"] for mutant in mutants)
+    results = {}
+    failed = []
+
+    def analyze(index, mutant):
+        start_time = time.time()
+        try:
+            result = analyze_fn(program_path, mutant)
+            record = {"result": result, "error": None}
+            results[mutant["mutant_id"]] = result
+        except Exception as e:
+            record = {"result": None, "error": str(e)}
+            failed.append(mutant["mutant_id"])
+        record["time_cost"] = round(time.time() - start_time, 4)
+        # 写结果日志失败不能影响按序输出：未登记的变异体会使之后的日志一直缓存、在途名额无法释放
+        if journal is not None:
+            try:
+                journal.append(program_path, mutant["mutant_id"], record["result"], record["error"],
+                               record["time_cost"], model, provenance(program_path, mutant) if provenance else None,
+                               fingerprints(program_path, mutant) if fingerprints else None)
+            except Exception as e:
+                logging.error(f"变异体 {mutant['mutant_id']} 的结果写入结果日志失败: {e}")
+        flushed = ordered_logger.submit(index, record)
+        for _ in range(flushed):
+            in_flight.release()
+
+    batch_start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, mutant in enumerate(mutants):
+            in_flight.acquire()
+            executor.submit(analyze, index, mutant)
+
+    elapsed = time.time() - batch_start
+    throughput = len(mutants) / elapsed * 60 if elapsed > 0 else 0.0
+    logging.info(f"共分析 {len(mutants)} 个变异体, 失败 {len(failed)} 个, 总耗时: {elapsed:.4f} 秒, "
+                 f"吞吐量: {throughput:.2f} 变异体/分钟, 并发数: {max_workers}")
+    return results
@@ -0,0 +1,292 @@
+# coding=utf-8
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from functools import partial
+from langchain_core.globals import set_llm_cache
+from batch_runner import run_mutants
+from emd_analysis import analyze_mutant
+from batch_extractor import get_batch_extractor
+from fake_llm import FakeChatModel, FakeOpenAIServer
+from graph_store import MUTANT_PROGRAMS_DIR, GraphStore, set_graph_store
+from llm_router import Endpoint, RouterChatModel
+from model_cascade import reset_tier_records, tier_report
+from reachability_memo import get_reachability_memo
+from resilient_llm import ResilientChatModel
+from tracing import enable_tracing
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROGRAM_DIR = "/Users/swan/bishe/progex_benchmark/mutantbench/mutantjava/mutantjavadiv"
+DATA_DIR = REPO_DIR
+BENCHMARK_DIR = os.path.join(REPO_DIR, "benchmark")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# 随仓库提供源文件、变异体与PROGEX图的集合，不依赖本机的mutantbench与图目录：(程序源文件, 变异体JSON, 图目录)
+BUNDLED_SETS = [
+    (os.path.join(BENCHMARK_DIR, "programs", "Mid.java"), os.path.join(BENCHMARK_DIR, "mutants", "Mid_mutants.json"),
+     os.path.join(BENCHMARK_DIR, "mutant_programs")),
+]
+# 随仓库提供的变异体集合：(程序源文件名, 变异体JSON相对DATA_DIR的路径)，源文件在PROGRAM_DIR、图在MUTANT_PROGRAMS_DIR
+BENCHMARK_SETS = [
+    ("Triangle.java", "Triangle/fail_mutants.json"),
+    ("DefrosterMain.java", "Defroster/fail_mutants/Defroster_fail_mutants.json"),
+    ("Profit.java", "profit/Profit_fail_mutants.json"),
+]
+# fail_mutants/下的变异体集合按文件名对应程序，源文件名与程序名不一致的在此登记
+FAIL_MUTANTS_PATTERN = "fail_mutants/*_mutants.json"
+PROGRAM_FILES = {"Defroster": "DefrosterMain.java"}
+
+# 默认延迟模型（秒）：提取阶段与判定阶段的中位延迟、对数正态长尾、输出速率，不注入错误
+DEFAULT_PROFILE = {
+    "latency": 0.3,
+    "stage_latency": {"judge": 1.0},
+    "sigma": 0.5,
+    "tokens_per_second": 60.0,
+    "error_rate": 0.0,
+}
+# 分级判定时便宜模型的延迟相对强模型的比例
+CHEAP_LATENCY_RATIO = 0.3
+# 相对基线变差超过该比例视为性能回退；耗时指标的绝对变化不超过REGRESSION_MIN_SECONDS时视为噪声
+REGRESSION_THRESHOLD = 0.10
+REGRESSION_MIN_SECONDS = 0.01
+
+
+def program_name_of(program_path):
+    return os.path.splitext(os.path.basename(program_path))[0]
+
+
+def set_available(program_path, mutants_json_path, graph_dir):
+    """集合所需的源文件、变异体文件与原程序图是否齐全，缺少时记录原因"""
+    missing = [path for path in (program_path, mutants_json_path) if not os.path.exists(path)]
+    if not os.path.isdir(os.path.join(graph_dir, program_name_of(program_path))):
+        missing.append(os.path.join(graph_dir, program_name_of(program_path)))
+    if missing:
+        logging.warning(f"跳过基准集合 {mutants_json_path}：缺少 {', '.join(missing)}")
+    return not missing
+
+
+def benchmark_sets(data_dir=DATA_DIR, program_dir=PROGRAM_DIR, graph_dir=MUTANT_PROGRAMS_DIR):
+    """返回[(程序路径, 变异体JSON路径, 图目录)]：随仓库提供的集合在前，其余集合跳过本机缺少源文件或图的程序"""
+    sets = list(BUNDLED_SETS)
+    sets += [(os.path.join(program_dir, program), os.path.join(data_dir, mutants), graph_dir)
+             for program, mutants in BENCHMARK_SETS]
+    for mutants_json_path in sorted(glob.glob(os.path.join(data_dir, FAIL_MUTANTS_PATTERN))):
+        name = os.path.basename(mutants_json_path)[:-len("_mutants.json")]
+        sets.append((os.path.join(program_dir, PROGRAM_FILES.get(name, f"{name}.java")), mutants_json_path, graph_dir))
+    return [item for item in sets if set_available(*item)]
+
+
+def peak_rss_mb():
+    """进程的峰值常驻内存（MB），Linux下ru_maxrss单位为KB"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def scaled_profile(profile, factor):
+    """所有延迟乘以factor后的延迟模型"""
+    return dict(profile, latency=profile.get("latency", 0.0) * factor,
+                stage_latency={stage: latency * factor for stage, latency in profile.get("stage_latency", {}).items()})
+
+
+def build_llm(profile, http=False, endpoints=None):
+    """返回(伪模型, 需要在结束时关闭的本地服务列表)；http为True时经本地伪OpenAI服务调用，计入HTTP客户端开销
+
+    endpoints为各端点的延迟倍数（如[1.0, 3.0]）时，返回在这些伪端点间路由的RouterChatModel。
+    """
+    if endpoints:
+        built = [build_llm(scaled_profile(profile, factor), http) for factor in endpoints]
+        return RouterChatModel([Endpoint(f"endpoint-{index}x{factor}", llm)
+                                for index, (factor, (llm, _)) in enumerate(zip(endpoints, built))]), \
+            [server for _, servers in built for server in servers]
+    if not http:
+        return FakeChatModel(**profile), []
+    from langchain_openai import ChatOpenAI
+    server = FakeOpenAIServer(latency=profile.get("latency", 0.0), error_rate=profile.get("error_rate", 0.0)).start()
+    return ChatOpenAI(base_url=server.url, api_key="fake", model="fake", max_retries=0), [server]
+
+
+def run_benchmark(sets=None, profile=None, max_workers=4, http=False, resilient=True, limit=None, seed=0,
+                  batch_extraction=False, tiered=False, endpoints=None, **analyze_options):
+    """用伪模型跑完整的analyze_mutant/run_mutants流程，返回吞吐量、各阶段耗时与本地开销、峰值内存
+
+    LLM缓存在基准期间关闭、可达性记忆清空，保证每次运行的工作量一致；analyze_options透传给analyze_mutant
+    （如cascade、concurrent、stream）。batch_extraction为True时每个集合先批量提取依赖路径；
+    tiered为True时判定先交给延迟为CHEAP_LATENCY_RATIO倍的伪便宜模型，报告中附带各级统计；
+    endpoints为各端点的延迟倍数时经路由模型分发到多个伪端点，报告中附带路由统计。
+    """
+    sets = benchmark_sets() if sets is None else sets
+    profile = dict(DEFAULT_PROFILE if profile is None else profile)
+    random.seed(seed)
+    set_llm_cache(None)
+    get_reachability_memo().clear()  # 可达性记忆与批量提取结果都不沿用上一次运行的
+    tracer = enable_tracing(None)
+    get_batch_extractor().clear()
+    reset_tier_records()
+
+    fake_llm, servers = build_llm(profile, http, endpoints)
+    llm = ResilientChatModel(llm=fake_llm) if resilient else fake_llm
+    cheap_llm = None
+    if tiered:
+        cheap_llm = FakeChatModel(**scaled_profile(profile, CHEAP_LATENCY_RATIO))
+        cheap_llm = ResilientChatModel(llm=cheap_llm) if resilient else cheap_llm
+    analyze_fn = partial(analyze_mutant, llm=llm, cheap_llm=cheap_llm, **analyze_options)
+
+    programs, total_mutants, total_failed = {}, 0, 0
+    original_store, replaced = None, False
+    delta_dir = tempfile.TemporaryDirectory()  # 差量缓存不沿用上一次运行的，也不写入真实缓存目录
+    start_time = time.perf_counter()
+    try:
+        for program_path, mutants_json_path, graph_dir in sets:
+            with open(mutants_json_path, "r", encoding="utf-8") as f:
+                mutants = json.load(f)[:limit]
+            previous_store = set_graph_store(GraphStore(graph_dir, delta_dir.name))
+            if not replaced:
+                original_store, replaced = previous_store, True
+            program_name = program_name_of(program_path)
+            program_start = time.perf_counter()
+            if batch_extraction:
+                get_batch_extractor().prefetch(program_name, mutants, llm)
+            results = run_mutants(program_path, mutants, analyze_fn, max_workers=max_workers)
+            elapsed = time.perf_counter() - program_start
+            # 同一程序可能有多个变异体集合，按集合文件区分
+            programs[os.path.relpath(mutants_json_path, REPO_DIR)] = {
+                "mutants": len(mutants),
+                "failed": len(mutants) - len(results),
+                # 失败的变异体不计入吞吐量，否则流程出错反而显得更快
+                "mutants_per_minute": round(len(results) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            }
+            total_mutants += len(mutants)
+            total_failed += len(mutants) - len(results)
+    finally:
+        for server in servers:
+            server.stop()
+        if replaced:
+            set_graph_store(original_store)
+        delta_dir.cleanup()
+    elapsed = time.perf_counter() - start_time
+
+    stages = tracer.summary().get("*", {})
+    report = {
+        "config": {"profile": profile, "max_workers": max_workers, "http": http, "resilient": resilient,
+                   "limit": limit, "batch_extraction": batch_extraction, "tiered": tiered,
+                   "endpoints": endpoints, **analyze_options},
+        "mutants": total_mutants,
+        "failed": total_failed,
+        "elapsed_seconds": round(elapsed, 4),
+        "mutants_per_minute": round((total_mutants - total_failed) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "llm_calls": sum(stages.get(stage, {}).get("llm_calls", 0) for stage in ("mutant", "batch_extraction")),
+        "stages": {stage: {key: entry[key] for key in ("count", "p50", "p95", "mean", "llm_seconds", "overhead_seconds")}
+                   for stage, entry in stages.items()},
+        "programs": programs,
+    }
+    if tiered:
+        report["tiers"] = tier_report()
+    if endpoints:
+        report["router"] = fake_llm.stats()
+    return report
+
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """与基线比较，返回[(指标, 基线值, 当前值, 相对变化, 是否回退)]；吞吐量越高越好，其余越低越好"""
+    metrics = [("mutants_per_minute", True), ("peak_rss_mb", False)]
+    rows = [(name, baseline.get(name), report.get(name), higher_is_better, 0) for name, higher_is_better in metrics]
+    for stage, entry in report["stages"].items():
+        baseline_entry = baseline.get("stages", {}).get(stage, {})
+        for key in ("p50", "p95", "overhead_seconds"):
+            rows.append((f"{stage}.{key}", baseline_entry.get(key), entry[key], False, REGRESSION_MIN_SECONDS))
+
+    comparison = []
+    for name, old, new, higher_is_better, min_change in rows:
+        if not old or new is None:
+            comparison.append((name, old, new, None, False))
+            continue
+        delta = (new - old) / old
+        regression = (-delta > threshold if higher_is_better else delta > threshold) and abs(new - old) > min_change
+        comparison.append((name, old, new, round(delta, 4), regression))
+    return comparison
+
+
+def format_report(report, comparison=None):
+    lines = [f"变异体: {report['mutants']}, 失败: {report['failed']}, 耗时: {report['elapsed_seconds']} 秒, "
+             f"吞吐量: {report['mutants_per_minute']} 变异体/分钟, 峰值内存: {report['peak_rss_mb']} MB, "
+             f"LLM调用: {report['llm_calls']}",
+             f"{'阶段':<14}{'次数':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'等待LLM(秒)':>13}{'本地开销(秒)':>13}"]
+    for stage, entry in report["stages"].items():
+        lines.append(f"{stage:<14}{entry['count']:>6}{entry['p50']:>10}{entry['p95']:>10}"
+                     f"{entry['llm_seconds']:>13}{entry['overhead_seconds']:>13}")
+    if "tiers" in report:
+        tiers = report["tiers"]
+        lines.append(f"分级判定: 升级比例 {tiers['escalation_rate']:.1%}, " + ", ".join(
+            f"{tier} p50 {tiers[tier]['p50']} 秒 p95 {tiers[tier]['p95']} 秒 成本 ${tiers[tier]['cost']}"
+            for tier in ("cheap", "strong")))
+    if "router" in report:
+        lines.append("路由: " + ", ".join(f"{name} {entry['requests']} 次请求 {entry['errors']} 次失败"
+                                          for name, entry in report["router"]["endpoints"].items()) +
+                     f", 切换端点 {report['router']['failovers']} 次")
+    for name, old, new, delta, regression in comparison or []:
+        if delta is not None:
+            lines.append(f"{name}: 基线 {old} -> 当前 {new} ({delta:+.1%}){' 回退' if regression else ''}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线基准：用伪模型跑完整分析流程，不调用真实API")
+    parser.add_argument("--set", action="append", metavar="PROGRAM.java:MUTANTS.json",
+                        help="指定基准集合（可重复），默认使用随仓库提供的变异体集合")
+    parser.add_argument("--graph-dir", default=MUTANT_PROGRAMS_DIR, help="--set指定的集合的PROGEX图目录")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, help="每个集合最多分析的变异体数")
+    parser.add_argument("--scale", type=float, default=1.0, help="所有延迟乘以该系数")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_PROFILE["error_rate"])
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_PROFILE["tokens_per_second"])
+    parser.add_argument("--http", action="store_true", help="经本地伪OpenAI服务调用")
+    parser.add_argument("--no-resilience", action="store_true")
+    parser.add_argument("--cascade", action="store_true")
+    parser.add_argument("--concurrent", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--batch-extraction", action="store_true")
+    parser.add_argument("--tiered", action="store_true")
+    parser.add_argument("--endpoints", help="各伪端点的延迟倍数，逗号分隔（如1,3），经路由模型分发")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--output", help="结果JSON的输出路径")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    profile = dict(DEFAULT_PROFILE, error_rate=args.error_rate, tokens_per_second=args.tokens_per_second)
+    profile["latency"] *= args.scale
+    profile["stage_latency"] = {stage: latency * args.scale for stage, latency in profile["stage_latency"].items()}
+    sets = [(*item.rsplit(":", 1), args.graph_dir) for item in args.set] if args.set else benchmark_sets()
+    sets = [item for item in sets if set_available(*item)]
+    if not sets:
+        logging.error("没有可运行的基准集合")
+        sys.exit(2)
+    report = run_benchmark(sets, profile, max_workers=args.workers, http=args.http, resilient=not args.no_resilience,
+                           limit=args.limit, batch_extraction=args.batch_extraction, tiered=args.tiered,
+                           endpoints=[float(factor) for factor in args.endpoints.split(",")] if args.endpoints else None,
+                           cascade=args.cascade, concurrent=args.concurrent, stream=args.stream)
+
+    comparison = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            comparison = compare(report, json.load(f))
+    print(format_report(report, comparison))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["failed"] == report["mutants"]:
+        logging.error("全部变异体分析失败")
+        sys.exit(2)
+    if comparison and any(regression for *_, regression in comparison):
+        sys.exit(1)
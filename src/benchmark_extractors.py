@@ -0,0 +1,125 @@
+# coding=utf-8
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+from data_extractor import get_data_info
+from ctrl_extractor import get_ctrl_info
+import graph_compaction
+from graph_compaction import compaction_report
+from graph_store import GRAPH_KINDS, GraphStore, get_graph_store, set_graph_store
+
+# 随仓库提供的基准程序：(图目录中的程序名, 变异体JSON)
+BENCHMARK_PROGRAMS = [
+    ("Triangle", "/Users/swan/bishe/LLM4EMD/Triangle/fail_mutants.json"),
+    ("BisectSqrt", "/Users/swan/bishe/LLM4EMD/Bisect/fail_mutants/BisectSqrt_fail_mutants.json"),
+    ("ArrayUtilsLastShort", "/Users/swan/bishe/LLM4EMD/ArrayUtils/fail_mutants/ArrayUtilsLastShort_fail_mutants.json"),
+    ("StringTokenizerSkip",
+     "/Users/swan/bishe/LLM4EMD/StringTokenizer/StringTokenizer_fail_mutants/StringTokenizerSkip_fail_mutants.json"),
+]
+
+# 随仓库提供图文件的离线程序（见benchmark.py），只测本地图算法的耗时，不调用LLM
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark")
+OFFLINE_PROGRAMS = [("Mid", os.path.join(BENCHMARK_DIR, "mutants", "Mid_mutants.json"))]
+OFFLINE_GRAPH_DIR = os.path.join(BENCHMARK_DIR, "mutant_programs")
+
+# 待比较的提取器：名称 -> 提取函数(program_name, mutant, mode)
+EXTRACTORS = {
+    "data": get_data_info,
+    "ctrl": get_ctrl_info,
+}
+
+PATH_LINE_PATTERN = re.compile(r"^\s*\d+\.\s*(.*)$")
+NODE_LINE_PATTERN = re.compile(r"\((?:line\s+)?(\d+)(?::|\))")
+
+
+def path_signatures(text):
+    """把编号路径文本解析为行号序列集合，用于比较两种提取结果是否一致"""
+    signatures = set()
+    for line in (text or "").split("\n"):
+        match = PATH_LINE_PATTERN.match(line)
+        if match:
+            lines = tuple(int(number) for number in NODE_LINE_PATTERN.findall(match.group(1)))
+            if lines:
+                signatures.add(lines)
+    return signatures
+
+
+def agreement(native_text, llm_text):
+    """返回(路径Jaccard相似度, 到达的输出语句行号是否一致)"""
+    native, llm = path_signatures(native_text), path_signatures(llm_text)
+    if not native and not llm:
+        return 1.0, True
+    jaccard = len(native & llm) / len(native | llm)
+    same_outputs = {path[-1] for path in native} == {path[-1] for path in llm}
+    return jaccard, same_outputs
+
+
+def timed(extractor, program_name, mutant, mode):
+    start_time = time.perf_counter()
+    result = extractor(program_name, mutant, mode=mode)
+    return result, time.perf_counter() - start_time
+
+
+def benchmark(programs=BENCHMARK_PROGRAMS, extractors=EXTRACTORS, with_llm=True):
+    """对每个提取器比较本地图算法与LLM的耗时和输出一致性，返回按(提取器, 程序)汇总的结果"""
+    report = {}
+    for name, extractor in extractors.items():
+        for program_name, mutants_json_path in programs:
+            with open(mutants_json_path, "r", encoding="utf-8") as f:
+                mutants = json.load(f)
+            native_times, llm_times, jaccards, output_matches, failures = [], [], [], [], 0
+            for mutant in mutants:
+                try:
+                    native_text, native_time = timed(extractor, program_name, mutant, "graph")
+                except (ValueError, OSError):
+                    failures += 1
+                    continue
+                native_times.append(native_time)
+                if with_llm:
+                    llm_text, llm_time = timed(extractor, program_name, mutant, "llm")
+                    llm_times.append(llm_time)
+                    jaccard, same_outputs = agreement(native_text, llm_text)
+                    jaccards.append(jaccard)
+                    output_matches.append(same_outputs)
+            report[(name, program_name)] = {
+                "mutants": len(mutants),
+                "native_failures": failures,
+                "native_ms_mean": statistics.mean(native_times) * 1000 if native_times else None,
+                "llm_ms_mean": statistics.mean(llm_times) * 1000 if llm_times else None,
+                "path_jaccard_mean": statistics.mean(jaccards) if jaccards else None,
+                "output_agreement": sum(output_matches) / len(output_matches) if output_matches else None,
+            }
+    return report
+
+
+def benchmark_compaction(programs=BENCHMARK_PROGRAMS, method="slice"):
+    """统计各类图在按method压缩提示词前后的token数（不调用LLM）"""
+    graph_store = get_graph_store()
+    previous, graph_compaction.PROMPT_COMPACTION = graph_compaction.PROMPT_COMPACTION, method
+    try:
+        for program_name, mutants_json_path in programs:
+            with open(mutants_json_path, "r", encoding="utf-8") as f:
+                mutants = json.load(f)
+            for mutant in mutants:
+                for kind in GRAPH_KINDS:
+                    graph_store.prompt_fragment(program_name, mutant["mutant_id"], kind, mutant.get("difference", ""))
+    finally:
+        graph_compaction.PROMPT_COMPACTION = previous
+    return compaction_report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较本地图算法与LLM提取的耗时和输出一致性")
+    parser.add_argument("--offline", action="store_true", help="只在随仓库提供的图上测本地图算法的耗时，不调用LLM")
+    args = parser.parse_args()
+    programs = BENCHMARK_PROGRAMS
+    if args.offline:
+        programs = OFFLINE_PROGRAMS
+        set_graph_store(GraphStore(OFFLINE_GRAPH_DIR, tempfile.mkdtemp()))
+    print("提示词压缩: " + json.dumps(benchmark_compaction(programs), ensure_ascii=False))
+    for (name, program_name), row in benchmark(programs, with_llm=not args.offline).items():
+        print(f"[{name}] {program_name}: " + json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,37 @@
+# coding=utf-8
+import timeit
+import yaml
+from langchain_openai import ChatOpenAI
+from llm_client import DEFAULT_CONFIG_PATH, get_llm, reload_config
+
+# 每个变异体需要的LLM客户端数：可达性、数据依赖、控制依赖与判定各一个
+CLIENTS_PER_MUTANT = 4
+
+
+def legacy_setup(config_path=DEFAULT_CONFIG_PATH):
+    """旧实现：每个阶段各自解析一次YAML并新建一个ChatOpenAI（各自独立的连接池）"""
+    for _ in range(CLIENTS_PER_MUTANT):
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)["deepseek-v3"]
+        ChatOpenAI(api_key=config["api_key"], base_url=config["base_url"], model=config["model"], temperature=0)
+
+
+def pooled_setup():
+    """新实现：配置与客户端在进程内只创建一次，之后各阶段直接复用"""
+    for _ in range(CLIENTS_PER_MUTANT):
+        get_llm("deepseek-v3")
+
+
+def benchmark(number=200):
+    """返回每个变异体的客户端准备开销（毫秒）：(旧实现, 新实现)"""
+    reload_config()
+    pooled_setup()  # 预热：首次调用时加载配置并创建客户端
+    legacy_ms = timeit.timeit(legacy_setup, number=number) / number * 1000
+    pooled_ms = timeit.timeit(pooled_setup, number=number) / number * 1000
+    return legacy_ms, pooled_ms
+
+
+if __name__ == "__main__":
+    legacy_ms, pooled_ms = benchmark()
+    print(f"每个变异体的客户端准备开销: 旧实现 {legacy_ms:.3f} 毫秒, 共享客户端 {pooled_ms:.4f} 毫秒, "
+          f"加速 {legacy_ms / pooled_ms:.0f} 倍")
@@ -1,12 +1,23 @@
+import argparse
 import json
 import time
 import os
 import logging
 from emd_analysis import analyze_mutant
+from llm_client import get_llm
+from llm_router import find_router
+from llm_cache import DEFAULT_CACHE_PATH, enable_llm_cache
+from model_cascade import CHEAP_MODEL, SAMPLE_TEMPERATURE, tier_report
+from result_compare import load_verdicts
+from result_journal import ResultJournal, journal_path
+from reachability_memo import get_reachability_memo
+from smt_checker import solver_report
+from resilient_llm import DEFAULT_TIMEOUT, ResilientChatModel
+from tracing import enable_tracing, metrics_path, trace_path
 
 
 # 配置日志
-def setup_logging(program_path):
+def setup_logging(program_path, resume=False):
     # 创建输出目录（如果不存在）
     output_dir = r"/Users/swan/bishe/LLM4EMD/Defroster/fail_output"
     os.makedirs(output_dir, exist_ok=True)
@@ -18,8 +29,8 @@ def setup_logging(program_path):
     # 清除所有现有的handlers
     logging.getLogger().handlers = []
 
-    # 创建文件处理器，设置UTF-8编码
-    file_handler = logging.FileHandler(log_filename, mode='w', encoding='utf-8')
+    # 创建文件处理器，设置UTF-8编码（续跑时追加，保留之前的日志）
+    file_handler = logging.FileHandler(log_filename, mode='a' if resume else 'w', encoding='utf-8')
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(logging.Formatter('%(message)s'))
 
@@ -33,42 +44,115 @@ def setup_logging(program_path):
         handlers=[file_handler, console_handler],
         format='%(message)s'
     )
+    return log_filename
 
 # 主函数
-def main():
+def main(cache_path=DEFAULT_CACHE_PATH, cache_read_only=False, resume=False, cascade=False, solver=False,
+         stream=False, compact=False, resilient=True, llm_timeout=DEFAULT_TIMEOUT, hedge=True, tiered=False,
+         tier_baseline=None):
+    """resume为True时跳过结果日志中已成功完成的变异体，只重跑失败和未完成的变异体；
+    cascade为True时先提取可达性，路径不可达的变异体不再提取数据/控制依赖，也不调用分析链；
+    solver为True时在调用LLM分析前先用SMT求解器判定不可达性与非必要性（需安装z3）；
+    stream为True时流式读取判定链输出并在给出结论后立即结束，compact为True时精简判定输出并限制输出token数；
+    resilient为True时所有LLM请求带llm_timeout秒超时、429/5xx退避重试与熔断，hedge为True时对慢请求发出对冲请求；
+    tiered为True时先由便宜模型多次采样判定，结论不一致时才交给deepseek-v3，结束时输出各级耗时、成本与准确率，
+    tier_baseline为只用deepseek-v3得到的结果文件（每行 MUT_001: YES）时同时给出准确率变化"""
     program_path = "/Users/swan/bishe/progex_benchmark/mutantbench/mutantjava/mutantjavadiv/DefrosterMain.java"
     mutants_json_path = "/Users/swan/bishe/LLM4EMD/Defroster/fail_mutants/Defroster_fail_mutants.json"
 
-    setup_logging(program_path)
+    log_filename = setup_logging(program_path, resume)
+
+    # 每个变异体的结果写入只追加的结果日志（逐条fsync），中断后可续跑
+    journal_file = journal_path(log_filename)
+    if not resume and os.path.exists(journal_file):
+        os.remove(journal_file)
+    journal = ResultJournal(journal_file)
+    # 各阶段span（耗时、token数、重试次数）追加到trace日志，结束时输出分位数报表与Prometheus指标
+    trace_file = trace_path(log_filename)
+    if not resume and os.path.exists(trace_file):
+        os.remove(trace_file)
+    tracer = enable_tracing(trace_file)
+    completed = journal.completed() if resume else {}
+
+    # 启用LLM响应缓存（cache_path为None时关闭）
+    cache = enable_llm_cache(cache_path, read_only=cache_read_only) if cache_path else None
+
+    # 单个慢请求不再卡住整个串行循环：超时后重试，瞬时错误退避重试
+    llm = get_llm("deepseek-v3")
+    if resilient:
+        llm = ResilientChatModel(llm=llm, timeout=llm_timeout, hedge=hedge)
+    # 分级判定的便宜模型以非0温度采样，不走LLM缓存
+    cheap_llm = None
+    if tiered:
+        cheap_llm = get_llm(CHEAP_MODEL, temperature=SAMPLE_TEMPERATURE)
+        if resilient:
+            cheap_llm = ResilientChatModel(llm=cheap_llm, timeout=llm_timeout, hedge=hedge)
 
     # 读取变异体JSON文件
     with open(mutants_json_path, 'r', encoding='utf-8') as f:
         mutants = json.load(f)
 
     # results = {}
+    if completed:
+        logging.info(f"续跑: 跳过已完成的 {len(completed)} 个变异体")
 
     # 遍历每个变异体
     for mutant in mutants:
         mutant_id = mutant["mutant_id"]
+        if mutant_id in completed:
+            continue
         logging.info(f"开始分析变异体 {mutant_id}...")
         # 记录开始时间
         start_time = time.time()
 
         try:
             # 调用分析程序
-            analysis_result = analyze_mutant(program_path, mutant)
+            analysis_result = analyze_mutant(program_path, mutant, llm=llm, cascade=cascade, solver=solver,
+                                             stream=stream, compact=compact, cheap_llm=cheap_llm)
             # 计算耗时（保留4位小数）
             time_cost = round(time.time() - start_time, 4)  # 关键行：计算耗时
             # 立即写入日志
+            journal.append(program_path, mutant_id, analysis_result, time_cost=time_cost, model="deepseek-v3")
             logging.info(json.dumps({mutant_id: analysis_result}, ensure_ascii=False))
             logging.info(f"完成变异体 {mutant_id} 的分析, 耗时: {time_cost:.4f} 秒\n")
 
         except Exception as e:
             time_cost = round(time.time() - start_time, 4)
             error_msg = str(e)
+            journal.append(program_path, mutant_id, error=error_msg, time_cost=time_cost, model="deepseek-v3")
 
             logging.error(f"变异体 {mutant_id} 分析失败！耗时: {time_cost:.4f} 秒，错误: {error_msg}")
             continue  # 继续下一个 mutant
 
+    logging.info("阶段耗时统计:\n" + tracer.format_report())
+    tracer.write_prometheus(metrics_path(log_filename))
+    reachability_stats = get_reachability_memo().stats(os.path.splitext(os.path.basename(program_path))[0])
+    logging.info(f"可达性记忆统计: {json.dumps(reachability_stats, ensure_ascii=False)}")
+    if solver:
+        logging.info(f"求解器统计: {json.dumps(solver_report(), ensure_ascii=False)}")
+    if tiered:
+        truth = {mutant["mutant_id"]: mutant["equivalence"] for mutant in mutants if "equivalence" in mutant}
+        baseline = load_verdicts(tier_baseline) if tier_baseline else None
+        logging.info(f"分级判定统计: {json.dumps(tier_report(truth=truth, baseline=baseline), ensure_ascii=False)}")
+    if resilient:
+        logging.info(f"LLM容错统计: {json.dumps(llm.stats(), ensure_ascii=False)}")
+    router = find_router(llm)
+    if router:
+        logging.info(f"LLM路由统计: {json.dumps(router.stats(), ensure_ascii=False)}")
+    if cache:
+        logging.info(f"LLM缓存统计: {json.dumps(cache.stats(), ensure_ascii=False)}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="跳过已完成的变异体，只重跑失败和未完成的变异体")
+    parser.add_argument("--cascade", action="store_true", help="可达性已能判定时跳过依赖提取与分析链")
+    parser.add_argument("--solver", action="store_true", help="先用SMT求解器判定不可达性与非必要性")
+    parser.add_argument("--stream", action="store_true", help="流式读取判定链输出，给出结论后立即结束")
+    parser.add_argument("--compact", action="store_true", help="精简判定输出并限制输出token数")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="单次LLM请求超时（秒）")
+    parser.add_argument("--no-hedge", action="store_true", help="不对慢请求发出对冲请求")
+    parser.add_argument("--tiered", action="store_true", help="先由便宜模型判定，结论不确定时才交给强模型")
+    parser.add_argument("--tier-baseline", help="只用强模型得到的结果文件，用于比较分级判定的准确率")
+    args = parser.parse_args()
+    main(resume=args.resume, cascade=args.cascade, solver=args.solver, stream=args.stream, compact=args.compact,
+         llm_timeout=args.timeout, hedge=not args.no_hedge, tiered=args.tiered, tier_baseline=args.tier_baseline)
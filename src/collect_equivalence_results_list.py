@@ -1,14 +1,31 @@
+import argparse
 import json
-import time
-import subprocess
 import os
 import logging
-from datetime import datetime
-from emd_analysis import analyze_mutant
+from functools import partial
+from llm_client import get_llm
+from llm_router import find_router
+from batch_runner import RateLimiter, RateLimitedChatModel, run_mutants
+from llm_cache import DEFAULT_CACHE_PATH, enable_llm_cache
+from result_journal import ResultJournal, journal_path
+from reachability_memo import get_reachability_memo
+from smt_checker import solver_report
+from mutant_dedup import MutantDeduplicator
+from batch_extractor import get_batch_extractor
+from resilient_llm import DEFAULT_TIMEOUT, ResilientChatModel
+from model_cascade import CHEAP_MODEL, SAMPLE_TEMPERATURE, tier_report
+from artifact_store import (DEFAULT_ARTIFACT_PATH, ArtifactStore, analyze_to_store, extract_to_store, load_artifact,
+                            run_extraction_stage, run_judge_stage)
+from model_fanout import run_fanout
+from incremental import input_fingerprints, run_incremental
+import ctrl_extractor
+import data_extractor
+import graph_compaction
+from tracing import enable_tracing, metrics_path, trace_path
 
 
 # 配置日志
-def setup_logging(program_path):
+def setup_logging(program_path, resume=False):
     # 创建输出目录（如果不存在）
     output_dir = r"/Users/swan/bishe/LLM4EMD/Bisect"
     os.makedirs(output_dir, exist_ok=True)
@@ -20,8 +37,8 @@ def setup_logging(program_path):
     # 清除所有现有的handlers
     logging.getLogger().handlers = []
 
-    # 创建文件处理器，设置UTF-8编码
-    file_handler = logging.FileHandler(log_filename, mode='w', encoding='utf-8')
+    # 创建文件处理器，设置UTF-8编码（续跑时追加，保留之前的日志）
+    file_handler = logging.FileHandler(log_filename, mode='a' if resume else 'w', encoding='utf-8')
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(logging.Formatter('%(message)s'))
 
@@ -35,45 +52,189 @@ def setup_logging(program_path):
         handlers=[file_handler, console_handler],
         format='%(message)s'
     )
+    return log_filename
 
 # 主函数
-def main(program_paths, mutants_json_paths):
+def main(program_paths, mutants_json_paths, max_workers=1, max_in_flight=None,
+         requests_per_minute=None, tokens_per_minute=None, concurrent_extraction=False,
+         cache_path=DEFAULT_CACHE_PATH, cache_read_only=False, resume=False,
+         cascade=False, solver=False, dedup=False, stream=False, compact=False,
+         resilient=True, llm_timeout=DEFAULT_TIMEOUT, hedge=True, batch_extraction=False, tiered=False,
+         stage="all", artifact_path=DEFAULT_ARTIFACT_PATH, judge_models=None, incremental=False, dry_run=False,
+         prompt_compaction=None, data_mode="llm", ctrl_mode="llm"):
+    """max_workers>1时多个变异体并发分析；requests_per_minute/tokens_per_minute为全部LLM请求共享的限流配额；
+    cache_path为None时不使用LLM响应缓存，cache_read_only为True时只读缓存用于复现历史实验；
+    resume为True时跳过结果日志中已成功完成的变异体，只重跑失败和未完成的变异体；
+    cascade为True时先提取可达性，路径不可达的变异体不再提取数据/控制依赖，也不调用分析链；
+    solver为True时在调用LLM分析前先用SMT求解器判定不可达性与非必要性（需安装z3）；
+    stream为True时流式读取判定链输出并在给出结论后立即结束，compact为True时精简判定输出并限制输出token数；
+    dedup为True时按归一化指纹对全部程序的变异体去重，每组只分析一个代表，其余复用其判定结果；
+    resilient为True时所有LLM请求带llm_timeout秒超时、429/5xx退避重试与熔断，hedge为True时对慢请求发出对冲请求；
+    batch_extraction为True时先把需要LLM提取数据/控制依赖的变异体按批合并请求，共用同一张依赖图；
+    tiered为True时先由便宜模型多次采样判定，结论不一致时才交给deepseek-v3，每个程序结束时输出各级耗时、成本与准确率；
+    stage为extract时只提取可达性与数据/控制依赖并写入artifact_path的产物存储，为judge时只读取产物调用分析链
+    （修改判定提示词或模型后重跑判定阶段，每个变异体只需一次判定请求），为all时提取与判定在同一流程中完成；
+    judge_models为模型配置名列表时多模型判定：每个变异体只提取一次，判定请求并发发给全部模型，
+    各模型的结果写入各自的结果日志（见model_fanout.py）；
+    每个结果都附上影响它的输入指纹（程序源码、图文件、提示词模板、模型配置），提取产物都写入artifact_path，
+    incremental为True时只重算指纹相对上次成功结果发生变化的变异体及其受影响的提取链与判定链，
+    dry_run为True时只列出将要重算的变异体与原因（见incremental.py）；
+    去重时复用代表结果的变异体没有自己的产物，增量重跑时重新提取全部提取链；
+    prompt_compaction为slice/khop时提取提示词中的图裁剪到与变异相关的子图，默认嵌入完整图（见graph_compaction.py）；
+    data_mode为graph/auto时数据依赖路径由本地切片器提取（auto在切片器无法处理时回退到LLM），默认由LLM提取；
+    ctrl_mode同理，为graph/auto时控制依赖路径由本地图遍历提取"""
+
+    graph_compaction.PROMPT_COMPACTION = prompt_compaction
+    data_extractor.DATA_MODE = data_mode
+    ctrl_extractor.CTRL_MODE = ctrl_mode
 
     # 确保两个列表长度相同
     assert len(program_paths) == len(mutants_json_paths), "程序路径列表和变异体JSON路径列表长度必须相同"
+
+    # 启用LLM响应缓存，未改动的变异体重跑时直接命中
+    cache = enable_llm_cache(cache_path, read_only=cache_read_only) if cache_path else None
+
+    # 所有程序共享同一个限流LLM，保证配额在整个批次内生效
+    llm = None
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute) if requests_per_minute or tokens_per_minute else None
+    if limiter:
+        llm = RateLimitedChatModel(llm=get_llm("deepseek-v3"), limiter=limiter)
+    # 容错层在限流之外：每次重试和对冲请求都要重新申请配额
+    if resilient:
+        llm = ResilientChatModel(llm=llm or get_llm("deepseek-v3"), timeout=llm_timeout, hedge=hedge)
+    # 分级判定的便宜模型以非0温度采样，不走LLM缓存；与强模型共用限流配额
+    cheap_llm = None
+    if tiered:
+        cheap_llm = get_llm(CHEAP_MODEL, temperature=SAMPLE_TEMPERATURE)
+        if limiter:
+            cheap_llm = RateLimitedChatModel(llm=cheap_llm, limiter=limiter)
+        if resilient:
+            cheap_llm = ResilientChatModel(llm=cheap_llm, timeout=llm_timeout, hedge=hedge)
+    # 提取产物按程序与变异体保存：判定阶段只读取输入未变化的产物，增量重跑只重算输入变化的提取链；
+    # 完整流程同样保存产物，使之后的首次增量重跑不必重新提取全部提取链
+    store = ArtifactStore(artifact_path)
+    analyze_fn = partial(analyze_to_store, store, llm=llm, concurrent=concurrent_extraction, cascade=cascade,
+                         solver=solver, stream=stream, compact=compact, cheap_llm=cheap_llm)
+    # 多模型判定：deepseek-v3沿用上面的LLM，其他模型属于不同服务商，各自使用独立的限流配额
+    def build_judge(name):
+        if name == "deepseek-v3" and llm is not None:
+            return llm
+        judge_llm = get_llm(name)
+        if limiter:
+            judge_llm = RateLimitedChatModel(llm=judge_llm, limiter=RateLimiter(requests_per_minute, tokens_per_minute))
+        if resilient:
+            judge_llm = ResilientChatModel(llm=judge_llm, timeout=llm_timeout, hedge=hedge)
+        return judge_llm
+    judges = {name: build_judge(name) for name in judge_models or ()}
+    # 去重跨程序生效：结构相同、类型也相同的方法变体共享判定结果（不同基本类型的变体不合并）
+    deduplicator = MutantDeduplicator(analyze_fn) if dedup else None
+    if deduplicator:
+        analyze_fn = deduplicator
+
+    # 每个结果附上影响它的输入指纹，之后的增量重跑据此判断需要重算的部分
+    fingerprints = partial(input_fingerprints, llm=llm, compact=compact, cascade=cascade, solver=solver,
+                           cheap_llm=cheap_llm)
+
     # 遍历每个程序及其对应的变异体JSON
     for program_path, mutants_json_path in zip(program_paths, mutants_json_paths):
-        setup_logging(program_path)
+        # 提取阶段不产生判定结果，增量重跑沿用之前的结果，都保留之前的日志与结果日志
+        append = resume or stage == "extract" or incremental
+        log_filename = setup_logging(program_path, append)
         logging.info(f"开始处理程序: {program_path}")
         # 读取变异体JSON文件
         with open(mutants_json_path, 'r', encoding='utf-8') as f:
             mutants = json.load(f)
 
-        # 遍历每个变异体
-        for mutant in mutants:
-            mutant_id = mutant["mutant_id"]
-            logging.info(f"开始分析变异体 {mutant_id}...")
-            # 记录开始时间
-            start_time = time.time()
-
-            try:
-                # 调用分析程序
-                analysis_result = analyze_mutant(program_path, mutant)
-                # 计算耗时（保留4位小数）
-                time_cost = round(time.time() - start_time, 4)  # 关键行：计算耗时
-                # 立即写入日志
-                logging.info(json.dumps({mutant_id: analysis_result}, ensure_ascii=False))
-                logging.info(f"完成变异体 {mutant_id} 的分析, 耗时: {time_cost:.4f} 秒\n")
-
-            except Exception as e:
-                time_cost = round(time.time() - start_time, 4)
-                error_msg = str(e)
+        # 每个变异体的结果写入只追加的结果日志（逐条fsync），续跑时跳过已完成的变异体
+        journal_file = journal_path(log_filename)
+        if not append and os.path.exists(journal_file):
+            os.remove(journal_file)
+        journal = ResultJournal(journal_file)
+        # 各阶段span（耗时、token数、重试次数）追加到trace日志，结束时输出分位数报表与Prometheus指标
+        trace_file = trace_path(log_filename)
+        if not append and os.path.exists(trace_file):
+            os.remove(trace_file)
+        tracer = enable_tracing(trace_file)
+        if resume:
+            completed = journal.completed()
+            mutants = [mutant for mutant in mutants if mutant["mutant_id"] not in completed]
+            logging.info(f"续跑: 跳过已完成的 {len(completed)} 个变异体, 剩余 {len(mutants)} 个")
 
-                logging.error(f"变异体 {mutant_id} 分析失败！耗时: {time_cost:.4f} 秒，错误: {error_msg}")
+        if incremental:
+            run_incremental(store, program_path, mutants, journal, llm, dry_run=dry_run, max_workers=max_workers,
+                            max_in_flight=max_in_flight, model="deepseek-v3", concurrent=concurrent_extraction,
+                            cascade=cascade, solver=solver, stream=stream, compact=compact, cheap_llm=cheap_llm)
+            if dry_run:
+                continue
+        elif judge_models and stage != "extract":
+            # 判定阶段读取已保存的产物，否则在同一流程中提取一次
+            extract_fn = partial(load_artifact, store) if stage == "judge" else partial(
+                extract_to_store, store, llm=llm, concurrent=concurrent_extraction, cascade=cascade, solver=solver,
+                force=True)
+            if batch_extraction and stage != "judge":
+                get_batch_extractor().prefetch(os.path.splitext(os.path.basename(program_path))[0], mutants, llm)
+            run_fanout(program_path, mutants, extract_fn, judges, log_filename, max_workers=max_workers,
+                       resume=resume, stream=stream, compact=compact)
+        elif stage == "extract":
+            run_extraction_stage(store, program_path, mutants, llm, max_workers=max_workers,
+                                 concurrent=concurrent_extraction, cascade=cascade, solver=solver,
+                                 batch_extraction=batch_extraction)
+        elif stage == "judge":
+            run_judge_stage(store, program_path, mutants, llm, max_workers=max_workers, max_in_flight=max_in_flight,
+                            journal=journal, model="deepseek-v3", stream=stream, compact=compact, cheap_llm=cheap_llm)
+        else:
+            if batch_extraction:
+                get_batch_extractor().prefetch(os.path.splitext(os.path.basename(program_path))[0], mutants, llm)
 
-                continue  # 继续下一个 mutant
+            # 并发分析变异体，日志按变异体原始顺序写出，格式与串行版本一致
+            run_mutants(program_path, mutants, analyze_fn, max_workers=max_workers, max_in_flight=max_in_flight,
+                        journal=journal, model="deepseek-v3",
+                        provenance=deduplicator.provenance if deduplicator else None, fingerprints=fingerprints)
+        logging.info("阶段耗时统计:\n" + tracer.format_report())
+        tracer.write_prometheus(metrics_path(log_filename))
+        reachability_stats = get_reachability_memo().stats(os.path.splitext(os.path.basename(program_path))[0])
+        logging.info(f"可达性记忆统计: {json.dumps(reachability_stats, ensure_ascii=False)}")
+        if deduplicator:
+            logging.info(f"去重统计: {json.dumps(deduplicator.stats(), ensure_ascii=False)}")
+        if solver:
+            logging.info(f"求解器统计: {json.dumps(solver_report(), ensure_ascii=False)}")
+        if tiered:
+            program_name = os.path.splitext(os.path.basename(program_path))[0]
+            truth = {mutant["mutant_id"]: mutant["equivalence"] for mutant in mutants if "equivalence" in mutant}
+            logging.info(f"分级判定统计: {json.dumps(tier_report(program_name, truth), ensure_ascii=False)}")
+        if resilient:
+            logging.info(f"LLM容错统计: {json.dumps(llm.stats(), ensure_ascii=False)}")
+        router = find_router(llm or get_llm("deepseek-v3"))
+        if router:
+            logging.info(f"LLM路由统计: {json.dumps(router.stats(), ensure_ascii=False)}")
+        if cache:
+            logging.info(f"LLM缓存统计: {json.dumps(cache.stats(), ensure_ascii=False)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="跳过已完成的变异体，只重跑失败和未完成的变异体")
+    parser.add_argument("--cascade", action="store_true", help="可达性已能判定时跳过依赖提取与分析链")
+    parser.add_argument("--solver", action="store_true", help="先用SMT求解器判定不可达性与非必要性")
+    parser.add_argument("--stream", action="store_true", help="流式读取判定链输出，给出结论后立即结束")
+    parser.add_argument("--compact", action="store_true", help="精简判定输出并限制输出token数")
+    parser.add_argument("--dedup", action="store_true", help="结构相同的变异体只分析一个代表")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="单次LLM请求超时（秒）")
+    parser.add_argument("--no-hedge", action="store_true", help="不对慢请求发出对冲请求")
+    parser.add_argument("--batch-extraction", action="store_true", help="多个变异体合并为一个依赖路径提取请求")
+    parser.add_argument("--tiered", action="store_true", help="先由便宜模型判定，结论不确定时才交给强模型")
+    parser.add_argument("--stage", choices=("all", "extract", "judge"), default="all",
+                        help="extract只提取并保存产物，judge只读取产物进行判定")
+    parser.add_argument("--artifacts", default=DEFAULT_ARTIFACT_PATH, help="提取产物存储路径")
+    parser.add_argument("--incremental", action="store_true", help="只重算输入指纹发生变化的变异体及受影响的阶段")
+    parser.add_argument("--dry-run", action="store_true", help="与--incremental一起使用，只列出将要重算的内容与原因")
+    parser.add_argument("--prompt-compaction", choices=("slice", "khop"),
+                        help="提取提示词中的图裁剪到与变异相关的子图（默认嵌入完整图）")
+    parser.add_argument("--data-mode", choices=("llm", "graph", "auto"), default="llm",
+                        help="数据依赖路径提取方式：llm、本地切片器graph、切片器优先的auto")
+    parser.add_argument("--ctrl-mode", choices=("llm", "graph", "auto"), default="llm",
+                        help="控制依赖路径提取方式：llm、本地图遍历graph、图遍历优先的auto")
+    parser.add_argument("--judge-models", help="逗号分隔的判定模型配置名（如deepseek-v3,gpt-3.5-turbo），共用一次提取")
+    args = parser.parse_args()
     # 示例调用方式
     program_paths = [
         "/Users/swan/bishe/progex_benchmark/mutantbench/mutantjava/mutantjavadiv/BisectSetEpsion.java"
@@ -81,4 +242,11 @@ if __name__ == "__main__":
     mutants_json_paths = [
         "/Users/swan/bishe/progex_benchmark/mutantbench/mutantjava/mutantsAdjDelJson/BisectSetEpsionmutants.json"
     ]
-    main(program_paths, mutants_json_paths)
\ No newline at end of file
+    main(program_paths, mutants_json_paths, max_workers=4, requests_per_minute=60, resume=args.resume,
+         cascade=args.cascade, solver=args.solver, dedup=args.dedup,
+         stream=args.stream, compact=args.compact, llm_timeout=args.timeout, hedge=not args.no_hedge,
+         batch_extraction=args.batch_extraction, tiered=args.tiered,
+         stage=args.stage, artifact_path=args.artifacts,
+         judge_models=args.judge_models.split(",") if args.judge_models else None,
+         incremental=args.incremental, dry_run=args.dry_run, prompt_compaction=args.prompt_compaction,
+         data_mode=args.data_mode, ctrl_mode=args.ctrl_mode)
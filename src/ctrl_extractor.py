@@ -1,27 +1,16 @@
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
 import json
 import re
-import os
-import yaml
-
-def load_deepseek_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    # return config["deepseek-v3-g"]
-    return config["deepseek-v3"]
-    # return config["deepseek-v3"]
-
-deepseek_config = load_deepseek_config()
-
-def load_gpt_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return config["gpt-3.5-turbo"]
-
-gpt_config = load_gpt_config()
+import logging
+from llm_client import get_llm
+from tracing import traced
+from graph_store import get_graph_store
+from ctrl_slicer import extract_ctrl_paths
 
+# 控制依赖提取方式：graph为本地图遍历，llm为原LLM提取，auto为图遍历优先、无法处理时回退到LLM
+# 默认仍用LLM提取：图遍历与LLM路径的一致性未经benchmark_extractors.benchmark测量前需显式开启（--ctrl-mode）
+CTRL_MODE = "llm"
 
 def extract_ctrl_info(ctrl_json_path):
     """从PDG ctrl JSON文件中提取信息"""
@@ -29,9 +18,8 @@ def extract_ctrl_info(ctrl_json_path):
         return json.load(f)
 
 
-def extract_ctrl_path(llm, ctrl_info, mutant_info):
-    """使用LLM提取控制依赖信息"""
-    template = """请根据提供的PDG控制依赖图和变异体信息，严格按照以下要求提取变异语句的控制依赖路径：
+# 提取提示词：固定的提取要求作为系统消息在前，图信息与变异体信息在后，导入时编译一次
+CTRL_SYSTEM_PROMPT = """请根据提供的PDG控制依赖图和变异体信息，严格按照以下要求提取变异语句的控制依赖路径：
 1. 提取范围：
    - 从变异语句开始
    - 到程序输出语句结束，不要扩展无关分支
@@ -53,70 +41,56 @@ def extract_ctrl_path(llm, ctrl_info, mutant_info):
    - 每条路径独立编号
    - 只输出依赖路径信息即可，无需做路径说明
 
-控制依赖信息:
+"""
+CTRL_HUMAN_TEMPLATE = """控制依赖信息:
 {ctrl_info}
 
 变异体信息:
 {mutant_info}
 """
+CTRL_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=CTRL_SYSTEM_PROMPT), ("human", CTRL_HUMAN_TEMPLATE)])
 
-    prompt = PromptTemplate(
-        input_variables=["ctrl_info", "mutant_info"],
-        template=template
-    )
 
-    # 使用新的 Runnable 语法
-    chain = (
-            {"ctrl_info": RunnablePassthrough(), "mutant_info": RunnablePassthrough()}
-            | prompt
-            | llm
-    )
+def extract_ctrl_path(llm, ctrl_info, mutant_info):
+    """使用LLM提取控制依赖信息"""
+    chain = CTRL_PROMPT | llm
 
     # 获取 AI 响应对象
     response = chain.invoke({
-        "ctrl_info": json.dumps(ctrl_info, indent=2),
+        "ctrl_info": ctrl_info if isinstance(ctrl_info, str) else json.dumps(ctrl_info, indent=2),
         "mutant_info": json.dumps(mutant_info, indent=2)
     })
 
     return response.content if hasattr(response, 'content') else str(response)
 
 
-def get_ctrl_info(program_name, mutant):
-    # 初始化LLM
-    llm = ChatOpenAI(
-        api_key=deepseek_config["api_key"],
-        model=deepseek_config["model"],
-        temperature=0,
-        base_url=deepseek_config["base_url"]
-    )
-    '''
-    llm = ChatOpenAI(
-        openai_api_key=gpt_config["api_key"],
-        model="gpt-3.5-turbo",
-        temperature=0,
-        openai_api_base=gpt_config["base_url"]
-    )
-    '''
-
-    # 示例路径
-    # mutants_dir = r"D:\bishe_code\progex_benchmark\mutant_programs\Min\mutants"
-    # base_dir = r"D:\bishe_code\progex_benchmark\mutant_programs"
-    base_dir = r"/Users/swan/bishe/progex_benchmark/mutant_programs"
-    mutants_dir = os.path.join(base_dir, program_name, "mutants")
+@traced("ctrl")
+def get_ctrl_info(program_name, mutant, llm=None, mode=None):
+    mode = mode or CTRL_MODE
 
     mutant_id = mutant.get("mutant_id")  # 例如 "MUT_001"
 
-    # 从MUT_001提取数字部分
-    mutant_number = mutant_id.split('_')[-1].zfill(3)
-    mutant_dir = f"mutant_{mutant_number}"
-
-    # 构建ctrl路径
-    ctrl_path = os.path.join(mutants_dir, mutant_dir, "outdir", f"{program_name}-PDG-CTRL.json")
-
-    # 提取信息
-    ctrl_info = extract_ctrl_info(ctrl_path)
-
-    # 返回可达性路径
+    # 图文件由进程内图缓存按程序加载，变异体图以相对原程序图的差量保存
+    graph_store = get_graph_store()
+
+    # 本地图遍历
+    if mode != "llm":
+        ctrl_graph = graph_store.get_program_graph(program_name, mutant_id, "PDG-CTRL")
+        result = extract_ctrl_paths(ctrl_graph, mutant.get("difference", ""))
+        if result is not None:
+            return result
+        if mode == "graph":
+            raise ValueError(f"图遍历无法处理变异体 {mutant_id} 的控制依赖图")
+        logging.info(f"变异体 {mutant_id} 的控制依赖图无法由图遍历处理，回退到LLM提取控制依赖")
+
+    # 初始化LLM（未注入时使用进程内共享的客户端）
+    if llm is None:
+        llm = get_llm("deepseek-v3")
+        # llm = get_llm("gpt-3.5-turbo")
+
+    # 返回控制依赖路径
+    ctrl_info = graph_store.prompt_fragment(program_name, mutant_id, "PDG-CTRL", mutant.get("difference", ""))
     result = extract_ctrl_path(llm, ctrl_info, mutant)
     return result
 
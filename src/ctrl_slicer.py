@@ -0,0 +1,137 @@
+# coding=utf-8
+from path_constraint import split_top_level, strip_parens
+from program_graph import (BRANCH_LABELS, ProgramGraph, control_label, extract_condition, is_output_node, node_code,
+                           parse_mutated_line)
+
+# 最多列出的控制依赖路径数
+MAX_PATHS = 32
+
+# 变异语句没有控制依赖出边（非谓词语句）时的说明，与判定提示词中“控制依赖缺失”的表述一致
+NO_CTRL_DEPENDENCY = "无控制依赖：变异语句不是谓词，无控制依赖边到达任意输出节点"
+
+
+def describe(graph, node_id):
+    line, code = graph.describe(node_id)
+    return f"({line}: {code})"
+
+
+def condition_outcomes(condition):
+    """按短路求值展开条件：返回 {True: [求值序列, ...], False: [...]}，求值序列为[(原子条件, 取值), ...]，
+    即使整个条件取该值的一种求值过程（&&左侧为假、||左侧为真时不再求值右侧）"""
+    expr = strip_parens(condition)
+    for operator, short_circuit in (("||", True), ("&&", False)):
+        parts = split_top_level(expr, operator)
+        if len(parts) > 1:
+            left, rest = condition_outcomes(parts[0]), condition_outcomes(f" {operator} ".join(parts[1:]))
+            outcomes = {short_circuit: list(left[short_circuit]), not short_circuit: []}
+            for prefix in left[not short_circuit]:
+                for value in (True, False):
+                    outcomes[value] += [prefix + sequence for sequence in rest[value]]
+            return outcomes
+    if expr.startswith("!") and not expr.startswith("!=") and strip_parens(expr[1:]) != expr[1:].strip():
+        inner = condition_outcomes(expr[1:])
+        return {True: inner[False], False: inner[True]}
+    return {True: [[(expr, True)]], False: [[(expr, False)]]}
+
+
+def branch_steps(graph, node_id, label):
+    """从节点沿label分支出去时的路径片段：[(片段文本, 最后一步的分支方向)]
+
+    复合条件（含&&、||）的谓词按短路求值展开为逐个原子条件的判断，每种求值过程一条，
+    如 if (a > b && c > d) 的False分支展开为 (4: a > b) --False--> 与 (4: a > b) --True--> (4: c > d) --False-->；
+    其余节点原样给出节点描述与label。
+    """
+    code = node_code(graph.nodes[node_id])
+    condition = extract_condition(code)
+    if label not in BRANCH_LABELS or condition == code:
+        return [(describe(graph, node_id), label)]
+    sequences = condition_outcomes(condition)[label == "True"]
+    if all(len(sequence) == 1 for sequence in sequences):
+        return [(describe(graph, node_id), label)]
+    line = graph.nodes[node_id].get("line")
+    steps = []
+    for sequence in sequences:
+        text = " ".join(f"({line}: {atom}) --{value}-->" for atom, value in sequence[:-1])
+        atom, value = sequence[-1]
+        steps.append((f"{text} ({line}: {atom})".lstrip(), str(value)))
+    return steps
+
+
+def control_ancestors(graph, node_id):
+    """沿控制依赖入边向上找到的全部控制节点（含方法入口）"""
+    ancestors, stack = set(), [node_id]
+    while stack:
+        for edge in graph.in_edges.get(stack.pop(), []):
+            if edge["source"] not in ancestors:
+                ancestors.add(edge["source"])
+                stack.append(edge["source"])
+    return ancestors
+
+
+def following_outputs(graph, node_id):
+    """终止于非输出语句时，其后受同一（或外层）控制区域支配的输出语句"""
+    ancestors = control_ancestors(graph, node_id)
+    line = graph.nodes[node_id].get("line") or 0
+    outputs = []
+    for candidate in sorted(graph.nodes, key=lambda candidate_id: graph.nodes[candidate_id].get("line") or 0):
+        node = graph.nodes[candidate]
+        if candidate == node_id or not is_output_node(node) or (node.get("line") or 0) <= line:
+            continue
+        if any(edge["source"] in ancestors for edge in graph.in_edges.get(candidate, [])):
+            outputs.append(candidate)
+    return outputs
+
+
+def enumerate_ctrl_paths(graph, start, max_paths=MAX_PATHS):
+    """从变异节点沿控制依赖边走到输出语句；到达叶子时接到其后的输出语句，回边处标注循环起止，复合条件展开所有求值路径；
+    变异节点本身没有控制依赖出边时只给出该节点并注明无控制依赖"""
+    paths = []
+    stack = [(start, (start,), "")]
+    while stack and len(paths) < max_paths:
+        node_id, visited, prefix = stack.pop()
+        text = prefix + describe(graph, node_id)
+        if node_id != start and is_output_node(graph.nodes[node_id]):
+            paths.append(text)
+            continue
+        edges = [(edge["target"], control_label(edge) or "") for edge in graph.out_edges.get(node_id, [])]
+        if not edges and node_id == start:
+            # 变异语句不是谓词，不控制任何语句的执行；不能接到其后的输出语句，否则会虚构控制依赖
+            paths.append(f"{text} [{NO_CTRL_DEPENDENCY}]")
+            continue
+        if not edges:
+            outputs = following_outputs(graph, node_id)
+            for output in outputs[:max_paths - len(paths)]:
+                paths.append(f"{text} -- --> {describe(graph, output)}")
+            if not outputs:
+                paths.append(text)  # 无到输出语句的控制依赖时给出到终止节点的完整路径
+            continue
+        for target, label in reversed(edges):
+            for step, step_label in reversed(branch_steps(graph, node_id, label)):
+                if target in visited:
+                    line = graph.nodes[target].get("line")
+                    paths.append(f"{prefix}{step} --{step_label}--> ({line}) "
+                                 f"[循环: 起点 {line}, 终点 {graph.nodes[node_id].get('line')}]")
+                    continue
+                stack.append((target, visited + (target,), f"{prefix}{step} --{step_label}--> "))
+    return paths[:max_paths]
+
+
+def extract_ctrl_paths(ctrl_info, difference, max_paths=MAX_PATHS):
+    """从控制依赖图直接提取变异语句到输出语句的控制依赖路径
+
+    返回与LLM提取结果相同格式的编号路径文本；无法定位变异语句时返回None，由调用方回退到LLM。
+    """
+    graph = ctrl_info if isinstance(ctrl_info, ProgramGraph) else ProgramGraph(ctrl_info)
+    line = parse_mutated_line(difference)
+    if line is None:
+        return None
+    node_ids = graph.nodes_at_line(line)
+    if not node_ids:
+        return None
+
+    paths = []
+    for node_id in node_ids:
+        for path in enumerate_ctrl_paths(graph, node_id, max_paths):
+            if path not in paths and len(paths) < max_paths:
+                paths.append(path)
+    return "控制依赖路径信息：\n" + "\n".join(f"{index}. {path}" for index, path in enumerate(paths, 1))
@@ -1,26 +1,16 @@
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
 import json
 import re
-import os
-import yaml
+import logging
+from llm_client import get_llm
+from tracing import traced
+from graph_store import get_graph_store
+from data_slicer import slice_data_paths
 
-def load_deepseek_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    # return config["deepseek-v3-g"]
-    return config["deepseek-v3"]
-    # return config["deepseek-v3"]
-
-deepseek_config = load_deepseek_config()
-
-def load_gpt_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return config["gpt-3.5-turbo"]
-
-gpt_config = load_gpt_config()
+# 数据依赖提取方式：graph为本地切片器，llm为原LLM提取，auto为切片器优先、无法处理时回退到LLM
+# 默认仍用LLM提取：切片器与LLM路径的一致性未经benchmark_extractors.benchmark测量前需显式开启（--data-mode）
+DATA_MODE = "llm"
 
 def extract_data_info(data_json_path):
     """从PDG DATA JSON文件中提取信息"""
@@ -28,9 +18,8 @@ def extract_data_info(data_json_path):
         return json.load(f)
 
 
-def extract_data_path(llm, data_info, mutant_info):
-    """使用LLM提取数据依赖信息"""
-    template = """根据提供的PDG数据依赖图和变异体信息，首先分析变异影响的变量，再严格按照以下要求提取变量的数据依赖路径：
+# 提取提示词：固定的提取要求作为系统消息在前，图信息与变异体信息在后，导入时编译一次
+DATA_SYSTEM_PROMPT = """根据提供的PDG数据依赖图和变异体信息，首先分析变异影响的变量，再严格按照以下要求提取变量的数据依赖路径：
 1. 提取范围：
    - 从变异语句开始
    - 到程序输出语句结束，不要扩展无关分支
@@ -53,71 +42,60 @@ def extract_data_path(llm, data_info, mutant_info):
    - 每条路径独立编号
    - 只输出依赖路径信息即可，无需做路径说明
 
-数据依赖信息:
+"""
+DATA_HUMAN_TEMPLATE = """数据依赖信息:
 {data_info}
 
 变异体信息:
 {mutant_info}
 """
+DATA_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=DATA_SYSTEM_PROMPT), ("human", DATA_HUMAN_TEMPLATE)])
 
-    prompt = PromptTemplate(
-        input_variables=["data_info", "mutant_info"],
-        template=template
-    )
 
-    # 使用新的 Runnable 语法
-    chain = (
-            {"data_info": RunnablePassthrough(), "mutant_info": RunnablePassthrough()}
-            | prompt
-            | llm
-    )
+def extract_data_path(llm, data_info, mutant_info):
+    """使用LLM提取数据依赖信息"""
+    chain = DATA_PROMPT | llm
 
     # 获取 AI 响应对象
     response = chain.invoke({
-        "data_info": json.dumps(data_info, indent=2),
+        "data_info": data_info if isinstance(data_info, str) else json.dumps(data_info, indent=2),
         "mutant_info": json.dumps(mutant_info, indent=2)
     })
 
     return response.content if hasattr(response, 'content') else str(response)
 
 
-def get_data_info(program_name, mutant):
-    # 初始化LLM
-
-    llm = ChatOpenAI(
-        api_key=deepseek_config["api_key"],
-        model=deepseek_config["model"],
-        temperature=0,
-        base_url=deepseek_config["base_url"]
-    )
-    '''
-    llm = ChatOpenAI(
-        openai_api_key=gpt_config["api_key"],
-        model="gpt-3.5-turbo",
-        temperature=0,
-        openai_api_base=gpt_config["base_url"]
-    )
-    '''
-
-    # 示例路径
-    # mutants_dir = r"D:\bishe_code\progex_benchmark\mutant_programs\Min\mutants"
-    # base_dir = r"D:\bishe_code\progex_benchmark\mutant_programs"
-    base_dir = r"/Users/swan/bishe/progex_benchmark/mutant_programs"
-    mutants_dir = os.path.join(base_dir, program_name, "mutants")
+@traced("data")
+def get_data_info(program_name, mutant, llm=None, mode=None):
+    mode = mode or DATA_MODE
 
     mutant_id = mutant.get("mutant_id")  # 例如 "MUT_001"
 
-    # 从MUT_001提取数字部分
-    mutant_number = mutant_id.split('_')[-1].zfill(3)
-    mutant_dir = f"mutant_{mutant_number}"
-
-    # 构建data路径
-    data_path = os.path.join(mutants_dir, mutant_dir, "outdir", f"{program_name}-PDG-DATA.json")
-
-    # 提取信息
-    data_info = extract_data_info(data_path)
+    # 图文件由进程内图缓存按程序加载，变异体图以相对原程序图的差量保存
+    graph_store = get_graph_store()
+
+    # 本地切片器：数据依赖边与同目录下的控制依赖边共同构成前向切片
+    if mode != "llm":
+        data_graph = graph_store.get_program_graph(program_name, mutant_id, "PDG-DATA")
+        try:
+            ctrl_graph = graph_store.get_program_graph(program_name, mutant_id, "PDG-CTRL")
+        except OSError:
+            ctrl_graph = None
+        result = slice_data_paths(data_graph, mutant.get("difference", ""), ctrl_graph)
+        if result is not None:
+            return result
+        if mode == "graph":
+            raise ValueError(f"切片器无法处理变异体 {mutant_id} 的数据依赖图")
+        logging.info(f"变异体 {mutant_id} 的数据依赖图无法由切片器处理，回退到LLM提取数据依赖")
+
+    # 初始化LLM（未注入时使用进程内共享的客户端）
+    if llm is None:
+        llm = get_llm("deepseek-v3")
+        # llm = get_llm("gpt-3.5-turbo")
 
     # 返回数据依赖路径
+    data_info = graph_store.prompt_fragment(program_name, mutant_id, "PDG-DATA", mutant.get("difference", ""))
     result = extract_data_path(llm, data_info, mutant)
     return result
 
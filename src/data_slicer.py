@@ -0,0 +1,107 @@
+# coding=utf-8
+from program_graph import (ProgramGraph, control_label, extract_identifiers, flow_variable, is_output_node,
+                           parse_diff_lines, parse_mutated_line)
+
+# 每个变量最多列出的路径数与单条路径的最大长度，防止循环与分支组合导致路径爆炸
+MAX_PATHS_PER_VARIABLE = 16
+MAX_PATH_LENGTH = 32
+
+
+def mutation_variables(graph, node_ids, difference):
+    """变异影响的变量：原语句与变异语句中出现的变量，若节点带有defs/uses则限定在其中"""
+    original, mutated = parse_diff_lines(difference)
+    candidates = extract_identifiers(original + " " + mutated)
+    declared = set()
+    for node_id in node_ids:
+        node = graph.nodes[node_id]
+        declared.update(node.get("defs") or [])
+        declared.update(node.get("uses") or [])
+    if declared:
+        candidates = [name for name in candidates if name in declared]
+    return candidates
+
+
+def successors(data_graph, ctrl_graph, node_id, variable=None):
+    """后继边：(目标节点, 边描述)。variable非空时只沿该变量的Flows边走（用于变异语句自身定义的变量）"""
+    result = []
+    for edge in data_graph.out_edges.get(node_id, []):
+        flowing = flow_variable(edge)
+        if flowing is not None:
+            if variable is None or flowing == variable:
+                result.append((edge["target"], f"Flows {flowing}"))
+        elif control_label(edge) is not None:
+            result.append((edge["target"], f"Control {control_label(edge)}".strip()))
+    if ctrl_graph is not None:
+        for edge in ctrl_graph.out_edges.get(node_id, []):
+            label = control_label(edge)
+            if label and edge["target"] in data_graph.nodes:  # 只保留谓词的分支边，忽略入口的无条件控制
+                result.append((edge["target"], f"Control {label}"))
+    return result
+
+
+def describe(graph, node_id):
+    line, code = graph.describe(node_id)
+    return f"(line {line}: {code})"
+
+
+def enumerate_variable_paths(data_graph, ctrl_graph, start, variable, max_paths=MAX_PATHS_PER_VARIABLE,
+                             max_length=MAX_PATH_LENGTH):
+    """从变异节点出发沿依赖边枚举到输出语句（或终止节点）的路径，回到已访问节点时标注循环起止"""
+    start_node = data_graph.nodes[start]
+    defines_variable = variable in (start_node.get("defs") or [])
+    paths = []
+    stack = [(start, (start,), describe(data_graph, start))]
+    while stack and len(paths) < max_paths:
+        node_id, visited, text = stack.pop()
+        if node_id != start and is_output_node(data_graph.nodes[node_id]):
+            paths.append(text)
+            continue
+        # 变异语句定义了该变量时沿该变量传播，否则变量经由语句定义的其他变量或控制分支传播
+        edges = successors(data_graph, ctrl_graph, node_id, variable if node_id == start and defines_variable else None)
+        extended = False
+        for target, label in reversed(edges):
+            if target in visited:
+                if len(paths) < max_paths:
+                    line = data_graph.nodes[target].get("line")
+                    paths.append(f"{text} --[{label}]--> (line {line}) [循环: 起点 line {line}, "
+                                 f"终点 line {data_graph.nodes[node_id].get('line')}]")
+                extended = True
+                continue
+            if len(visited) >= max_length:
+                continue
+            stack.append((target, visited + (target,), f"{text} --[{label}]--> {describe(data_graph, target)}"))
+            extended = True
+        if not extended and (node_id != start or not paths):
+            paths.append(text)  # 无到输出的依赖时给出到终止节点的完整路径
+    return paths
+
+
+def slice_data_paths(data_info, difference, ctrl_info=None):
+    """前向切片：从变异语句出发，按变量分组列出到输出语句的数据依赖路径
+
+    返回与LLM提取结果相同格式的文本；无法在图中定位变异语句时返回None，由调用方回退到LLM。
+    """
+    data_graph = data_info if isinstance(data_info, ProgramGraph) else ProgramGraph(data_info)
+    ctrl_graph = None
+    if ctrl_info is not None:
+        ctrl_graph = ctrl_info if isinstance(ctrl_info, ProgramGraph) else ProgramGraph(ctrl_info)
+    line = parse_mutated_line(difference)
+    if line is None:
+        return None
+    node_ids = data_graph.nodes_at_line(line)
+    if not node_ids:
+        return None
+
+    variables = mutation_variables(data_graph, node_ids, difference)
+    if not variables:
+        return None
+    lines = [f"变异影响的变量为：{', '.join(variables)}"]
+    for variable in variables:
+        lines.append(f"变量{variable}的数据依赖路径:")
+        paths = []
+        for node_id in node_ids:
+            for path in enumerate_variable_paths(data_graph, ctrl_graph, node_id, variable):
+                if path not in paths:
+                    paths.append(path)
+        lines.extend(f"{index}. {path}" for index, path in enumerate(paths, 1))
+    return "\n".join(lines)
@@ -0,0 +1,57 @@
+# coding=utf-8
+import threading
+from langchain_core.language_models.chat_models import BaseChatModel
+
+_count_lock = threading.Lock()
+
+
+class DelegatingChatModel(BaseChatModel):
+    """包装另一个聊天模型的基类：缓存键与内部模型一致，子类在_generate中加入限流、重试等逻辑
+
+    外层模型先按内部模型的llm_string查询LLM缓存，命中时不会进入子类逻辑；
+    未命中时直接调用内部模型的_generate，避免同一请求被内外两层重复缓存。
+    """
+
+    llm: BaseChatModel
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def _llm_type(self):
+        return self.llm._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.llm._identifying_params
+
+    def _get_llm_string(self, stop=None, **kwargs):
+        return self.llm._get_llm_string(stop=stop, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def supports_streaming(llm):
+    """沿包装链找到最内层模型，判断其是否实现了_stream"""
+    while isinstance(llm, DelegatingChatModel):
+        llm = llm.llm
+    return type(llm)._stream != BaseChatModel._stream
+
+
+class CountingChatModel(DelegatingChatModel):
+    """统计实际发往内部模型的请求数；缓存命中不会进入_generate，因此不计入"""
+
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with _count_lock:
+            self.calls += 1
+        return self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with _count_lock:
+            self.calls += 1
+        return self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
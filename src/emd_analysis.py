@@ -1,20 +1,38 @@
 # coding=utf-8
+import contextvars
 import json
+import logging
 import os
-import yaml
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import ChatOpenAI
-from reachability_extractor import get_reachability_path
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from llm_client import get_llm
+from reachability_extractor import get_reachability_path, is_loop_mutant, is_sound_reachability
 from data_extractor import get_data_info
 from ctrl_extractor import get_ctrl_info
+from batch_extractor import with_prefetched
+from graph_store import get_graph_store
+from path_constraint import is_unsatisfiable
+from delegating_chat_model import CountingChatModel
+from result_journal import parse_verdict
+from model_cascade import tiered_judge
+from verdict_stream import VerdictStreamingChatModel
+import smt_checker
+import tracing
+from tracing import TracingChatModel
 
-# 1. 示例代码和变异体信息（提取为变量）
+# 精简判定模式的输出token预算与附加要求
+COMPACT_MAX_TOKENS = 1024
+COMPACT_INSTRUCTION = """## 精简输出：每个步骤的说明理由不超过两句话，分析结论只写一句；一旦得出结论立即输出最终结论行。
+"""
+
+# 1. 示例代码和变异体信息（导入时填入判定提示词的系统消息）
 EXAMPLE1_PROGRAM = """
 public class Mid {public static int main(int a, int b, int c) {int mid;if (a < b) {if (c < b) {if (a < c) {mid = c;} else {mid = a;}} else {mid = b;}} else {if (c > b) {if (a > c) {mid = c;} else {mid = a;}} else {mid = b;}}return mid;}}
 """
 EXAMPLE1_MUTANT = """{
-    "difference": "@@ -16 +16 @@\\n-\\t\\t\\t\\tif (a > c) {{\\n+\\t\\t\\t\\tif (a >= c) {{",
+    "difference": "@@ -16 +16 @@\\n-\\t\\t\\t\\tif (a > c) {\\n+\\t\\t\\t\\tif (a >= c) {",
     "equivalence": True,
     "operator": "ROR"
 }"""
@@ -22,26 +40,75 @@ EXAMPLE2_PROGRAM = """
 public static int classify(int a, int b, int c) {int trian;if (a <= 0 || b <= 0 || c <= 0) {return INVALID;}trian = 0;if (a == b) {trian = trian + 1;}if (a == c) {trian = trian + 2;}if (b == c) {trian = trian + 3;}if (trian == 0) {if (a + b < c || a + c < b || b + c < a) {return INVALID;} else {return SCALENE;}}if (trian > 3) {return EQUILATERAL;}if (trian == 1 && a + b > c) {return ISOSCELES;} else {if (trian == 2 && a + c > b) {return ISOSCELES;} else {if (trian == 3 && b + c > a) {return ISOSCELES;}}}return INVALID;}
 """
 EXAMPLE2_MUTANT = """{
-    "difference": "@@ -32 +32 @@\\n-            if (a + b < c || a + c < b || b + c < a) {{\\n+            if (a + b < c || a + c < b-- || b + c < a) {{",
+    "difference": "@@ -32 +32 @@\\n-            if (a + b < c || a + c < b || b + c < a) {\\n+            if (a + b < c || a + c < b-- || b + c < a) {",
     "equivalence": False,
     "operator": "AOIS"
 }"""
 
-# 1. 加载配置文件
-def load_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
-
-
 # 2. 提取原程序代码
 def extract_program_code(program_path):
     with open(program_path, "r", encoding="utf-8") as f:
         return f.read()
 
-# 4. 构建分析链
-def build_analysis_chain(llm):
+# 3. 提取可达性、数据依赖与控制依赖信息
+# 数据/控制依赖优先使用批量提取（batch_extractor.py）预先得到的结果
+DATA_EXTRACTOR = with_prefetched("PDG-DATA", get_data_info)
+CTRL_EXTRACTOR = with_prefetched("PDG-CTRL", get_ctrl_info)
+
+def extract_dependency_context(program_name, mutant, llm=None, concurrent=False):
+    """返回(可达性路径条件组合, 数据依赖路径, 控制依赖路径)，concurrent为True时三条提取链并发执行"""
+    extractors = (get_reachability_path, DATA_EXTRACTOR, CTRL_EXTRACTOR)  # 三条提取链互不依赖
+    if not concurrent:
+        return tuple(extractor(program_name, mutant, llm) for extractor in extractors)
+
+    with ThreadPoolExecutor(max_workers=len(extractors)) as executor:
+        # 复制上下文，使提取阶段的span挂在当前变异体的span之下
+        futures = [executor.submit(contextvars.copy_context().run, extractor, program_name, mutant, llm)
+                   for extractor in extractors]
+        return tuple(future.result() for future in futures)
+
+def extract_dependency_paths(program_name, mutant, llm=None, concurrent=False):
+    """返回(数据依赖路径, 控制依赖路径)，供分级执行在可达性无法直接判定时按需提取"""
+    extractors = (DATA_EXTRACTOR, CTRL_EXTRACTOR)
+    if not concurrent:
+        return tuple(extractor(program_name, mutant, llm) for extractor in extractors)
 
-    template = """
+    with ThreadPoolExecutor(max_workers=len(extractors)) as executor:
+        # 复制上下文，使提取阶段的span挂在当前变异体的span之下
+        futures = [executor.submit(contextvars.copy_context().run, extractor, program_name, mutant, llm)
+                   for extractor in extractors]
+        return tuple(future.result() for future in futures)
+
+
+def unreachable_verdict(reachability_constraint):
+    """路径条件不可满足时直接给出的判定结果，格式与分析链输出一致"""
+    return (
+        "步骤[可达性]：\n"
+        f"说明理由：程序到变异语句前的路径条件组合为{reachability_constraint}，该条件组合逻辑上不可满足，"
+        "不存在能执行到变异语句的输入。\n"
+        "分析结论：变异语句不可达，满足不可达性，属于等价变异体，无需继续后续分析步骤。\n"
+        "最终结论：等价变异体判定结果：YES。"
+    )
+
+def solver_verdict(result, reachability_constraint):
+    """求解器给出确定结论（等价）时的判定结果，格式与分析链输出一致"""
+    if result["outcome"] == "unreachable":
+        return unreachable_verdict(reachability_constraint)
+    witness = f"（如 {result['model']}）" if result.get("model") else ""
+    return (
+        "步骤[可达性]：\n"
+        f"说明理由：程序到变异语句前的路径条件组合为{reachability_constraint}，该条件组合可满足{witness}。\n"
+        "分析结论：变异语句可达。\n"
+        "步骤[必要性]：\n"
+        f"说明理由：{result['reason']}，不存在使原表达式与变异表达式取值不同的输入。\n"
+        "分析结论：变异未改变程序状态，不满足必要性，属于等价变异体，无需继续后续分析步骤。\n"
+        "最终结论：等价变异体判定结果：YES。"
+    )
+
+# 4. 构建分析链
+# 判定提示词的静态部分（背景知识、判定步骤、少样本示例、输出格式）作为系统消息放在最前面，
+# 每个变异体的内容放在其后的用户消息中，使所有请求共享逐字节相同的前缀，可命中服务端的提示词前缀缓存
+JUDGE_SYSTEM_TEMPLATE = """
 ## 背景知识
 变异测试通过对程序源代码引入小幅语法修改模拟潜在缺陷。这些经过修改的程序版本称为变异体。等价变异体指与原程序语法不同，但语义相同的变异体，没有任何测试输入可以区分它们与原程序的行为差异。
 ## 等价变异体判定步骤
@@ -111,7 +178,15 @@ a > 0 && b > 0 && c > 0 && a != b && a != c && b != c
 5. 状态覆盖分析：
 基于前述分析，变异体满足可达性、必要性、数据依赖与控制依赖路径均存在，且变异体造成的程序状态改变均可直接传递至输出，不存在状态覆盖现象，故该变异体属于非等价变异体。
 结论：等价变异体判定结果：NO。
-## 待识别变异体信息
+## 输出格式要求
+每个步骤输出如下：
+步骤[name]：
+说明理由： 
+分析结论： 
+……
+最终结论：等价变异体判定结果：YES或等价变异体判定结果：NO。
+"""
+JUDGE_HUMAN_TEMPLATE = """## 待识别变异体信息
 请基于以下信息与分析步骤判断该变异体是否为等价变异体，并输出每步分析与结论。
 注意：若某一步已足以判断该变异体为等价变异体，则不再继续后续分析步骤，直接给出最终结论。
 原程序：
@@ -124,76 +199,161 @@ a > 0 && b > 0 && c > 0 && a != b && a != c && b != c
 4. 控制依赖：变异语句到输出语句的控制依赖路径为{CTRL_DEPENDENCY}，请分析变异语句是否通过控制流影响输出语句。
 5. 状态覆盖：请结合以上信息与分析结论，分析变异引入的错误状态是否在后续执行中被修正或抵消，从而导致程序最终输出未受影响。
 ## 注意：删除类型的变异算子是针对原程序的删除，而非对变异语句的删除。
-## 输出格式要求
-每个步骤输出如下：
-步骤[name]：
-说明理由： 
-分析结论： 
-……
-最终结论：等价变异体判定结果：YES或等价变异体判定结果：NO。
 """
+JUDGE_SYSTEM_PROMPT = JUDGE_SYSTEM_TEMPLATE.format(
+    example1_program=EXAMPLE1_PROGRAM, example1_mutant=EXAMPLE1_MUTANT,
+    example2_program=EXAMPLE2_PROGRAM, example2_mutant=EXAMPLE2_MUTANT)
 
-    prompt = PromptTemplate.from_template(template)
 
-    return (
-            {
-                "example1_program": RunnablePassthrough(),
-                "example1_mutant": RunnablePassthrough(),
-                "example2_program": RunnablePassthrough(),
-                "example2_mutant": RunnablePassthrough(),
-                "PROGRAM": RunnablePassthrough(),
-                "MUTANT_INFORMATION": RunnablePassthrough(),
-                "REACHABILITY_CONSTRAINT": RunnablePassthrough(),
-                "DIFFERENCE": RunnablePassthrough(),
-                "DATA_DEPENDENCY": RunnablePassthrough(),
-                "CTRL_DEPENDENCY": RunnablePassthrough(),
-            }
-            | prompt
-            | llm
-    )
+def compile_judge_prompt(compact=False):
+    """系统消息为固定文本（不做模板替换），精简模式的附加要求并入系统消息，仍是固定前缀"""
+    system_prompt = JUDGE_SYSTEM_PROMPT + (COMPACT_INSTRUCTION if compact else "")
+    return ChatPromptTemplate.from_messages([SystemMessage(content=system_prompt), ("human", JUDGE_HUMAN_TEMPLATE)])
+
+
+# 提示词模板在导入时编译一次，之后每个变异体直接复用
+JUDGE_PROMPTS = {False: compile_judge_prompt(False), True: compile_judge_prompt(True)}
+
+
+def build_analysis_chain(llm, compact=False):
+    return RunnableLambda(tracing.traced("prompt")(JUDGE_PROMPTS[compact].invoke)) | llm
+
+
+def run_judge(llm, inputs, mutant_id, stream=False, early_stop=True, compact=False,
+              max_output_tokens=COMPACT_MAX_TOKENS):
+    """执行分析链并返回判定文本
+
+    stream为True时流式读取输出并记录得出结论的耗时与输出token数，early_stop为True时在结论出现后立即结束；
+    compact为True时要求精简输出并限制输出token数，预算内未给出结论时改用完整模式重新分析。
+    """
+    judge_llm = VerdictStreamingChatModel(llm=llm, early_stop=early_stop) if stream else llm
+    if compact and max_output_tokens:
+        judge_llm = judge_llm.bind(max_tokens=max_output_tokens)
+
+    with tracing.span("judge"):
+        result = build_analysis_chain(judge_llm, compact).invoke(inputs)
+    if stream:
+        metadata = result.response_metadata
+        logging.info(f"变异体 {mutant_id} 判定链: 首个输出耗时: {metadata.get('time_to_first_token')} 秒, "
+                     f"得出结论耗时: {metadata.get('time_to_verdict')} 秒, "
+                     f"生成耗时: {metadata.get('generation_seconds')} 秒, 输出token数: {metadata.get('output_tokens')}, "
+                     f"提前结束: {metadata.get('early_stopped')}")
+    usage = tracing.usage_from_message(result)
+    if usage:
+        logging.info(f"变异体 {mutant_id} 判定链: 输入token数: {usage[0]}, 命中前缀缓存: {usage[2]}, 输出token数: {usage[1]}")
+    if compact and parse_verdict(result.content) is None:
+        logging.info(f"变异体 {mutant_id} 精简模式未在输出预算内给出结论，改用完整模式重新分析")
+        return run_judge(llm, inputs, mutant_id, stream, early_stop)
+    return result.content
 
 
 # 5. 主函数
-def analyze_mutant(program_path, mutant):
-    # 加载配置
-    config = load_config()
-
-    # 初始化LLM
-    llm = ChatOpenAI(
-        api_key=config["deepseek-v3"]["api_key"],
-        base_url=config["deepseek-v3"]["base_url"],
-        model=config["deepseek-v3"]["model"],
-        # api_key=config["gpt-3.5-turbo"]["api_key"],
-        # base_url=config["gpt-3.5-turbo"]["base_url"],
-        # model="gpt-3.5-turbo",
-        temperature=0
-    )
+def tracing_llm(llm=None):
+    """未注入时使用进程内共享的客户端；各阶段的实际LLM请求按token用量记入当前span"""
+    if llm is None:
+        llm = get_llm("deepseek-v3")
+        # llm = get_llm("gpt-3.5-turbo")
+    return llm if isinstance(llm, TracingChatModel) else TracingChatModel(llm=llm)
 
-    # 提取数据
-    program_code = extract_program_code(program_path)
 
+def analyze_mutant(program_path, mutant, llm=None, concurrent=False, cascade=False, solver=False,
+                   stream=False, early_stop=True, compact=False, cheap_llm=None):
+    """cascade为True时分级执行：先提取可达性，图引擎得出的可靠路径条件不可满足时直接判定为等价变异体，
+    否则（包括LLM提取的路径条件）再提取数据依赖与控制依赖并调用分析链；
+    solver为True时（隐含cascade）在提取依赖之前先用SMT求解器检查不可达性与非必要性，能确定时不再调用LLM；
+    stream/early_stop/compact控制判定链的流式读取、结论出现后提前结束与精简输出（见run_judge）；
+    传入cheap_llm时分级判定：先由便宜模型多次采样，结论不一致时才交给llm判定（见model_cascade.py）"""
+    # 同一LLM同时用于三条提取链与分析链
+    llm = tracing_llm(llm)
+    if cheap_llm is not None:
+        cheap_llm = tracing_llm(cheap_llm)
+
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    with tracing.span("mutant", program=program_name, mutant_id=mutant["mutant_id"]):
+        artifact = _extract_artifact(program_path, program_name, mutant, llm, concurrent, cascade, solver)
+        return _judge_artifact(program_path, program_name, mutant, artifact, llm, stream, early_stop, compact,
+                               cheap_llm)
+
+
+def extract_mutant(program_path, mutant, llm=None, concurrent=False, cascade=False, solver=False):
+    """提取阶段：只提取可达性与数据/控制依赖，返回提取产物（见_extract_artifact），不调用分析链"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    with tracing.span("extract_stage", program=program_name, mutant_id=mutant["mutant_id"]):
+        return _extract_artifact(program_path, program_name, mutant, tracing_llm(llm), concurrent, cascade, solver)
+
+
+def judge_mutant(program_path, mutant, artifact, llm=None, stream=False, early_stop=True, compact=False,
+                 cheap_llm=None):
+    """判定阶段：用已有的提取产物调用分析链，不再运行提取链；产物中已有结论（分级执行）时直接返回"""
     program_name = os.path.splitext(os.path.basename(program_path))[0]
+    with tracing.span("judge_stage", program=program_name, mutant_id=mutant["mutant_id"]):
+        return _judge_artifact(program_path, program_name, mutant, artifact, tracing_llm(llm), stream, early_stop,
+                               compact, tracing_llm(cheap_llm) if cheap_llm is not None else None)
 
-    # 假设这些是从其他模块获取的结果
-    reachability_constraint = get_reachability_path(program_name, mutant)  # 来自reachability_extractor.py
-    data_dependency = get_data_info(program_name, mutant)  # 来自data_extractor.py
-    ctrl_dependency = get_ctrl_info(program_name, mutant)  # 来自ctrl_extractor.py
+
+def solver_data_graph(program_name, mutant):
+    """求解器用于确认路径条件在变异点处仍成立的数据依赖图（变异体的PDG-DATA），图文件缺失时返回None"""
+    try:
+        return get_graph_store().get_program_graph(program_name, mutant["mutant_id"], "PDG-DATA")
+    except OSError:
+        return None
+
+
+def _extract_artifact(program_path, program_name, mutant, llm, concurrent, cascade, solver):
+    """返回提取产物 {"reachability", "data", "ctrl", "verdict", "verdict_source"}；
+    分级执行在可达性或求解器阶段已得出结论时verdict为判定文本，不再提取数据/控制依赖"""
+    artifact = {"reachability": None, "data": None, "ctrl": None, "verdict": None, "verdict_source": None}
+
+    # 可达性来自reachability_extractor.py，数据依赖来自data_extractor.py，控制依赖来自ctrl_extractor.py
+    if cascade or solver:
+        counting_llm = CountingChatModel(llm=llm)
+        reachability_constraint = get_reachability_path(program_name, mutant, counting_llm)
+        artifact["reachability"] = reachability_constraint
+        # 只有图引擎得出的可靠条件组合（文字中的变量到变异点前未被重新赋值）才能直接判定不可达
+        sound = is_sound_reachability(program_name, mutant, reachability_constraint)
+        if solver:
+            with tracing.span("solver"):
+                solver_result = smt_checker.check_mutant(extract_program_code(program_path), mutant,
+                                                         reachability_constraint,
+                                                         data_graph=solver_data_graph(program_name, mutant),
+                                                         sound=sound, in_loop=is_loop_mutant(program_name, mutant))
+            smt_checker.record_result(solver_result, counting_llm.calls)
+            logging.info(f"变异体 {mutant['mutant_id']} 求解器结果: {solver_result['outcome']}, "
+                         f"耗时: {solver_result['seconds']:.4f} 秒" +
+                         (f", 反例: {solver_result['model']}" if solver_result["outcome"] == "distinguishable" else ""))
+            if solver_result["verdict"]:
+                logging.info(f"变异体 {mutant['mutant_id']} 的判定结论来自: 求解器")
+                return dict(artifact, verdict=solver_verdict(solver_result, reachability_constraint),
+                            verdict_source="solver")
+        if sound and is_unsatisfiable(reachability_constraint):
+            logging.info(f"变异体 {mutant['mutant_id']} 的判定结论来自: 可达性阶段")
+            return dict(artifact, verdict=unreachable_verdict(reachability_constraint), verdict_source="reachability")
+        artifact["data"], artifact["ctrl"] = extract_dependency_paths(program_name, mutant, llm, concurrent)
+        logging.info(f"变异体 {mutant['mutant_id']} 的判定结论来自: 分析链")
+    else:
+        # concurrent为True时三条提取链并发执行，仅最终分析链等待其全部完成
+        artifact["reachability"], artifact["data"], artifact["ctrl"] = extract_dependency_context(
+            program_name, mutant, llm, concurrent)
+    return artifact
+
+
+def _judge_artifact(program_path, program_name, mutant, artifact, llm, stream, early_stop, compact, cheap_llm=None):
+    if artifact.get("verdict"):
+        return artifact["verdict"]
 
     # 构建并执行分析链
-    analysis_chain = build_analysis_chain(llm)
-    result = analysis_chain.invoke({
-        "example1_program": EXAMPLE1_PROGRAM,
-        "example1_mutant": EXAMPLE1_MUTANT,
-        "example2_program": EXAMPLE2_PROGRAM,
-        "example2_mutant": EXAMPLE2_MUTANT,
-        "PROGRAM": program_code,
+    inputs = {
+        "PROGRAM": extract_program_code(program_path),
         "MUTANT_INFORMATION": json.dumps(mutant, indent=2),
-        "REACHABILITY_CONSTRAINT": reachability_constraint,
+        "REACHABILITY_CONSTRAINT": artifact["reachability"],
         "DIFFERENCE": mutant["difference"],
-        "DATA_DEPENDENCY": data_dependency,
-        "CTRL_DEPENDENCY": ctrl_dependency,
-    })
-    return result.content
+        "DATA_DEPENDENCY": artifact["data"],
+        "CTRL_DEPENDENCY": artifact["ctrl"],
+    }
+    if cheap_llm is not None:
+        return tiered_judge(cheap_llm, llm, inputs, mutant["mutant_id"], program_name,
+                            stream=stream, early_stop=early_stop, compact=compact)
+    return run_judge(llm, inputs, mutant["mutant_id"], stream, early_stop, compact)
 
 '''
 if __name__ == "__main__":
@@ -0,0 +1,239 @@
+# coding=utf-8
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from prompt_stage import BATCH_END, BATCH_HEADER, batch_mutant_ids, detect_stage
+from token_counter import count_tokens
+
+_count_lock = threading.Lock()
+
+# 各阶段的默认应答（按提示词关键字路由）
+DEFAULT_RESPONSES = {
+    "judge": "步骤[可达性]：\n说明理由：路径条件可满足。\n分析结论：变异语句可达。\n\n最终结论：等价变异体判定结果：NO。",
+    "reachability": "可达性路径条件组合: NULL",
+    "data": "变异影响的变量为：a\n变量a的数据依赖路径:\n1. (line 1: return a)",
+    "ctrl": "控制依赖路径信息：\n1. (1: return a)",
+}
+
+
+def batched_response(prompt_text, content):
+    """批量提取提示词按变异体分隔行逐个应答，其余提示词原样返回"""
+    mutant_ids = batch_mutant_ids(prompt_text)
+    if not mutant_ids:
+        return content
+    return "\n".join(f"{BATCH_HEADER}{mutant_id}\n{content}" for mutant_id in mutant_ids) + f"\n{BATCH_END}"
+
+
+class FakeLLMError(RuntimeError):
+    """伪模型注入的服务端错误，status_code与HTTP错误一致，可被resilient_llm识别为可重试错误"""
+
+    def __init__(self, status_code):
+        super().__init__(f"injected {status_code}")
+        self.status_code = status_code
+
+
+class FakeChatModel(BaseChatModel):
+    """本地伪聊天模型：按阶段返回固定应答，并注入可配置的延迟，用于离线测试流水线
+
+    延迟 = 基础延迟 × 对数正态因子(sigma) + 均匀抖动 + 输出token数 / tokens_per_second；
+    sigma>0时延迟呈长尾分布（中位数为基础延迟）。error_rate为注入错误（error_status）的概率。
+    """
+
+    latency: float = 0.0  # 每次调用的基础延迟（秒）
+    jitter: float = 0.0  # 在基础延迟上叠加的均匀随机抖动（秒）
+    sigma: float = 0.0  # 对数正态分布的形状参数，0表示固定延迟
+    tokens_per_second: float = 0.0  # 输出速率，0表示不按输出长度计时
+    error_rate: float = 0.0
+    error_status: int = 503
+    stage_latency: dict = {}  # 按阶段覆盖基础延迟，如 {"judge": 2.0}
+    responses: dict = {}  # 按阶段覆盖默认应答
+    call_count: int = 0
+    chunk_size: int = 8  # 流式输出时每块的字符数，延迟按块均摊
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def _respond(self, messages):
+        """返回(应答文本, 本次调用的总延迟)"""
+        prompt_text = "\n".join(str(message.content) for message in messages)
+        stage = detect_stage(prompt_text)
+        delay = self.stage_latency.get(stage, self.latency)
+        if self.sigma:
+            delay *= random.lognormvariate(0, self.sigma)
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        with _count_lock:
+            self.call_count += 1  # 多个提取链/变异体并发调用同一伪模型
+        if self.error_rate and random.random() < self.error_rate:
+            time.sleep(delay)
+            raise FakeLLMError(self.error_status)
+        content = batched_response(prompt_text, self.responses.get(stage, DEFAULT_RESPONSES[stage]))
+        if self.tokens_per_second:
+            delay += count_tokens(content) / self.tokens_per_second
+        return content, delay
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content, delay = self._respond(messages)
+        if delay > 0:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        content, delay = self._respond(messages)
+        pieces = [content[index:index + self.chunk_size] for index in range(0, len(content), self.chunk_size)]
+        for piece in pieces:
+            if delay > 0:
+                time.sleep(delay / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI兼容的/chat/completions接口，支持普通与流式(SSE)应答"""
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        action, delay = fake.next_action()
+        if delay > 0:
+            time.sleep(delay)
+        if action != "ok":
+            self._send_json(int(action), {"error": {"message": f"injected {action}", "type": "fake_error"}},
+                            {"Retry-After": str(fake.retry_after)} if action == "429" and fake.retry_after else {})
+            return
+
+        prompt_text = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        content = batched_response(prompt_text, fake.responses.get(detect_stage(prompt_text),
+                                                                   DEFAULT_RESPONSES[detect_stage(prompt_text)]))
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt_text), "completion_tokens": len(content),
+                          "total_tokens": len(prompt_text) + len(content)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [content[index:index + fake.chunk_size] for index in range(0, len(content), fake.chunk_size)]
+        try:
+            for index, piece in enumerate(pieces + [None]):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": piece} if piece else {},
+                                                      "finish_reason": None if piece else "stop"}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if piece and fake.chunk_latency:
+                    time.sleep(fake.chunk_latency)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            fake.count("cancelled")  # 客户端提前关闭了流
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer:
+    """本地伪OpenAI服务：按配置注入延迟、慢响应与429/5xx错误，用于测试重试、超时、熔断与对冲请求
+
+    script为按请求顺序执行的动作列表（"ok"、"slow"或状态码如"429"），用完后按error_rate/slow_rate随机注入。
+    用法：with FakeOpenAIServer(error_rate=0.2) as server: ChatOpenAI(base_url=server.url, api_key="fake", model="fake")
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, slow_rate=0.0, slow_latency=5.0,
+                 retry_after=None, script=None, responses=None, chunk_size=8, chunk_latency=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.retry_after = retry_after
+        self.script = list(script or [])
+        self.responses = responses or {}
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0, "slow": 0, "cancelled": 0}
+        self.httpd = None
+        self.thread = None
+
+    def next_action(self):
+        """返回(动作, 延迟)"""
+        with self.lock:
+            self.counters["requests"] += 1
+            action = self.script.pop(0) if self.script else None
+            if action is None:
+                roll = self.random.random()
+                action = str(self.error_status) if roll < self.error_rate else \
+                    "slow" if roll < self.error_rate + self.slow_rate else "ok"
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            if action == "slow":
+                self.counters["slow"] += 1
+                return "ok", self.slow_latency
+            if action != "ok":
+                self.counters["errors"] += 1
+            return action, delay
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+'''
+if __name__ == "__main__":
+    from emd_analysis import analyze_mutant
+
+    # 三条提取链各耗时1秒、判定耗时1秒，并发模式下单个变异体约2秒
+    fake_llm = FakeChatModel(latency=1.0)
+    start_time = time.time()
+    result = analyze_mutant("/Users/swan/bishe/progex_benchmark/mutantbench/mutantjava/mutantjavadiv/Triangle.java",
+                            {"mutant_id": "MUT_004",
+                             "difference": "@@ -44 +44 @@\\n-            if (trian == 2 && a + c > b) {\\n+            if (a + c > b) {",
+                             "operator": "null"},
+                            llm=fake_llm, concurrent=True)
+    print(result, f"耗时: {time.time() - start_time:.4f} 秒")
+'''
@@ -0,0 +1,103 @@
+# coding=utf-8
+import json
+import logging
+import threading
+from collections import deque
+from program_graph import ProgramGraph, is_output_node, parse_mutated_line
+from token_counter import count_tokens
+
+# 提示词压缩方式：None为原样嵌入完整图，slice为按依赖方向切片，khop为变异节点周围k跳邻域
+# 默认不压缩：压缩后的判定准确率未经result_compare.equivalence_accuracy验证前需显式开启（--prompt-compaction）
+PROMPT_COMPACTION = None
+KHOP_HOPS = 2
+
+_lock = threading.Lock()
+_totals = {}  # 图类型 -> {"calls", "tokens_before", "tokens_after"}
+
+
+def reachable(graph, starts, forward=True, max_hops=None):
+    """沿出边（或入边）做BFS，返回可达节点集合（含起点）"""
+    seen = set(starts)
+    queue = deque((node_id, 0) for node_id in starts)
+    while queue:
+        node_id, hops = queue.popleft()
+        if max_hops is not None and hops >= max_hops:
+            continue
+        edges = graph.out_edges.get(node_id, []) if forward else graph.in_edges.get(node_id, [])
+        for edge in edges:
+            neighbour = edge["target"] if forward else edge["source"]
+            if neighbour not in seen:
+                seen.add(neighbour)
+                queue.append((neighbour, hops + 1))
+    return seen
+
+
+def relevant_nodes(graph, kind, targets, method="slice", hops=KHOP_HOPS):
+    """与变异语句相关的节点：
+
+    CFG只保留能到达变异节点的前驱（可达性只取决于变异点之前的语句）；
+    PDG-DATA保留前向切片与变异节点的直接定义来源；PDG-CTRL保留前向切片、控制祖先及祖先直接控制的输出语句。
+    """
+    if method == "khop":
+        return reachable(graph, targets, True, hops) | reachable(graph, targets, False, hops)
+    if kind == "CFG":
+        return reachable(graph, targets, forward=False)
+    if kind == "PDG-DATA":
+        return reachable(graph, targets) | reachable(graph, targets, False, max_hops=1)
+    ancestors = reachable(graph, targets, forward=False)
+    outputs = {edge["target"] for node_id in ancestors for edge in graph.out_edges.get(node_id, [])
+               if is_output_node(graph.nodes[edge["target"]])}
+    return reachable(graph, targets) | ancestors | outputs
+
+
+def compact_graph(graph_info, kind, difference, method="slice"):
+    """裁剪到与变异相关的子图并去掉边id；无法定位变异节点时只做序列化压缩"""
+    line = parse_mutated_line(difference)
+    return compact_to_lines(graph_info, kind, [line] if line is not None else [], method)
+
+
+def compact_to_lines(graph_info, kind, lines, method="slice"):
+    """裁剪到与若干行相关的子图的并集（批量提取时多个变异体共用一张图）；没有可定位的节点时只做序列化压缩"""
+    graph = graph_info if isinstance(graph_info, ProgramGraph) else ProgramGraph(graph_info)
+    info = graph.info
+    targets = [node_id for line in lines for node_id in graph.nodes_at_line(line)]
+    keep = relevant_nodes(graph, kind, targets, method) if targets else set(graph.nodes)
+
+    compacted = {key: value for key, value in info.items() if key not in ("nodes", "edges", "directed", "multigraph")}
+    compacted["nodes"] = [node for node in info.get("nodes", []) if node["id"] in keep]
+    compacted["edges"] = [{key: value for key, value in edge.items() if key != "id"}
+                          for edge in info.get("edges", []) if edge["source"] in keep and edge["target"] in keep]
+    return compacted
+
+
+def serialize_compact(graph_json):
+    """紧凑序列化：无缩进、无多余空格、不转义中文"""
+    return json.dumps(graph_json, ensure_ascii=False, separators=(",", ":"))
+
+
+def compaction_tokens(full_text, compact_text):
+    """压缩前后的token数；调用方应与提示词片段一起记忆，避免每次调用重复分词"""
+    return count_tokens(full_text), count_tokens(compact_text)
+
+
+def record_compaction(kind, mutant_id, before, after):
+    """把单次调用压缩前后的token数累计到全局统计"""
+    with _lock:
+        totals = _totals.setdefault(kind, {"calls": 0, "tokens_before": 0, "tokens_after": 0})
+        totals["calls"] += 1
+        totals["tokens_before"] += before
+        totals["tokens_after"] += after
+    # 每次调用一行，只在DEBUG级别输出，避免淹没结果日志；汇总见compaction_report
+    logging.debug(f"提示词压缩[{kind}] 变异体 {mutant_id}: {before} -> {after} tokens")
+    return before, after
+
+
+def compaction_report():
+    """按图类型汇总的压缩效果"""
+    with _lock:
+        report = {}
+        for kind, totals in _totals.items():
+            saved = totals["tokens_before"] - totals["tokens_after"]
+            report[kind] = dict(totals, saved_ratio=round(saved / totals["tokens_before"], 4)
+                                if totals["tokens_before"] else 0.0)
+        return report
@@ -0,0 +1,289 @@
+# coding=utf-8
+import difflib
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import graph_compaction
+from program_graph import ProgramGraph
+
+MUTANT_PROGRAMS_DIR = r"/Users/swan/bishe/progex_benchmark/mutant_programs"
+DELTA_CACHE_DIR = r"/Users/swan/bishe/LLM4EMD/cache/graph_deltas"
+
+# 图类型：CFG、PDG-DATA、PDG-CTRL
+GRAPH_KINDS = ("CFG", "PDG-DATA", "PDG-CTRL")
+
+# 物化后的变异体图、索引与序列化提示词片段的内存上限（条目数）
+MEMO_SIZE = 256
+
+
+def mutant_dir_name(mutant_id):
+    """MUT_001 -> mutant_001"""
+    return f"mutant_{mutant_id.split('_')[-1].zfill(3)}"
+
+
+def mutant_graph_path(program_name, mutant_id, kind, base_dir=MUTANT_PROGRAMS_DIR):
+    return os.path.join(base_dir, program_name, "mutants", mutant_dir_name(mutant_id), "outdir",
+                        f"{program_name}-{kind}.json")
+
+
+def base_graph_path(program_name, kind, base_dir=MUTANT_PROGRAMS_DIR):
+    """原程序的图；不存在时以编号最小的变异体的图作为基准"""
+    path = os.path.join(base_dir, program_name, "outdir", f"{program_name}-{kind}.json")
+    if os.path.exists(path):
+        return path
+    candidates = sorted(glob.glob(os.path.join(base_dir, program_name, "mutants", "mutant_*", "outdir",
+                                               f"{program_name}-{kind}.json")))
+    return candidates[0] if candidates else None
+
+
+def canonical(item):
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def diff_sequence(base_items, items):
+    """有序差量：[(起, 止, 替换内容)]，应用后与items逐项相同"""
+    matcher = difflib.SequenceMatcher(None, [canonical(item) for item in base_items],
+                                      [canonical(item) for item in items], autojunk=False)
+    return [[i1, i2, items[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_sequence(base_items, operations):
+    result, cursor = [], 0
+    for start, end, replacement in operations:
+        result.extend(base_items[cursor:start])
+        result.extend(replacement)
+        cursor = end
+    result.extend(base_items[cursor:])
+    return result
+
+
+def compute_delta(base, graph):
+    """变异体图相对基准图的差量：顶层字段差异 + 节点与边的有序替换"""
+    meta = {key: value for key, value in graph.items() if key not in ("nodes", "edges") and base.get(key) != value}
+    removed = [key for key in base if key not in graph]
+    return {
+        "meta": meta,
+        "removed": removed,
+        "nodes": diff_sequence(base.get("nodes", []), graph.get("nodes", [])),
+        "edges": diff_sequence(base.get("edges", []), graph.get("edges", [])),
+    }
+
+
+def apply_delta(base, delta):
+    graph = {key: value for key, value in base.items() if key not in delta["removed"]}
+    graph.update(delta["meta"])
+    graph["nodes"] = apply_sequence(base.get("nodes", []), delta["nodes"])
+    graph["edges"] = apply_sequence(base.get("edges", []), delta["edges"])
+    return graph
+
+
+class GraphStore:
+    """按程序缓存图文件：每个程序的基准图只解析一次，变异体图以相对基准图的差量保存在内存与磁盘
+
+    首次访问某变异体时解析其JSON并写出差量文件，之后（包括后续进程）只需读取小得多的差量并应用；
+    序列化后的提示词片段与图索引按LRU记忆，避免每次调用重复json.dumps。
+    """
+
+    def __init__(self, base_dir=MUTANT_PROGRAMS_DIR, delta_dir=DELTA_CACHE_DIR, memo_size=MEMO_SIZE):
+        self.base_dir = base_dir
+        self.delta_dir = delta_dir
+        self.memo_size = memo_size
+        self.lock = threading.RLock()
+        self.bases = {}  # (program, kind) -> (基准图, 指纹)
+        self.deltas = {}  # (program, kind, mutant_id) -> 差量
+        self.memo = OrderedDict()  # (类别, program, kind, mutant_id) -> 物化图/索引/片段
+        self.loading = {}  # (表, 键) -> 正在加载的Future，同一基准图/差量只加载一次
+        self.stats_counter = {
+            "base_loads": 0, "base_load_seconds": 0.0,
+            "full_parses": 0, "full_parse_seconds": 0.0,
+            "delta_file_loads": 0, "delta_file_seconds": 0.0,
+            "delta_applies": 0, "delta_apply_seconds": 0.0,
+            "memo_hits": 0, "memo_misses": 0,
+        }
+
+    def _load_once(self, table_name, key, load):
+        """返回self.<table_name>[key]，不存在时调用load()加载：加载在锁外进行，不同程序/变异体的首次加载可以并行，
+        同一键的并发请求等待首个线程的结果；锁只用于查表与发布结果"""
+        table = getattr(self, table_name)
+        with self.lock:
+            if key in table:
+                return table[key]
+            future = self.loading.get((table_name, key))
+            owner = future is None
+            if owner:
+                future = self.loading[(table_name, key)] = Future()
+        if not owner:
+            return future.result()
+        try:
+            value = load()
+        except BaseException as e:
+            with self.lock:
+                del self.loading[(table_name, key)]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            table[key] = value
+            del self.loading[(table_name, key)]
+        future.set_result(value)
+        return value
+
+    def _count(self, name, seconds_name=None, seconds=0.0):
+        with self.lock:
+            self.stats_counter[name] += 1
+            if seconds_name:
+                self.stats_counter[seconds_name] += seconds
+
+    def get_base(self, program_name, kind):
+        """返回(基准图, 基准图指纹)，每个程序每种图只解析一次"""
+        def load():
+            path = base_graph_path(program_name, kind, self.base_dir)
+            if path is None:
+                raise FileNotFoundError(f"未找到程序 {program_name} 的 {kind} 图")
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                raw = f.read()
+            base = (json.loads(raw), hashlib.sha256(raw).hexdigest())
+            self._count("base_loads", "base_load_seconds", time.perf_counter() - start)
+            return base
+
+        return self._load_once("bases", (program_name, kind), load)
+
+    def base_fingerprint(self, program_name, kind):
+        return self.get_base(program_name, kind)[1]
+
+    def _delta_file(self, program_name, kind, mutant_id):
+        return os.path.join(self.delta_dir, program_name, kind, f"{mutant_dir_name(mutant_id)}.json")
+
+    def _load_delta(self, program_name, kind, mutant_id):
+        """读取差量：优先使用与源文件(大小, 修改时间)及基准指纹一致的差量文件，否则解析完整JSON并生成差量"""
+        base, fingerprint = self.get_base(program_name, kind)
+        source = mutant_graph_path(program_name, mutant_id, kind, self.base_dir)
+        stat = os.stat(source)
+        signature = {"size": stat.st_size, "mtime": stat.st_mtime, "base": fingerprint}
+        delta_file = self._delta_file(program_name, kind, mutant_id)
+
+        if os.path.exists(delta_file):
+            start = time.perf_counter()
+            try:
+                with open(delta_file, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                record = {}  # 差量文件截断或损坏时按源文件重新生成
+            self._count("delta_file_loads", "delta_file_seconds", time.perf_counter() - start)
+            if isinstance(record, dict) and record.get("signature") == signature:
+                return record["delta"]
+
+        start = time.perf_counter()
+        with open(source, "r", encoding="utf-8") as f:
+            graph = json.load(f)
+        self._count("full_parses", "full_parse_seconds", time.perf_counter() - start)
+        delta = compute_delta(base, graph)
+        if apply_delta(base, delta) != graph:  # 理论上不会发生，保底存完整图
+            delta = {"meta": graph, "removed": [], "nodes": [[0, len(base.get("nodes", [])), graph.get("nodes", [])]],
+                     "edges": [[0, len(base.get("edges", [])), graph.get("edges", [])]]}
+        # 先写同目录下的临时文件再原子替换，崩溃或其他进程并发写入时不会留下半截的差量文件
+        temp_file = f"{delta_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(delta_file), exist_ok=True)
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"signature": signature, "delta": delta}, f, ensure_ascii=False)
+            os.replace(temp_file, delta_file)
+        except OSError:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+            # 差量文件只是加速手段，写入失败不影响结果
+        return delta
+
+    def _memoized(self, key, build):
+        with self.lock:
+            if key in self.memo:
+                self.memo.move_to_end(key)
+                self.stats_counter["memo_hits"] += 1
+                return self.memo[key]
+        value = build()
+        with self.lock:
+            self.stats_counter["memo_misses"] += 1
+            self.memo[key] = value
+            while len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        return value
+
+    def get_graph(self, program_name, mutant_id, kind):
+        """返回变异体图的JSON对象（与直接json.load该变异体文件的结果相同）"""
+        def build():
+            delta = self._load_once("deltas", (program_name, kind, mutant_id),
+                                    lambda: self._load_delta(program_name, kind, mutant_id))
+            base = self.get_base(program_name, kind)[0]
+            start = time.perf_counter()
+            graph = apply_delta(base, delta)
+            self._count("delta_applies", "delta_apply_seconds", time.perf_counter() - start)
+            return graph
+
+        return self._memoized(("graph", program_name, kind, mutant_id), build)
+
+    def get_program_graph(self, program_name, mutant_id, kind):
+        """返回建好索引的ProgramGraph，供本地图算法使用"""
+        return self._memoized(("index", program_name, kind, mutant_id),
+                              lambda: ProgramGraph(self.get_graph(program_name, mutant_id, kind)))
+
+    def prompt_fragment(self, program_name, mutant_id, kind, difference=None):
+        """返回嵌入提示词的图文本，同一变异体只序列化一次
+
+        传入变异体diff且启用了提示词压缩时，返回裁剪到相关子图的紧凑序列化文本，并记录压缩前后的token数
+        （token数与片段一起记忆，每个变异体只分词一次）；
+        否则返回原样的json.dumps(indent=2)。
+        """
+        full_text = self._memoized(("fragment", program_name, kind, mutant_id),
+                                   lambda: json.dumps(self.get_graph(program_name, mutant_id, kind), indent=2))
+        method = graph_compaction.PROMPT_COMPACTION
+        if difference is None or not method:
+            return full_text
+
+        compact_text = self._memoized(
+            ("fragment", program_name, kind, mutant_id, method),
+            lambda: graph_compaction.serialize_compact(graph_compaction.compact_graph(
+                self.get_program_graph(program_name, mutant_id, kind), kind, difference, method)))
+        before, after = self._memoized(("fragment_tokens", program_name, kind, mutant_id, method),
+                                       lambda: graph_compaction.compaction_tokens(full_text, compact_text))
+        graph_compaction.record_compaction(kind, mutant_id, before, after)
+        return compact_text
+
+    def stats(self):
+        """加载耗时与内存占用统计（内存按JSON序列化后的字节数估算）"""
+        with self.lock:
+            stats = dict(self.stats_counter)
+            stats["bases"] = len(self.bases)
+            stats["deltas"] = len(self.deltas)
+            stats["memo_entries"] = len(self.memo)
+            stats["base_bytes"] = sum(len(canonical(base)) for base, _ in self.bases.values())
+            stats["delta_bytes"] = sum(len(canonical(delta)) for delta in self.deltas.values())
+            stats["fragment_bytes"] = sum(len(value) for key, value in self.memo.items() if key[0] == "fragment")
+        return stats
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_graph_store():
+    """进程内共享的图缓存"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = GraphStore()
+        return _default_store
+
+
+def set_graph_store(store):
+    """替换进程内共享的图缓存（如离线基准改用随仓库提供的图），返回原来的图缓存"""
+    global _default_store
+    with _default_store_lock:
+        previous, _default_store = _default_store, store
+        return previous
@@ -0,0 +1,190 @@
+# coding=utf-8
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import ctrl_extractor
+import data_extractor
+import emd_analysis
+import graph_compaction
+import reachability_extractor
+import tracing
+from artifact_store import model_identity, save_artifact, sha256_text
+from batch_runner import run_mutants
+from emd_analysis import extract_mutant, judge_mutant, tracing_llm
+from graph_store import base_graph_path, mutant_graph_path
+
+# 每个变异体结果的组成部分：三条提取链与判定链，按依赖顺序排列
+EXTRACTION_COMPONENTS = ("reachability", "data", "ctrl")
+COMPONENTS = EXTRACTION_COMPONENTS + ("judge",)
+
+# 各提取链读取的图（数据依赖切片同时使用控制依赖图）、提示词与提取方式，运行时读取各模块当前的值
+COMPONENT_GRAPHS = {"reachability": ("CFG",), "data": ("PDG-DATA", "PDG-CTRL"), "ctrl": ("PDG-CTRL",)}
+COMPONENT_PROMPTS = {
+    "reachability": lambda: (reachability_extractor.REACHABILITY_SYSTEM_PROMPT,
+                             reachability_extractor.REACHABILITY_HUMAN_TEMPLATE),
+    "data": lambda: (data_extractor.DATA_SYSTEM_PROMPT, data_extractor.DATA_HUMAN_TEMPLATE),
+    "ctrl": lambda: (ctrl_extractor.CTRL_SYSTEM_PROMPT, ctrl_extractor.CTRL_HUMAN_TEMPLATE),
+}
+COMPONENT_MODES = {
+    "reachability": lambda: reachability_extractor.REACHABILITY_MODE,
+    "data": lambda: data_extractor.DATA_MODE,
+    "ctrl": lambda: ctrl_extractor.CTRL_MODE,
+}
+COMPONENT_EXTRACTORS = {
+    "reachability": reachability_extractor.get_reachability_path,
+    "data": emd_analysis.DATA_EXTRACTOR,
+    "ctrl": emd_analysis.CTRL_EXTRACTOR,
+}
+
+_file_lock = threading.Lock()
+_file_hashes = {}
+
+
+def file_fingerprint(path):
+    """文件内容的sha256，文件不存在时为None；按(路径, 大小, 修改时间)在进程内记忆，同一文件只读一次"""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _file_lock:
+        if key in _file_hashes:
+            return _file_hashes[key]
+    with open(path, "rb") as f:
+        value = hashlib.sha256(f.read()).hexdigest()
+    with _file_lock:
+        _file_hashes[key] = value
+    return value
+
+
+def digest(inputs):
+    return sha256_text(json.dumps(inputs, sort_keys=True, ensure_ascii=False))
+
+
+def input_fingerprints(program_path, mutant, llm=None, compact=False, cascade=False, solver=False, cheap_llm=None):
+    """返回 {组件: {输入名: 指纹或配置}}：程序源码、变异体、原程序与变异体的图文件、提示词模板、提取方式、
+    图压缩方式与模型配置
+
+    判定链的输入另外包含三条提取链输入的摘要，任一提取链需要重算时判定链也随之重算。
+    """
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    common = {
+        "program": file_fingerprint(program_path),
+        "mutant": sha256_text(json.dumps(mutant, sort_keys=True, ensure_ascii=False)),
+        "model": model_identity(tracing_llm(llm)),
+        "options": {"cascade": cascade, "solver": solver},
+    }
+    fingerprints = {}
+    for component in EXTRACTION_COMPONENTS:
+        entry = dict(common, prompt=sha256_text("\n".join(COMPONENT_PROMPTS[component]())),
+                     mode=COMPONENT_MODES[component](), compaction=graph_compaction.PROMPT_COMPACTION)
+        for kind in COMPONENT_GRAPHS[component]:
+            entry[f"graph:{kind}"] = file_fingerprint(base_graph_path(program_name, kind))
+            entry[f"mutant_graph:{kind}"] = file_fingerprint(mutant_graph_path(program_name, mutant["mutant_id"], kind))
+        fingerprints[component] = entry
+
+    judge_prompt = [emd_analysis.JUDGE_SYSTEM_PROMPT, emd_analysis.JUDGE_HUMAN_TEMPLATE]
+    if compact:
+        judge_prompt.append(emd_analysis.COMPACT_INSTRUCTION)
+    fingerprints["judge"] = dict(common, prompt=sha256_text("\n".join(judge_prompt)), compact=compact,
+                                 cheap_model=model_identity(cheap_llm) if cheap_llm is not None else None,
+                                 **{component: digest(fingerprints[component]) for component in EXTRACTION_COMPONENTS})
+    return fingerprints
+
+
+def plan_mutant(current, previous, artifact=None):
+    """对比本次与上次结果的输入指纹，返回 {需要重算的组件: [原因]}；为空表示可直接沿用上次结果"""
+    if previous is None:
+        return {component: ["无历史结果"] for component in COMPONENTS}
+    changes = {}
+    for component in COMPONENTS:
+        old, new = previous.get(component) or {}, current[component]
+        changed = sorted(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+        if changed:
+            changes[component] = changed
+    # 需要重新判定而产物存储中没有提取结果时，三条提取链都要重算
+    if changes and artifact is None:
+        for component in EXTRACTION_COMPONENTS:
+            changes.setdefault(component, []).append("无提取产物")
+    return changes
+
+
+def plan_incremental(store, program_path, mutants, journal, **fingerprint_options):
+    """返回 {mutant_id: (本次输入指纹, {需要重算的组件: [原因]}, 已有产物)}"""
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    previous = journal.completed()
+    plans = {}
+    for mutant in mutants:
+        current = input_fingerprints(program_path, mutant, **fingerprint_options)
+        record = previous.get(mutant["mutant_id"])
+        if record is not None and not record.get("fingerprints"):
+            changes = {component: ["无输入指纹记录"] for component in COMPONENTS}
+            artifact = None
+        else:
+            artifact = store.get(program_name, mutant["mutant_id"])
+            changes = plan_mutant(current, record["fingerprints"] if record else None, artifact)
+        plans[mutant["mutant_id"]] = (current, changes, artifact)
+    return plans
+
+
+def format_plan(plans):
+    """试运行的输出：每个需要重算的变异体一行（组件及原因），最后是各组件的重算数"""
+    lines, counts = [], dict.fromkeys(COMPONENTS, 0)
+    for mutant_id, (_, changes, _) in plans.items():
+        if not changes:
+            continue
+        for component in changes:
+            counts[component] += 1
+        lines.append(f"{mutant_id}: 重算 {', '.join(changes)}（" +
+                     "; ".join(f"{component}: {', '.join(reasons)}" for component, reasons in changes.items()) + "）")
+    reused = sum(not changes for _, changes, _ in plans.values())
+    lines.append(f"共 {len(plans)} 个变异体, 沿用 {reused} 个, 重算: " +
+                 ", ".join(f"{component} {count}" for component, count in counts.items()))
+    return "\n".join(lines)
+
+
+def update_artifact(program_path, mutant, artifact, changes, llm, concurrent=False, cascade=False, solver=False):
+    """只重算输入发生变化的提取链，其余沿用已有产物；分级执行（cascade/solver）时提取链之间有依赖，整体重新提取"""
+    if artifact is None or cascade or solver:
+        return extract_mutant(program_path, mutant, llm, concurrent, cascade, solver)
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    # 非分级执行不会在提取阶段得出结论，清除之前分级执行留下的结论
+    artifact = dict({key: value for key, value in artifact.items() if key != "provenance"},
+                    verdict=None, verdict_source=None)
+    with tracing.span("extract_stage", program=program_name, mutant_id=mutant["mutant_id"]):
+        for component in EXTRACTION_COMPONENTS:
+            if component in changes:
+                artifact[component] = COMPONENT_EXTRACTORS[component](program_name, mutant, tracing_llm(llm))
+    return artifact
+
+
+def run_incremental(store, program_path, mutants, journal, llm=None, dry_run=False, max_workers=4,
+                    max_in_flight=None, model=None, concurrent=False, cascade=False, solver=False, stream=False,
+                    compact=False, cheap_llm=None):
+    """增量重跑：只重算输入指纹相对上次成功结果发生变化的变异体，且只重算受影响的提取链与判定链。
+
+    提取结果从产物存储读取（见artifact_store.py），结果写入journal时附上本次的输入指纹；
+    dry_run为True时只输出将要重算的变异体、组件与原因，不调用LLM。返回 {mutant_id: (指纹, 重算组件, 产物)}
+    """
+    llm = tracing_llm(llm)
+    plans = plan_incremental(store, program_path, mutants, journal, llm=llm, compact=compact, cascade=cascade,
+                             solver=solver, cheap_llm=cheap_llm)
+    logging.info(("增量重跑计划（试运行）:\n" if dry_run else "增量重跑计划:\n") + format_plan(plans))
+    if dry_run:
+        return plans
+
+    def analyze(program_path, mutant):
+        _, changes, artifact = plans[mutant["mutant_id"]]
+        if any(component in changes for component in EXTRACTION_COMPONENTS):
+            start_time = time.time()
+            artifact = update_artifact(program_path, mutant, artifact, changes, llm, concurrent, cascade, solver)
+            artifact = save_artifact(store, program_path, mutant, artifact, llm, cascade, solver,
+                                     time.time() - start_time)
+        return judge_mutant(program_path, mutant, artifact, llm, stream=stream, compact=compact, cheap_llm=cheap_llm)
+
+    pending = [mutant for mutant in mutants if plans[mutant["mutant_id"]][1]]
+    run_mutants(program_path, pending, analyze, max_workers=max_workers, max_in_flight=max_in_flight,
+                journal=journal, model=model, fingerprints=lambda _, mutant: plans[mutant["mutant_id"]][0])
+    return plans
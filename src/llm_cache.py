@@ -0,0 +1,175 @@
+# coding=utf-8
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+import tracing
+
+DEFAULT_CACHE_PATH = "/Users/swan/bishe/LLM4EMD/cache/llm_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 缓存上限512MB，超出后按最近最少使用淘汰
+
+
+def parse_llm_string(llm_string):
+    """从LangChain的llm_string中解析(模型, base_url, temperature, 调用参数)，解析失败返回None"""
+    serialized, _, call_params = llm_string.partition("---")
+    try:
+        kwargs = json.loads(serialized).get("kwargs", {})
+    except (ValueError, AttributeError):
+        return None
+    model = kwargs.get("model_name") or kwargs.get("model")
+    base_url = kwargs.get("openai_api_base") or kwargs.get("base_url")
+    return model, base_url, kwargs.get("temperature", 0), call_params
+
+
+def make_cache_key(llm_string, prompt):
+    """缓存键：hash(模型, base_url, temperature, 调用参数, 渲染后的提示词)，不含api_key等无关配置"""
+    parsed = parse_llm_string(llm_string)
+    material = [parsed, prompt] if parsed else [llm_string, prompt]
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def serialize_generations(generations):
+    records = []
+    for generation in generations:
+        record = {"text": generation.text}
+        if isinstance(generation, ChatGeneration):
+            record["content"] = generation.message.content
+            record["usage_metadata"] = getattr(generation.message, "usage_metadata", None)
+            record["response_metadata"] = generation.message.response_metadata
+        records.append(record)
+    return json.dumps(records, ensure_ascii=False)
+
+
+def deserialize_generations(value):
+    generations = []
+    for record in json.loads(value):
+        if "content" not in record:
+            generations.append(Generation(text=record["text"]))
+            continue
+        # 标记缓存命中，便于统计实际计费的token
+        response_metadata = dict(record.get("response_metadata") or {}, llm_cache_hit=True)
+        message = AIMessage(content=record["content"], usage_metadata=record.get("usage_metadata"),
+                            response_metadata=response_metadata)
+        generations.append(ChatGeneration(message=message))
+    return generations
+
+
+def is_truncated(generation):
+    return isinstance(generation, ChatGeneration) and bool(generation.message.response_metadata.get("early_stopped"))
+
+
+class DiskLLMCache(BaseCache):
+    """基于SQLite的内容寻址LLM响应缓存，所有提取链与判定链共享
+
+    仅缓存temperature为0的确定性调用；总大小超过max_bytes时按最近访问时间淘汰；
+    read_only为True时只查询不写入（也不更新访问时间），用于复现历史实验。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, read_only=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON llm_cache(last_access)")
+            self.conn.commit()
+
+    @staticmethod
+    def _cacheable(llm_string):
+        parsed = parse_llm_string(llm_string)
+        return parsed is None or not parsed[2]
+
+    def lookup(self, prompt, llm_string):
+        if not self._cacheable(llm_string):
+            return None
+        key = make_cache_key(llm_string, prompt)
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            tracing.record(cache_hits=1)
+            if not self.read_only:
+                self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+        return deserialize_generations(row[0])
+
+    def update(self, prompt, llm_string, return_val):
+        # 判定结果出现即提前结束的流式输出是截断的文本，与完整输出共用缓存键，不能写入缓存
+        if self.read_only or not self._cacheable(llm_string) or any(map(is_truncated, return_val)):
+            return
+        key = make_cache_key(llm_string, prompt)
+        value = serialize_generations(return_val)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            self.writes += 1
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """总大小超限时删除最久未访问的条目"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        while total > self.max_bytes:
+            row = self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access LIMIT 1").fetchone()
+            if row is None:
+                break
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.evictions += 1
+
+    def clear(self, **kwargs):
+        if self.read_only:
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def stats(self):
+        """返回命中/未命中计数与当前缓存规模"""
+        with self.lock:
+            entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+
+def enable_llm_cache(path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, read_only=False):
+    """为当前进程内所有LLM调用启用磁盘缓存，返回缓存对象以便查看统计"""
+    cache = DiskLLMCache(path, max_bytes=max_bytes, read_only=read_only)
+    set_llm_cache(cache)
+    logging.info(f"已启用LLM响应缓存: {path}{' (只读)' if read_only else ''}")
+    return cache
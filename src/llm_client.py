@@ -0,0 +1,97 @@
+# coding=utf-8
+import threading
+import httpx
+import yaml
+from langchain_openai import ChatOpenAI
+from llm_router import Endpoint, RouterChatModel
+
+DEFAULT_CONFIG_PATH = "/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"
+DEFAULT_MODEL = "deepseek-v3"
+
+# 所有LLM客户端共享的HTTP连接池（keep-alive），避免每次调用重新建立TCP/TLS连接
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_lock = threading.Lock()
+_config = None
+_config_path = None
+_http_client = None
+_clients = {}
+
+
+def load_config(config_path=DEFAULT_CONFIG_PATH):
+    """读取并解析配置文件（每次调用都会重新解析，一般应使用get_config）"""
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def get_config(config_path=DEFAULT_CONFIG_PATH):
+    """返回进程内缓存的配置，仅在首次调用或配置路径变化时解析YAML"""
+    global _config, _config_path
+    with _lock:
+        if _config is None or _config_path != config_path:
+            if _config is not None:  # 切换配置文件时丢弃旧客户端
+                _clients.clear()
+            _config = load_config(config_path)
+            _config_path = config_path
+        return _config
+
+
+def reload_config(config_path=None):
+    """显式重新加载配置，并丢弃基于旧配置创建的客户端"""
+    global _config, _config_path
+    with _lock:
+        _config_path = config_path or _config_path or DEFAULT_CONFIG_PATH
+        _config = load_config(_config_path)
+        _clients.clear()
+        return _config
+
+
+def get_http_client():
+    """返回进程内共享的httpx客户端"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        return _http_client
+
+
+def build_client(model_config, temperature=0, http_client=None, **kwargs):
+    """按一条配置（api_key、base_url、model）创建ChatOpenAI客户端"""
+    return ChatOpenAI(
+        api_key=model_config["api_key"],
+        base_url=model_config["base_url"],
+        model=model_config["model"],
+        temperature=temperature,
+        http_client=http_client or get_http_client(),
+        **kwargs
+    )
+
+
+def get_llm(config_name=DEFAULT_MODEL, temperature=0):
+    """返回共享的ChatOpenAI客户端，同一(配置名, temperature)在进程内只创建一次
+
+    配置中含endpoints列表时（同一模型族的多个服务商），返回在这些端点间按延迟路由、失败切换的RouterChatModel；
+    每个端点未写的字段（如model、api_key）沿用外层配置；端点客户端不在SDK内重试，失败后立即切换端点。
+    """
+    config = get_config(_config_path or DEFAULT_CONFIG_PATH)
+    http_client = get_http_client()
+    key = (config_name, temperature)
+    with _lock:
+        if key not in _clients:
+            model_config = config[config_name]
+            if model_config.get("endpoints"):
+                defaults = {name: value for name, value in model_config.items() if name != "endpoints"}
+                _clients[key] = RouterChatModel([
+                    Endpoint(endpoint.get("name", endpoint["base_url"]),
+                             build_client(dict(defaults, **endpoint), temperature, http_client, max_retries=0))
+                    for endpoint in model_config["endpoints"]])
+            else:
+                _clients[key] = build_client(model_config, temperature, http_client)
+        return _clients[key]
+
+
+def register_llm(llm, config_name=DEFAULT_MODEL, temperature=0):
+    """注入自定义LLM（如本地伪模型或带限流的包装模型），之后get_llm返回该实例"""
+    with _lock:
+        _clients[(config_name, temperature)] = llm
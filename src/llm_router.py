@@ -0,0 +1,175 @@
+# coding=utf-8
+import logging
+import random
+import threading
+import time
+from typing import Any
+from delegating_chat_model import DelegatingChatModel
+from prompt_stage import message_stage
+from resilient_llm import CircuitBreaker, CircuitOpenError, is_retryable
+
+# 延迟与错误率的指数加权滑动平均系数（越大越偏向最近的请求）
+ROUTER_EWMA_ALPHA = 0.2
+# 某端点某阶段还没有延迟样本时的假设延迟（秒），其他端点已有样本时改用它们的平均值
+ROUTER_DEFAULT_LATENCY = 1.0
+# 单个端点连续失败达到阈值后暂停路由，冷却期后放行一次试探请求
+ROUTER_FAILURE_THRESHOLD = 3
+ROUTER_RESET_SECONDS = 30.0
+
+_stats_lock = threading.Lock()
+
+
+class Endpoint:
+    """同一模型的一个服务端点：在途请求数、按阶段的EWMA延迟、EWMA错误率与独立的熔断器"""
+
+    def __init__(self, name, llm, failure_threshold=ROUTER_FAILURE_THRESHOLD, reset_seconds=ROUTER_RESET_SECONDS):
+        self.name = name
+        self.llm = llm
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.outstanding = 0
+        self.latency = {}  # 阶段 -> EWMA延迟（秒）
+        self.error_rate = 0.0
+        self.counters = {"requests": 0, "errors": 0}
+
+    def record(self, stage, seconds=None, alpha=ROUTER_EWMA_ALPHA):
+        """记录一次请求结果，seconds为None表示失败"""
+        with _stats_lock:
+            self.counters["requests"] += 1
+            self.error_rate += alpha * ((seconds is None) - self.error_rate)
+            if seconds is None:
+                self.counters["errors"] += 1
+            else:
+                previous = self.latency.get(stage)
+                self.latency[stage] = seconds if previous is None else previous + alpha * (seconds - previous)
+        if seconds is None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+
+class RouterChatModel(DelegatingChatModel):
+    """把同一模型族的请求分发到多个端点：按“EWMA延迟 ×（在途请求数 + 1）”选择代价最小的健康端点，
+    可重试错误（429、5xx、超时、连接错误）时换下一个端点，全部端点都失败才抛出最后一个错误。
+
+    llm为首个端点的模型，缓存键与其一致：不同端点返回的结果共用同一份LLM缓存。
+    流式请求只在收到首个输出块之前切换端点，但直到流结束才释放在途名额、记录延迟与失败。
+    """
+
+    endpoints: list = []
+    counters: dict = {}
+    ewma_alpha: float = ROUTER_EWMA_ALPHA
+    default_latency: float = ROUTER_DEFAULT_LATENCY
+
+    def __init__(self, endpoints, **kwargs: Any):
+        super().__init__(llm=endpoints[0].llm, endpoints=list(endpoints),
+                         counters={"requests": 0, "failovers": 0, "exhausted": 0}, **kwargs)
+
+    def _count(self, name):
+        with _stats_lock:
+            self.counters[name] += 1
+
+    def expected_latency(self, endpoint, stage):
+        latency = endpoint.latency.get(stage)
+        if latency is not None:
+            return latency
+        known = [other.latency[stage] for other in self.endpoints if stage in other.latency]
+        return sum(known) / len(known) if known else self.default_latency
+
+    def choose(self, stage, excluded=()):
+        """选择代价最小的健康端点并占用一个在途名额；没有可用端点时返回None"""
+        with _stats_lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in excluded]
+        random.shuffle(candidates)  # 代价相同时随机分配
+        candidates.sort(key=lambda endpoint: self.expected_latency(endpoint, stage) * (endpoint.outstanding + 1)
+                        / max(1.0 - endpoint.error_rate, 0.05))
+        for endpoint in candidates:
+            if endpoint.breaker.allow():
+                with _stats_lock:
+                    endpoint.outstanding += 1
+                return endpoint
+        return None
+
+    def release(self, endpoint):
+        with _stats_lock:
+            endpoint.outstanding -= 1
+
+    def _route(self, messages, call, hold=False):
+        """依次尝试端点直到成功，call(endpoint)执行实际请求
+
+        hold为True时成功后不释放在途名额、不记录延迟，返回(结果, 端点, 阶段, 开始时间)，由调用方在请求真正结束时调用settle。
+        """
+        stage = message_stage(messages)
+        self._count("requests")
+        tried, last_error = [], None
+        while True:
+            endpoint = self.choose(stage, tried)
+            if endpoint is None:
+                self._count("exhausted")
+                raise last_error or CircuitOpenError(f"所有端点均不可用: {[e.name for e in self.endpoints]}")
+            if tried:
+                self._count("failovers")
+                logging.info(f"LLM路由: 端点 {tried[-1].name} 失败，切换到 {endpoint.name}")
+            tried.append(endpoint)
+            start_time = time.perf_counter()
+            try:
+                result = call(endpoint)
+            except Exception as e:
+                self.settle(endpoint, stage, None)
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                continue
+            if hold:
+                return result, endpoint, stage, start_time
+            self.settle(endpoint, stage, time.perf_counter() - start_time)
+            return result
+
+    def settle(self, endpoint, stage, seconds):
+        """请求结束：释放在途名额并记录延迟，seconds为None表示失败"""
+        self.release(endpoint)
+        endpoint.record(stage, seconds, self.ewma_alpha)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._route(messages, lambda endpoint: endpoint.llm._generate(
+            messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        def first_chunk(endpoint):
+            stream = endpoint.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return stream, next(stream, None)
+
+        # 端点选择与失败切换只覆盖到首个输出块，之后的输出直接从该端点读取；
+        # 在途名额一直占用到流结束，延迟按整个流的耗时记录（与非流式请求可比），流中途出错计为该端点失败
+        (stream, chunk), endpoint, stage, start_time = self._route(messages, first_chunk, hold=True)
+        succeeded = False
+        try:
+            if chunk is not None:
+                yield chunk
+                yield from stream
+            succeeded = True
+        except GeneratorExit:
+            succeeded = True  # 调用方提前结束读取（如判定结果已出现）不是端点失败
+            raise
+        finally:
+            stream.close()
+            self.settle(endpoint, stage, time.perf_counter() - start_time if succeeded else None)
+
+    def stats(self):
+        """路由计数与各端点的在途请求数、EWMA延迟、错误率、熔断状态"""
+        with _stats_lock:
+            stats = dict(self.counters)
+            stats["endpoints"] = {endpoint.name: dict(
+                endpoint.counters, outstanding=endpoint.outstanding, error_rate=round(endpoint.error_rate, 4),
+                breaker=endpoint.breaker.state,
+                latency={stage: round(seconds, 4) for stage, seconds in endpoint.latency.items()})
+                for endpoint in self.endpoints}
+        return stats
+
+
+def find_router(llm):
+    """沿包装链找到路由模型，没有时返回None"""
+    while llm is not None:
+        if isinstance(llm, RouterChatModel):
+            return llm
+        llm = getattr(llm, "llm", None)
+    return None
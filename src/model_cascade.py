@@ -0,0 +1,134 @@
+# coding=utf-8
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+from result_compare import equivalence_accuracy
+from result_journal import parse_verdict
+from tracing import percentile
+
+# 分级判定：先由便宜模型以精简模式独立采样CASCADE_SAMPLES次，结论全部一致时直接采用，
+# 否则（结论不一致或未给出结论）交给强模型按原流程重新判定
+CHEAP_MODEL = "gpt-3.5-turbo"
+STRONG_MODEL = "deepseek-v3"
+CASCADE_SAMPLES = 2
+# 采样温度必须大于0，多次采样才是独立的（temperature为0的请求还会命中LLM缓存，得到相同结论）
+SAMPLE_TEMPERATURE = 0.7
+SAMPLE_MAX_TOKENS = 1024
+
+# 每百万token的价格（美元）：(输入, 输出)，用于估算各级的调用成本
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "deepseek-v3": (0.27, 1.1),
+}
+
+_lock = threading.Lock()
+_records = []
+
+
+def sample_verdicts(cheap_llm, inputs, samples=CASCADE_SAMPLES, max_output_tokens=SAMPLE_MAX_TOKENS):
+    """便宜模型并发采样samples次精简判定，返回[(判定文本, 判定结果YES/NO/None)]"""
+    from emd_analysis import build_analysis_chain
+    chain = build_analysis_chain(cheap_llm.bind(max_tokens=max_output_tokens), compact=True)
+
+    def sample():
+        try:
+            text = chain.invoke(inputs).content
+        except Exception:
+            return None, None  # 单次采样失败视为没有结论，由强模型判定
+        return text, parse_verdict(text)
+
+    # 每次采样在调用线程上下文的副本中执行，token用量记入当前span
+    contexts = [contextvars.copy_context() for _ in range(samples)]
+    with ThreadPoolExecutor(max_workers=samples) as executor:
+        return list(executor.map(lambda context: context.run(sample), contexts))
+
+
+def tiered_judge(cheap_llm, strong_llm, inputs, mutant_id, program_name=None, samples=CASCADE_SAMPLES,
+                 **judge_options):
+    """分级判定：便宜模型的多次采样结论一致时返回其判定文本，否则升级到强模型（run_judge，judge_options透传）"""
+    from emd_analysis import run_judge
+    with tracing.span("tier_cheap") as cheap_span:
+        results = sample_verdicts(cheap_llm, inputs, samples)
+    verdicts = [verdict for _, verdict in results]
+    confident = verdicts[0] is not None and len(set(verdicts)) == 1
+
+    strong_span = None
+    if confident:
+        text = results[0][0]
+    else:
+        with tracing.span("tier_strong") as strong_span:
+            text = run_judge(strong_llm, inputs, mutant_id, **judge_options)
+    record_tier(program_name, mutant_id, "cheap" if confident else "strong", parse_verdict(text), verdicts,
+                cheap_span, strong_span)
+    return text
+
+
+def record_tier(program_name, mutant_id, tier, verdict, cheap_verdicts, cheap_span, strong_span=None):
+    """记录一个变异体的判定级别、结论与各级耗时和token数"""
+    entry = {"program": program_name, "mutant_id": mutant_id, "tier": tier, "verdict": verdict,
+             "cheap_verdicts": cheap_verdicts}
+    for name, current in (("cheap", cheap_span), ("strong", strong_span)):
+        entry[f"{name}_seconds"] = current.seconds if current else 0.0
+        entry[f"{name}_prompt_tokens"] = current.metrics["prompt_tokens"] if current else 0
+        entry[f"{name}_completion_tokens"] = current.metrics["completion_tokens"] if current else 0
+    with _lock:
+        _records.append(entry)
+
+
+def reset_tier_records():
+    with _lock:
+        _records.clear()
+
+
+def model_cost(model, prompt_tokens, completion_tokens):
+    """按MODEL_PRICES估算成本（美元），未登记价格的模型记为0"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def tier_report(program_name=None, truth=None, baseline=None, cheap_model=CHEAP_MODEL, strong_model=STRONG_MODEL):
+    """各级的变异体数、耗时分位数、token数与估算成本，以及升级比例
+
+    truth为{变异体id: 是否等价}时按result_compare的比较逻辑计算分级判定的准确率与各级准确率；
+    baseline为只用强模型得到的{变异体id: 是否判定为等价}（见result_compare.load_verdicts）时给出准确率变化。
+    """
+    with _lock:
+        records = [dict(entry) for entry in _records if program_name in (None, entry["program"])]
+    report = {"mutants": len(records),
+              "escalated": sum(entry["tier"] == "strong" for entry in records)}
+    report["escalation_rate"] = round(report["escalated"] / len(records), 4) if records else 0.0
+    for tier, model in (("cheap", cheap_model), ("strong", strong_model)):
+        seconds = [entry[f"{tier}_seconds"] for entry in records if entry[f"{tier}_seconds"]]
+        prompt_tokens = sum(entry[f"{tier}_prompt_tokens"] for entry in records)
+        completion_tokens = sum(entry[f"{tier}_completion_tokens"] for entry in records)
+        report[tier] = {
+            "model": model,
+            "calls": len(seconds),
+            "p50": round(percentile(seconds, 0.5), 4) if seconds else 0.0,
+            "p95": round(percentile(seconds, 0.95), 4) if seconds else 0.0,
+            "total_seconds": round(sum(seconds), 4),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": round(model_cost(model, prompt_tokens, completion_tokens), 6),
+        }
+    report["cost"] = round(report["cheap"]["cost"] + report["strong"]["cost"], 6)
+    # 全部交给强模型时的成本，按升级变异体的平均强模型成本外推
+    if report["escalated"]:
+        report["strong_only_cost_estimate"] = round(report["strong"]["cost"] / report["escalated"] * len(records), 6)
+
+    if truth:
+        verdicts = {entry["mutant_id"]: entry["verdict"] == "YES" for entry in records if entry["verdict"]}
+        tiered = equivalence_accuracy({key: truth[key] for key in verdicts if key in truth}, verdicts)
+        report["accuracy"] = round(tiered["accuracy"], 4)
+        for tier in ("cheap", "strong"):
+            tier_verdicts = {entry["mutant_id"]: entry["verdict"] == "YES" for entry in records
+                             if entry["tier"] == tier and entry["verdict"] and entry["mutant_id"] in truth}
+            report[tier]["accuracy"] = round(equivalence_accuracy(
+                {key: truth[key] for key in tier_verdicts}, tier_verdicts)["accuracy"], 4)
+        if baseline:
+            common = {key: truth[key] for key in verdicts if key in truth and key in baseline}
+            baseline_accuracy = equivalence_accuracy(common, baseline)["accuracy"]
+            report["baseline_accuracy"] = round(baseline_accuracy, 4)
+            report["accuracy_delta"] = round(equivalence_accuracy(common, verdicts)["accuracy"] - baseline_accuracy, 4)
+    return report
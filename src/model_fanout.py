@@ -0,0 +1,106 @@
+# coding=utf-8
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+from batch_runner import OrderedResultLogger
+from emd_analysis import judge_mutant
+from result_journal import ResultJournal, journal_path
+
+
+def model_log_path(log_filename, model):
+    """多模型判定时各模型的结果日志：Mid_results.log -> Mid_results.gpt-3.5-turbo.log"""
+    root, ext = os.path.splitext(log_filename)
+    return f"{root}.{model}{ext}"
+
+
+def model_logger(log_path, model, append=False):
+    """只写入log_path的独立logger，格式与setup_logging一致（不再传给根logger，避免各模型结果混在主日志中）"""
+    logger = logging.getLogger(f"model_fanout.{model}")
+    for handler in logger.handlers:
+        handler.close()
+    file_handler = logging.FileHandler(log_path, mode='a' if append else 'w', encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.handlers = [file_handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def judge_fanout(program_path, mutant, artifact, judges, **judge_options):
+    """把同一提取产物并发交给judges（{模型名: LLM}）中的全部模型判定，
+    返回 {模型名: {"result", "error", "time_cost"}}；judge_options透传给judge_mutant"""
+    def judge(name, llm):
+        start_time = time.time()
+        try:
+            with tracing.span(f"judge:{name}"):
+                record = {"result": judge_mutant(program_path, mutant, artifact, llm, **judge_options), "error": None}
+        except Exception as e:
+            record = {"result": None, "error": str(e)}
+        record["time_cost"] = time.time() - start_time
+        return record
+
+    # 每个模型的判定在调用线程上下文的副本中执行，span挂在当前变异体之下
+    contexts = {name: contextvars.copy_context() for name in judges}
+    with ThreadPoolExecutor(max_workers=len(judges)) as executor:
+        futures = {name: executor.submit(contexts[name].run, judge, name, llm) for name, llm in judges.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def run_fanout(program_path, mutants, extract_fn, judges, log_filename, max_workers=4, resume=False,
+               **judge_options):
+    """多模型判定：每个变异体只调用一次extract_fn(program_path, mutant)得到提取产物，
+    再并发交给judges中的全部模型判定；各模型的结果按原有格式写入各自的结果日志与结果日志JSONL。
+
+    resume为True时每个模型只补跑其结果日志中尚未成功完成的变异体。返回 {模型名: {mutant_id: 判定文本}}
+    """
+    program_name = os.path.splitext(os.path.basename(program_path))[0]
+    journals, pending = {}, {}
+    for name in judges:
+        journals[name] = ResultJournal(journal_path(model_log_path(log_filename, name)))
+        if not resume and os.path.exists(journals[name].path):
+            os.remove(journals[name].path)
+        completed = journals[name].completed() if resume else {}
+        pending[name] = [mutant["mutant_id"] for mutant in mutants if mutant["mutant_id"] not in completed]
+    loggers = {name: OrderedResultLogger(pending[name], model_logger(model_log_path(log_filename, name), name, resume))
+               for name in judges}
+    order = {name: {mutant_id: index for index, mutant_id in enumerate(pending[name])} for name in judges}
+    mutants = [mutant for mutant in mutants if any(mutant["mutant_id"] in order[name] for name in judges)]
+    results = {name: {} for name in judges}
+
+    def analyze(mutant):
+        mutant_id = mutant["mutant_id"]
+        mutant_judges = {name: llm for name, llm in judges.items() if mutant_id in order[name]}
+        start_time = time.time()
+        try:
+            with tracing.span("mutant", program=program_name, mutant_id=mutant_id):
+                artifact = extract_fn(program_path, mutant)
+                extract_seconds = time.time() - start_time
+                records = judge_fanout(program_path, mutant, artifact, mutant_judges, **judge_options)
+        except Exception as e:
+            extract_seconds = time.time() - start_time
+            records = {name: {"result": None, "error": str(e), "time_cost": 0.0} for name in mutant_judges}
+        for name, record in records.items():
+            # 与单模型运行一致，耗时包含提取阶段
+            record["time_cost"] = round(record["time_cost"] + extract_seconds, 4)
+            if record["error"] is None:
+                results[name][mutant_id] = record["result"]
+            try:
+                journals[name].append(program_path, mutant_id, record["result"], record["error"],
+                                      record["time_cost"], name)
+            except Exception as e:  # 与run_mutants一致，写结果日志失败不影响按序输出
+                logging.error(f"变异体 {mutant_id} [{name}] 的结果写入结果日志失败: {e}")
+            loggers[name].submit(order[name][mutant_id], record)
+
+    batch_start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(analyze, mutants))
+    elapsed = time.time() - batch_start
+    for name in judges:
+        logging.info(f"多模型判定 {program_name} [{name}]: {len(pending[name])} 个变异体, "
+                     f"失败 {len(pending[name]) - len(results[name])} 个")
+    logging.info(f"多模型判定 {program_name}: 共 {len(mutants)} 个变异体, {len(judges)} 个模型, "
+                 f"总耗时: {elapsed:.4f} 秒, 并发数: {max_workers}")
+    return results
@@ -0,0 +1,169 @@
+# coding=utf-8
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from graph_compaction import compact_graph
+from graph_store import GRAPH_KINDS, get_graph_store
+from program_graph import extract_identifiers, node_code, parse_mutated_line
+
+# 归一化时类型名替换为的类别：包装类型与对应的基本类型视为同一类别
+TYPE_CLASSES = {
+    "byte": "BYTE", "short": "SHORT", "int": "INT", "long": "LONG", "char": "CHAR",
+    "Byte": "BYTE", "Short": "SHORT", "Integer": "INT", "Long": "LONG", "Character": "CHAR",
+    "float": "FLOAT", "double": "DOUBLE", "Float": "FLOAT", "Double": "DOUBLE",
+    "boolean": "BOOLEAN", "Boolean": "BOOLEAN",
+    "Object": "OBJECT",
+}
+TYPE_PATTERN = re.compile(r"\b(" + "|".join(TYPE_CLASSES) + r")\b")
+# 变异涉及的数值类型互不合并（char无符号，各整数类型的位宽与溢出行为不同，浮点精度不同）；
+# 变异未涉及的数值类型统一为NUMERIC，如各元素类型的lastIndexOf中只改动int下标的变异体可以合并
+NUMERIC_CLASSES = {"BYTE", "SHORT", "INT", "LONG", "CHAR", "FLOAT", "DOUBLE"}
+# 变量声明，如 "short[] array"、"int i = startIndex"
+DECLARATION_PATTERN = re.compile(r"\b(" + "|".join(TYPE_CLASSES) + r")\s*(?:\[\s*\]\s*)*([A-Za-z_$][\w$]*)")
+# 数组长度与元素类型无关
+ARRAY_LENGTH_PATTERN = re.compile(r"\b[A-Za-z_$][\w$]*\s*\.\s*length\b(?!\s*\()")
+
+
+def mutation_type_classes(difference, graph):
+    """变异涉及的类型类别：diff增删行中出现的类型名，以及增删行读写的变量在图中声明的类型"""
+    changed = " ".join(line[1:] for line in (difference or "").split("\n")[1:] if line[:1] in ("-", "+"))
+    classes = {TYPE_CLASSES[name] for name in TYPE_PATTERN.findall(changed)}
+    variables = set(extract_identifiers(ARRAY_LENGTH_PATTERN.sub(" ", changed)))
+    for node in graph.nodes.values():
+        for type_name, variable in DECLARATION_PATTERN.findall(node_code(node)):
+            if variable in variables:
+                classes.add(TYPE_CLASSES[type_name])
+    return classes
+
+
+def normalize_code(text, program_name=None, type_classes=None):
+    """代码片段归一化：类型名替换为类别、程序名替换为占位符、压缩空白
+
+    给出type_classes（变异涉及的类型类别）时，其余数值类型替换为NUMERIC。
+    """
+    def type_class(match):
+        name = TYPE_CLASSES[match.group(1)]
+        if type_classes is not None and name in NUMERIC_CLASSES and name not in type_classes:
+            return "NUMERIC"
+        return name
+
+    text = TYPE_PATTERN.sub(type_class, text or "")
+    if program_name:
+        text = text.replace(program_name, "PROGRAM")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_difference(difference, type_classes=None):
+    """去掉hunk头（行号由图邻域的相对位置体现），保留归一化后的增删行"""
+    lines = (difference or "").split("\n")[1:]
+    return [line[0] + normalize_code(line[1:], type_classes=type_classes) for line in lines if line[:1] in ("-", "+")]
+
+
+def normalize_graph(graph_json, anchor_line, program_name, type_classes=None):
+    """图的归一化：节点按出现顺序重新编号，行号改为相对变异行的偏移，标签做代码归一化"""
+    ids = {node["id"]: index for index, node in enumerate(graph_json.get("nodes", []))}
+    nodes = [[(node.get("line") or 0) - anchor_line, normalize_code(node.get("label", ""), program_name, type_classes)]
+             for node in graph_json.get("nodes", [])]
+    edges = sorted([ids[edge["source"]], ids[edge["target"]], str(edge.get("label", "")), str(edge.get("type", ""))]
+                   for edge in graph_json.get("edges", []))
+    return {"nodes": nodes, "edges": edges}
+
+
+def mutant_fingerprint(program_name, mutant, graph_store=None):
+    """变异体指纹：归一化diff + 每类图中与变异相关的局部子图；图文件缺失或无法定位变异行时返回None（不参与去重）
+
+    变异未涉及的数值类型不区分，因此只改动下标/长度的变异体可跨元素类型不同的程序变体合并。
+    """
+    difference = mutant.get("difference", "")
+    line = parse_mutated_line(difference)
+    if line is None:
+        return None
+    graph_store = graph_store or get_graph_store()
+    try:
+        graphs = {kind: graph_store.get_program_graph(program_name, mutant["mutant_id"], kind) for kind in GRAPH_KINDS}
+    except OSError:
+        return None
+    if not all(graph.nodes_at_line(line) for graph in graphs.values()):
+        return None
+    type_classes = mutation_type_classes(difference, graphs["CFG"])
+    parts = {"operator": mutant.get("operator"), "difference": normalize_difference(difference, type_classes)}
+    for kind, graph in graphs.items():
+        parts[kind] = normalize_graph(compact_graph(graph, kind, difference, "slice"), line, program_name,
+                                      type_classes)
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class MutantDeduplicator:
+    """按指纹对变异体去重：每组只分析一个代表，组内其余变异体复用其判定结果并记录来源
+
+    包装analyze_fn(program_path, mutant)，可直接传给batch_runner.run_mutants；先到的变异体成为代表，
+    同组变异体并发到达时等待代表完成。代表分析失败时由等待的变异体重新分析。
+    """
+
+    def __init__(self, analyze_fn, graph_store=None):
+        self.analyze_fn = analyze_fn
+        self.graph_store = graph_store
+        self.condition = threading.Condition()
+        self.results = {}  # 指纹 -> (代表程序, 代表变异体id, 分析结果)
+        self.pending = set()
+        self.sources = {}  # (程序, 变异体id) -> 代表信息
+        self.counters = {"mutants": 0, "fingerprinted": 0, "analyzed": 0, "reused": 0}
+        self.groups = {}  # 指纹 -> 组内变异体数
+
+    def __call__(self, program_path, mutant):
+        program_name = os.path.splitext(os.path.basename(program_path))[0]
+        fingerprint = mutant_fingerprint(program_name, mutant, self.graph_store)
+        with self.condition:
+            self.counters["mutants"] += 1
+            if fingerprint is None:
+                self.counters["analyzed"] += 1
+        if fingerprint is None:
+            return self.analyze_fn(program_path, mutant)
+
+        with self.condition:
+            self.counters["fingerprinted"] += 1
+            self.groups[fingerprint] = self.groups.get(fingerprint, 0) + 1
+            while fingerprint in self.pending:
+                self.condition.wait()
+            if fingerprint in self.results:
+                representative_program, representative_id, result = self.results[fingerprint]
+                self.counters["reused"] += 1
+                self.sources[(program_name, mutant["mutant_id"])] = {
+                    "fingerprint": fingerprint, "program": representative_program, "mutant_id": representative_id}
+                logging.info(f"变异体 {program_name}/{mutant['mutant_id']} 复用 "
+                             f"{representative_program}/{representative_id} 的判定结果")
+                return result
+            self.pending.add(fingerprint)
+
+        try:
+            result = self.analyze_fn(program_path, mutant)
+        except BaseException:
+            with self.condition:
+                self.pending.discard(fingerprint)
+                self.condition.notify_all()
+            raise
+
+        with self.condition:
+            self.results[fingerprint] = (program_name, mutant["mutant_id"], result)
+            self.counters["analyzed"] += 1
+            self.pending.discard(fingerprint)
+            self.condition.notify_all()
+        return result
+
+    def provenance(self, program_path, mutant):
+        """复用结果的变异体返回其代表信息，否则返回None"""
+        program_name = os.path.splitext(os.path.basename(program_path))[0]
+        with self.condition:
+            return self.sources.get((program_name, mutant["mutant_id"]))
+
+    def stats(self):
+        """去重率（按指纹分组后减少的工作项比例）与节省的分析次数"""
+        with self.condition:
+            stats = dict(self.counters)
+            stats["groups"] = len(self.groups)
+            stats["dedup_ratio"] = round(stats["reused"] / stats["mutants"], 4) if stats["mutants"] else 0.0
+            stats["saved_analyses"] = stats["reused"]
+            return stats
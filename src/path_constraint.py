@@ -0,0 +1,187 @@
+# coding=utf-8
+import re
+
+# 可达性路径条件组合中的常量：false为不可达，NULL为无条件可达
+UNSATISFIABLE_CONSTANTS = ("false",)
+TRIVIAL_CONSTANTS = ("null", "true", "")
+
+# 展开为析取范式时的合取项上限，超过时放弃判断（视为可满足）
+MAX_DISJUNCTS = 256
+
+# 比较运算符允许的大小关系：<、=、>
+RELATIONS = {
+    "<": frozenset("<"), "<=": frozenset("<="), ">": frozenset(">"), ">=": frozenset(">="),
+    "==": frozenset("="), "!=": frozenset("<>"),
+}
+ALL_RELATIONS = frozenset("<=>")
+FLIPPED = {"<": ">", ">": "<", "=": "="}
+
+COMPARISON_PATTERN = re.compile(r"^(.+?)\s*(<=|>=|==|!=|<|>)\s*(.+)$")
+NUMBER_PATTERN = re.compile(r"^-?\d+(?:\.\d+)?$")
+# 自增自减与方法调用每次求值结果可能不同，含有它们的条件不参与矛盾判断
+SIDE_EFFECT_PATTERN = re.compile(r"\+\+|--|\w\s*\(")
+
+
+class ConstraintTooComplex(Exception):
+    pass
+
+
+def split_top_level(expr, operator):
+    """按括号外层的&&或||切分"""
+    parts, depth, start, index = [], 0, 0, 0
+    while index < len(expr):
+        char = expr[index]
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and expr.startswith(operator, index):
+            parts.append(expr[start:index])
+            index += len(operator)
+            start = index
+            continue
+        index += 1
+    parts.append(expr[start:])
+    return [part.strip() for part in parts]
+
+
+def strip_parens(expr):
+    """去掉包裹整个表达式的括号"""
+    expr = expr.strip()
+    while expr.startswith("(") and expr.endswith(")"):
+        depth = 0
+        for index, char in enumerate(expr):
+            depth += char == "("
+            depth -= char == ")"
+            if depth == 0 and index < len(expr) - 1:
+                return expr
+        expr = expr[1:-1].strip()
+    return expr
+
+
+def normalize_operand(operand):
+    return re.sub(r"\s+", "", strip_parens(operand))
+
+
+def parse_atom(expr):
+    """原子条件 -> (键, 允许取值集合)；比较式的键按操作数排序，使a > b与b < a对应同一键"""
+    lowered = expr.lower()
+    if lowered in UNSATISFIABLE_CONSTANTS:
+        return ("const",), frozenset()
+    if lowered in TRIVIAL_CONSTANTS:
+        return ("const",), frozenset([True])
+    if SIDE_EFFECT_PATTERN.search(expr):
+        return ("opaque", object()), frozenset([True])
+    match = COMPARISON_PATTERN.match(expr)
+    if match:
+        lhs, operator, rhs = normalize_operand(match.group(1)), match.group(2), normalize_operand(match.group(3))
+        relations = RELATIONS[operator]
+        if lhs > rhs:
+            lhs, rhs, relations = rhs, lhs, frozenset(FLIPPED[relation] for relation in relations)
+        return ("cmp", lhs, rhs), relations
+    return ("bool", normalize_operand(expr)), frozenset([True])
+
+
+def negate(literal):
+    key, allowed = literal
+    if key[0] == "cmp":
+        return key, ALL_RELATIONS - allowed
+    if key[0] == "const":
+        return key, frozenset([True]) - allowed
+    return key, frozenset([True, False]) - allowed
+
+
+def to_dnf(expr, max_disjuncts=MAX_DISJUNCTS):
+    """把条件组合字符串展开为析取范式：[[文字, ...], ...]"""
+    expr = strip_parens(expr)
+    disjuncts = split_top_level(expr, "||")
+    if len(disjuncts) > 1:
+        result = [conj for part in disjuncts for conj in to_dnf(part, max_disjuncts)]
+        if len(result) > max_disjuncts:
+            raise ConstraintTooComplex(expr)
+        return result
+    conjuncts = split_top_level(expr, "&&")
+    if len(conjuncts) > 1:
+        result = [[]]
+        for part in conjuncts:
+            result = [conj + other for conj in result for other in to_dnf(part, max_disjuncts)]
+            if len(result) > max_disjuncts:
+                raise ConstraintTooComplex(expr)
+        return result
+    if expr.startswith("!") and not expr.startswith("!="):
+        inner = strip_parens(expr[1:])
+        if len(split_top_level(inner, "||")) > 1 or len(split_top_level(inner, "&&")) > 1:
+            return [[(("bool", normalize_operand(expr)), frozenset([True]))]]  # 复合取反按不透明条件处理
+        return [[negate(literal) for literal in conj] for conj in to_dnf(inner, max_disjuncts)]
+    return [[parse_atom(expr)]]
+
+
+def constant_bound(key, relations):
+    """变量与数值常量的比较 -> (变量, 下界, 上界)，界为(值, 是否严格)；无法表示为区间时返回None"""
+    _, lhs, rhs = key
+    if NUMBER_PATTERN.match(rhs) and not NUMBER_PATTERN.match(lhs):
+        variable, value = lhs, float(rhs)
+    elif NUMBER_PATTERN.match(lhs) and not NUMBER_PATTERN.match(rhs):
+        variable, value = rhs, float(lhs)
+        relations = frozenset(FLIPPED[relation] for relation in relations)
+    else:
+        return None
+    if relations == frozenset("="):
+        return variable, (value, False), (value, False)
+    if relations <= frozenset("<="):
+        return variable, None, (value, "=" not in relations)
+    if relations <= frozenset(">="):
+        return variable, (value, "=" not in relations), None
+    return None
+
+
+def conjunction_unsatisfiable(literals):
+    """同一条件取值矛盾、同一对操作数的大小关系矛盾、或同一变量的数值区间为空时不可满足"""
+    allowed = {}
+    for key, values in literals:
+        allowed[key] = allowed.get(key, values) & values
+        if not allowed[key]:
+            return True
+
+    bounds = {}
+    for key, relations in allowed.items():
+        if key[0] == "cmp" and NUMBER_PATTERN.match(key[1]) and NUMBER_PATTERN.match(key[2]):
+            sign = (float(key[1]) > float(key[2])) - (float(key[1]) < float(key[2]))
+            if {-1: "<", 0: "=", 1: ">"}[sign] not in relations:
+                return True
+            continue
+        bound = constant_bound(key, relations) if key[0] == "cmp" else None
+        if bound is None:
+            continue
+        variable, lower, upper = bound
+        current_lower, current_upper = bounds.get(variable, (None, None))
+        if lower and (current_lower is None or lower[0] > current_lower[0]
+                      or (lower[0] == current_lower[0] and lower[1])):
+            current_lower = lower
+        if upper and (current_upper is None or upper[0] < current_upper[0]
+                      or (upper[0] == current_upper[0] and upper[1])):
+            current_upper = upper
+        bounds[variable] = (current_lower, current_upper)
+        if current_lower and current_upper:
+            if current_lower[0] > current_upper[0]:
+                return True
+            if current_lower[0] == current_upper[0] and (current_lower[1] or current_upper[1]):
+                return True
+    return False
+
+
+def is_unsatisfiable(constraint):
+    """可达性路径条件组合是否逻辑上不可满足（即变异语句不可达）
+
+    只在能确定时返回True：无法解析或过于复杂的条件一律视为可满足，交由后续分析链判断。
+    """
+    text = (constraint or "").strip().rstrip("。;；").strip()
+    if text.lower() in UNSATISFIABLE_CONSTANTS:
+        return True
+    if text.lower() in TRIVIAL_CONSTANTS:
+        return False
+    try:
+        disjunction = to_dnf(text)
+    except (ConstraintTooComplex, KeyError):
+        return False
+    return all(conjunction_unsatisfiable(conj) for conj in disjunction)
@@ -0,0 +1,216 @@
+# coding=utf-8
+import re
+from collections import defaultdict
+
+# 变异体diff的hunk头，如 "@@ -16 +16 @@" 或 "@@ -16,2 +16,0 @@"
+HUNK_PATTERN = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# 控制流/控制依赖边上表示分支方向的标签
+BRANCH_LABELS = ("True", "False")
+
+# 数据依赖边中只有定义-使用(Flows)边会传播变量值，反依赖/输出依赖边不传播
+NON_FLOW_TYPES = ("Anti", "Out", "Output")
+CONTROL_TYPES = ("Control", "Ctrl", "CD")
+
+# 赋值（含复合赋值）与自增自减的目标变量，数组元素与字段赋值记为其所属变量
+ASSIGNMENT_TARGET_PATTERN = re.compile(
+    r"(?<![\w$.])([A-Za-z_$][\w$]*)((?:\s*\.\s*[A-Za-z_$][\w$]*|\s*\[[^\]]*\])*)"
+    r"\s*(?:(?:>>>|<<|>>|[-+*/%&|^])?=(?!=)|\+\+|--)")
+PREFIX_INCREMENT_PATTERN = re.compile(r"(?:\+\+|--)\s*([A-Za-z_$][\w$]*)((?:\s*\.\s*[A-Za-z_$][\w$]*)*)")
+METHOD_CALL_PATTERN = re.compile(r"(?:(?<![\w$])new\s+)?((?:[A-Za-z_$][\w$]*\s*\.\s*)*)([A-Za-z_$][\w$]*)\s*\(")
+# 不修改程序状态的方法调用：输出语句、Math工具方法与常见的只读方法
+PURE_RECEIVERS = ("System.out.", "System.err.", "Math.", "String.", "Integer.", "Long.", "Character.")
+PURE_METHODS = {
+    "length", "charAt", "equals", "compareTo", "isEmpty", "size", "get", "contains", "indexOf", "substring",
+    "startsWith", "endsWith", "toString", "hashCode", "abs", "min", "max",
+}
+
+JAVA_KEYWORDS = {
+    "abstract", "assert", "boolean", "break", "byte", "case", "catch", "char", "class", "const", "continue",
+    "default", "do", "double", "else", "enum", "extends", "final", "finally", "float", "for", "goto", "if",
+    "implements", "import", "instanceof", "int", "interface", "long", "native", "new", "package", "private",
+    "protected", "public", "return", "short", "static", "strictfp", "super", "switch", "synchronized", "this",
+    "throw", "throws", "transient", "try", "void", "volatile", "while", "true", "false", "null", "var",
+}
+
+
+def parse_mutated_line(difference):
+    """从diff的hunk头中解析变异语句所在行号，无法解析或为纯删除hunk时返回None"""
+    match = HUNK_PATTERN.search(difference or "")
+    if not match:
+        return None
+    if match.group(4) == "0":  # 变异体中该行已被删除，图中不存在对应节点
+        return None
+    return int(match.group(3))
+
+
+def parse_diff_lines(difference):
+    """从diff中提取(原语句, 变异语句)，去掉前缀与首尾空白"""
+    original, mutated = [], []
+    for line in (difference or "").split("\n")[1:]:
+        if line.startswith("-"):
+            original.append(line[1:].strip())
+        elif line.startswith("+"):
+            mutated.append(line[1:].strip())
+    return " ".join(original), " ".join(mutated)
+
+
+def edge_label(edge):
+    """控制流/控制依赖边的分支标签（True/False/空），兼容label与type两种字段"""
+    label = edge.get("label")
+    if label in (None, "") and edge.get("type") in BRANCH_LABELS + ("",):
+        label = edge.get("type")
+    return (label or "").strip()
+
+
+def flow_variable(edge):
+    """数据依赖边传播的变量名，非Flows边（控制边、反依赖边等）返回None"""
+    edge_type = edge.get("type")
+    if edge_type in NON_FLOW_TYPES or edge_type in CONTROL_TYPES or edge_type in BRANCH_LABELS:
+        return None
+    variable = edge.get("label") or edge.get("var")
+    if not variable or variable in BRANCH_LABELS:
+        return None
+    return variable
+
+
+def control_label(edge):
+    """控制依赖边的分支标签（True/False/空），数据边返回None"""
+    edge_type = edge.get("type")
+    if edge_type in CONTROL_TYPES:
+        label = edge.get("label") or ""
+        return label if label in BRANCH_LABELS else ""
+    if edge_type in BRANCH_LABELS:
+        return edge_type
+    if edge_type in (None, "") and (edge.get("label") or "") in BRANCH_LABELS + ("",):
+        return edge.get("label") or ""
+    return None
+
+
+def is_output_node(node):
+    """输出语句：return、throw或标准输出打印"""
+    code = node_code(node)
+    return (re.match(r"^(return|throw)\b", code) is not None
+            or "System.out." in code or "System.err." in code)
+
+
+def extract_identifiers(code):
+    """提取语句中的变量名（去掉关键字、方法名与字段访问）"""
+    identifiers = []
+    for match in re.finditer(r"(?<![\w.])([A-Za-z_$][\w$]*)\b(?!\s*\()", code):
+        name = match.group(1)
+        if name not in JAVA_KEYWORDS and name not in identifiers:
+            identifiers.append(name)
+    return identifiers
+
+
+def assigned_variables(code):
+    """语句写入的变量：赋值/复合赋值/自增自减的目标，this.x记为x，a[i]与o.f记为a与o"""
+    written = set()
+    for match in list(ASSIGNMENT_TARGET_PATTERN.finditer(code)) + list(PREFIX_INCREMENT_PATTERN.finditer(code)):
+        name, accessors = match.group(1), match.group(2)
+        if name == "this":
+            fields = re.findall(r"\.\s*([A-Za-z_$][\w$]*)", accessors)
+            name = fields[0] if fields else None
+        if name and name not in JAVA_KEYWORDS:
+            written.add(name)
+    return written
+
+
+def has_opaque_call(code):
+    """语句是否调用了可能修改程序状态的方法（写入的变量无法从语句文本确定）"""
+    for match in METHOD_CALL_PATTERN.finditer(code):
+        receiver, name = re.sub(r"\s+", "", match.group(1)), match.group(2)
+        if name in JAVA_KEYWORDS or match.group(0).startswith("new"):
+            continue
+        # 方法声明（如入口节点 "int f(int x)"）不是调用
+        preceding = re.search(r"([\w$>\]]+)\s+$", code[:match.start()])
+        if not receiver and preceding and preceding.group(1) not in ("return", "throw", "else", "case"):
+            continue
+        if receiver.startswith(PURE_RECEIVERS) or name in PURE_METHODS:
+            continue
+        return True
+    return False
+
+
+def node_code(node):
+    """节点对应的源代码文本"""
+    return (node.get("label") or node.get("code") or "").strip()
+
+
+def extract_condition(code):
+    """从谓词节点代码中取出条件表达式，如 "if (a < b)" -> "a < b"，非if/while形式原样返回"""
+    code = code.strip().rstrip("{").strip()
+    match = re.match(r"^(?:}\s*)?(?:else\s+)?(?:if|while)\s*\((.*)\)$", code, re.DOTALL)
+    return match.group(1).strip() if match else code
+
+
+class ProgramGraph:
+    """PROGEX导出的CFG/PDG JSON的索引表示：按id、行号索引节点，维护出边与入边邻接表"""
+
+    def __init__(self, graph_json):
+        self.info = graph_json
+        self.nodes = {node["id"]: node for node in graph_json.get("nodes", [])}
+        self.out_edges = defaultdict(list)
+        self.in_edges = defaultdict(list)
+        self.line_index = defaultdict(list)
+        for edge in graph_json.get("edges", []):
+            self.out_edges[edge["source"]].append(edge)
+            self.in_edges[edge["target"]].append(edge)
+        for node_id in sorted(self.nodes):
+            line = self.nodes[node_id].get("line")
+            if line is not None:
+                self.line_index[line].append(node_id)
+
+    def nodes_at_line(self, line):
+        return list(self.line_index.get(line, []))
+
+    def entry_nodes(self):
+        """没有入边的节点（方法入口）"""
+        return [node_id for node_id in sorted(self.nodes) if not self.in_edges.get(node_id)]
+
+    def cyclic_components(self):
+        """位于环上的节点 -> 所在强连通分量（Tarjan算法，迭代实现）；不在任何环上的节点不出现在结果中"""
+        index, lowlink, on_stack, stack, components = {}, {}, set(), [], {}
+        for root in sorted(self.nodes):
+            if root in index:
+                continue
+            work = [(root, iter(self.out_edges.get(root, [])))]
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node_id, edges = work[-1]
+                for edge in edges:
+                    successor = edge["target"]
+                    if successor not in index:
+                        index[successor] = lowlink[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self.out_edges.get(successor, []))))
+                        break
+                    if successor in on_stack:
+                        lowlink[node_id] = min(lowlink[node_id], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node_id])
+                    if lowlink[node_id] != index[node_id]:
+                        continue
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node_id:
+                            break
+                    component = frozenset(component)
+                    if len(component) > 1 or any(edge["target"] == node_id
+                                                 for edge in self.out_edges.get(node_id, [])):
+                        components.update(dict.fromkeys(component, component))
+        return components
+
+    def describe(self, node_id):
+        node = self.nodes[node_id]
+        return node.get("line"), node_code(node)
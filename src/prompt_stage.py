@@ -0,0 +1,34 @@
+# coding=utf-8
+import re
+
+# 提示词关键字 -> 阶段，判定提示词中同样包含依赖路径字样，需最先匹配
+STAGE_KEYWORDS = (
+    ("judge", "等价变异体判定结果"),
+    ("reachability", "可达性路径条件组合"),
+    ("data", "数据依赖图"),
+    ("ctrl", "控制依赖图"),
+)
+
+
+def detect_stage(prompt_text):
+    """根据提示词内容判断调用来自哪个阶段"""
+    for stage, keyword in STAGE_KEYWORDS:
+        if keyword in prompt_text:
+            return stage
+    return "judge"
+
+
+def message_stage(messages):
+    """聊天消息列表对应的阶段"""
+    return detect_stage("\n".join(str(message.content) for message in messages))
+
+
+# 批量提取提示词中每个变异体的分隔行（见batch_extractor.py），应答按同样的分隔行逐个输出
+BATCH_HEADER = "### 变异体 "
+BATCH_END = "### 结束"
+BATCH_HEADER_PATTERN = re.compile(r"^" + re.escape(BATCH_HEADER) + r"(\S+)[ \t]*$", re.MULTILINE)
+
+
+def batch_mutant_ids(prompt_text):
+    """批量提示词中的变异体id（按出现顺序），非批量提示词返回空列表"""
+    return BATCH_HEADER_PATTERN.findall(prompt_text)
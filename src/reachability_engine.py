@@ -0,0 +1,172 @@
+# coding=utf-8
+from program_graph import (BRANCH_LABELS, ProgramGraph, assigned_variables, edge_label, extract_condition,
+                           extract_identifiers, has_opaque_call, node_code, parse_mutated_line)
+
+# 路径爆炸上限：超过后放弃图引擎，交由LLM处理
+MAX_PATHS = 256
+MAX_EXPANSIONS = 200000
+
+ALWAYS_REACHABLE = "NULL"  # 与LLM提示词约定一致：无条件时输出NULL
+UNREACHABLE = "false"  # 入口到变异节点不存在路径
+
+
+class PathExplosion(Exception):
+    """路径数或搜索步数超过上限"""
+
+
+class UnsupportedGraph(Exception):
+    """图中存在引擎无法解释的边（如异常、switch分支），需回退到LLM"""
+
+
+def enumerate_path_literals(graph, targets, max_paths=MAX_PATHS, max_expansions=MAX_EXPANSIONS):
+    """枚举各入口到变异节点（不含变异节点本身）的无环路径，返回(每条路径上的分支条件文字列表, 是否可靠)
+
+    文字为(条件表达式, 分支方向)；循环不重复访问节点，即只枚举首次迭代到达变异点的路径。
+    路径上之后的语句（含谓词自身）写入了文字中的变量时丢弃该文字；经过环上的节点时，该环上任一语句写入的变量
+    同样视为被写入（后续迭代或回边上的赋值不在无环路径上）。保留的文字都是对每次到达变异点时程序状态的约束，
+    条件组合只会放宽、不会把可达的变异点判为不可达；路径或所经过的环上有无法确定写入变量的方法调用时结果标记为不可靠。
+    """
+    targets = set(targets)
+    paths = []
+    sound = True
+    expansions = 0
+    components = graph.cyclic_components()
+    cycle_effects = {}
+    for component in set(components.values()):
+        codes = [node_code(graph.nodes[member]) for member in component]
+        cycle_effects[component] = (set().union(*map(assigned_variables, codes)), any(map(has_opaque_call, codes)))
+    for entry in graph.entry_nodes():
+        stack = [(entry, (entry,), ())]
+        while stack:
+            node_id, visited, literals = stack.pop()
+            if node_id in targets:
+                paths.append(literals)
+                if len(paths) > max_paths:
+                    raise PathExplosion(f"路径数超过{max_paths}")
+                continue
+            code = node_code(graph.nodes[node_id])
+            written = assigned_variables(code)
+            if has_opaque_call(code):
+                sound = False
+            if node_id in components:
+                cycle_written, cycle_opaque = cycle_effects[components[node_id]]
+                written |= cycle_written
+                sound = sound and not cycle_opaque
+            for edge in reversed(graph.out_edges.get(node_id, [])):
+                expansions += 1
+                if expansions > max_expansions:
+                    raise PathExplosion(f"搜索步数超过{max_expansions}")
+                successor = edge["target"]
+                if successor in visited:
+                    continue
+                label = edge_label(edge)
+                if label and label not in BRANCH_LABELS:
+                    raise UnsupportedGraph(f"不支持的控制流边: {label}")
+                step = literals
+                if label:
+                    step = literals + ((extract_condition(code), label == "True"),)
+                if written:
+                    step = tuple(literal for literal in step if written.isdisjoint(extract_identifiers(literal[0])))
+                stack.append((successor, visited + (successor,), step))
+    return paths, sound
+
+
+def simplify_conjunctions(paths):
+    """化简路径条件析取式：去重、吸收(A || A&&B = A)、合并仅差一个互补文字的路径(A&&B || A&&!B = A)"""
+    order = {}
+    for literals in paths:
+        for condition, _ in literals:
+            order.setdefault(condition, len(order))
+    conjunctions = {frozenset(literals) for literals in paths}
+
+    changed = True
+    while changed:
+        changed = False
+        # 吸收律
+        for conj in list(conjunctions):
+            if any(other < conj for other in conjunctions):
+                conjunctions.discard(conj)
+                changed = True
+        # 互补文字合并
+        for conj in list(conjunctions):
+            for condition, polarity in conj:
+                partner = (conj - {(condition, polarity)}) | {(condition, not polarity)}
+                if partner in conjunctions and conj in conjunctions:
+                    conjunctions -= {conj, partner}
+                    conjunctions.add(conj - {(condition, polarity)})
+                    changed = True
+                    break
+
+    def sort_key(literal):
+        return order[literal[0]], not literal[1]
+
+    return sorted((sorted(conj, key=sort_key) for conj in conjunctions),
+                  key=lambda conj: [sort_key(literal) for literal in conj])
+
+
+def format_literal(literal):
+    condition, polarity = literal
+    return f"({condition})" if polarity else f"!({condition})"
+
+
+def format_constraint(conjunctions):
+    """格式化为条件组合字符串：公共条件提到最前，其余路径条件以 || 连接"""
+    if not conjunctions:
+        return UNREACHABLE
+    if any(not conj for conj in conjunctions):
+        return ALWAYS_REACHABLE
+    common = [literal for literal in conjunctions[0] if all(literal in conj for conj in conjunctions[1:])]
+    rests = [[literal for literal in conj if literal not in common] for conj in conjunctions]
+    parts = [format_literal(literal) for literal in common]
+    if len(rests) > 1:
+        alternatives = [" && ".join(format_literal(literal) for literal in rest) for rest in rests]
+        parts.append("(" + " || ".join(f"({alternative})" for alternative in alternatives) + ")")
+    return " && ".join(parts)
+
+
+def analyze_reachability(cfg_info, difference, max_paths=MAX_PATHS):
+    """由控制流图直接计算入口到变异语句之前的路径条件组合
+
+    返回 {"constraint": 条件组合字符串（NULL表示无条件可达，false表示不可达）, "sound": 是否可靠}，
+    sound为True时条件组合中的每个文字都是变异点处程序状态满足的条件，可直接据此判定不可达或作为求解前提；
+    无法定位变异节点、路径爆炸或存在不支持的边时返回None，由调用方回退到LLM。
+    """
+    graph = cfg_info if isinstance(cfg_info, ProgramGraph) else ProgramGraph(cfg_info)
+    line = parse_mutated_line(difference)
+    if line is None:
+        return None
+    targets = graph.nodes_at_line(line)
+    if not targets or not graph.entry_nodes():
+        return None
+    try:
+        paths, sound = enumerate_path_literals(graph, targets, max_paths=max_paths)
+    except (PathExplosion, UnsupportedGraph):
+        return None
+    return {"constraint": format_constraint(simplify_conjunctions(paths)), "sound": sound}
+
+
+def reached_through_loop(cfg_info, difference):
+    """变异节点是否位于控制流图的环上或可经由环到达：此时变异点可能被多次执行，或在循环中的赋值之后执行，
+    入口路径上的条件不一定在每次到达变异点时成立；无法定位变异节点时返回None"""
+    graph = cfg_info if isinstance(cfg_info, ProgramGraph) else ProgramGraph(cfg_info)
+    line = parse_mutated_line(difference)
+    targets = graph.nodes_at_line(line) if line is not None else []
+    if not targets:
+        return None
+    components = graph.cyclic_components()
+    seen, queue = set(targets), list(targets)
+    while queue:
+        node_id = queue.pop()
+        if node_id in components:
+            return True
+        for edge in graph.in_edges.get(node_id, []):
+            if edge["source"] not in seen:
+                seen.add(edge["source"])
+                queue.append(edge["source"])
+    return False
+
+
+def compute_reachability_constraint(cfg_info, difference, max_paths=MAX_PATHS):
+    """analyze_reachability的条件组合字符串，无法处理时返回None"""
+    result = analyze_reachability(cfg_info, difference, max_paths)
+    return result["constraint"] if result else None
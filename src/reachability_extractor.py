@@ -1,28 +1,21 @@
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
 import json
 import re
-import os
-import yaml
+import logging
+from llm_client import get_llm
+from tracing import traced
+from graph_store import get_graph_store
+from reachability_engine import analyze_reachability, compute_reachability_constraint, reached_through_loop
+from reachability_memo import get_reachability_memo, parse_original_line
 from src.extract_mutation_info import extract_mutation_info
 
+# 可达性提取方式：graph为纯图引擎，llm为原LLM提取，auto为图引擎优先、无法处理时回退到LLM
+REACHABILITY_MODE = "auto"
 
-def load_deepseek_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    # return config["deepseek-v3-g"]
-    return config["deepseek-v3"]
-    # return config["deepseek-v3"]
+# 是否在同一程序同一原始行的变异体之间共享可达性约束
+REACHABILITY_MEMO = True
 
-deepseek_config = load_deepseek_config()
-
-def load_gpt_config(config_path="/Users/swan/bishe/LLM4EMD/configs/llm_configs.yaml"):
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return config["gpt-3.5-turbo"]
-
-gpt_config = load_gpt_config()
 
 def extract_cfg_info(cfg_json_path):
     """从CFG JSON文件中提取信息"""
@@ -30,9 +23,8 @@ def extract_cfg_info(cfg_json_path):
         return json.load(f)
 
 
-def extract_reachability_path(llm, cfg_info, mutant_info):
-    """使用LLM提取可达性路径条件组合"""
-    template = """
+# 提取提示词：固定的提取要求作为系统消息在前，图信息与变异体信息在后，导入时编译一次
+REACHABILITY_SYSTEM_PROMPT = """
 根据提供的控制流图信息和变异体信息，严格按照以下要求提取程序入口到变异节点之前(即执行到变异点但尚未执行变异语句)的可达路径条件组合：
 ## 注意：可达性路径条件的含义是变异点能否被执行到，而非变异语句条件是否可以满足，所以只需考虑变异点之前的条件能否满足
 1. 提取步骤：
@@ -42,27 +34,23 @@ def extract_reachability_path(llm, cfg_info, mutant_info):
 2. 输出格式要求：
    可达性路径条件组合:[路径条件组合]
 ## 注意：只包含变异点之前语句的条件，排除变异语句本身及之后语句的条件。
-控制流图信息:
+"""
+REACHABILITY_HUMAN_TEMPLATE = """控制流图信息:
 {cfg_info}
 变异体信息:
 {mutant_info}
 """
+REACHABILITY_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=REACHABILITY_SYSTEM_PROMPT), ("human", REACHABILITY_HUMAN_TEMPLATE)])
 
-    prompt = PromptTemplate(
-        input_variables=["cfg_info", "mutant_info"],
-        template=template
-    )
 
-    # 使用新的 Runnable 语法
-    chain = (
-            {"cfg_info": RunnablePassthrough(), "mutant_info": RunnablePassthrough()}
-            | prompt
-            | llm
-    )
+def extract_reachability_path(llm, cfg_info, mutant_info):
+    """使用LLM提取可达性路径条件组合"""
+    chain = REACHABILITY_PROMPT | llm
 
     # 获取 AI 响应对象
     response = chain.invoke({
-        "cfg_info": json.dumps(cfg_info, indent=2),
+        "cfg_info": cfg_info if isinstance(cfg_info, str) else json.dumps(cfg_info, indent=2),
         "mutant_info": json.dumps(mutant_info, indent=2)
     })
 
@@ -73,43 +61,73 @@ def extract_reachability_path(llm, cfg_info, mutant_info):
     match = re.search(r"可达性路径条件组合:\s*(.*)", response_text)
     return match.group(1).strip() if match else "NULL"
 
-def get_reachability_path(program_name, mutant):
-    """直接返回变异体的可达性路径条件组合"""
-    # 初始化LLM
-    llm = ChatOpenAI(
-        api_key=deepseek_config["api_key"],
-        model=deepseek_config["model"],
-        temperature=0,
-        base_url=deepseek_config["base_url"]
-    )
-    '''
-    llm = ChatOpenAI(
-        openai_api_key=gpt_config["api_key"],
-        model="gpt-3.5-turbo",
-        temperature=0,
-        openai_api_base=gpt_config["base_url"]
-    )
-    '''
-
-    # 示例路径
-    base_dir = r"/Users/swan/bishe/progex_benchmark/mutant_programs"
-    mutants_dir = os.path.join(base_dir, program_name, "mutants")
-
+@traced("reachability")
+def get_reachability_path(program_name, mutant, llm=None, mode=None):
+    """直接返回变异体的可达性路径条件组合，同一原始行上的变异体只计算一次"""
+    mode = mode or REACHABILITY_MODE
+    line = parse_original_line(mutant.get("difference", ""))
+    if not REACHABILITY_MEMO or line is None:
+        return compute_reachability_path(program_name, mutant, llm, mode)
+
+    try:
+        fingerprint = get_graph_store().base_fingerprint(program_name, "CFG")
+    except OSError:
+        return compute_reachability_path(program_name, mutant, llm, mode)
+    return get_reachability_memo().get_or_compute(
+        (program_name, line, fingerprint, mode),
+        lambda: compute_reachability_path(program_name, mutant, llm, mode))
+
+
+def compute_reachability_path(program_name, mutant, llm=None, mode=REACHABILITY_MODE):
+    """计算变异体的可达性路径条件组合（不经过按行记忆）"""
     mutant_id = mutant.get("mutant_id")  # 例如 "MUT_001"
 
-    # 从MUT_001提取数字部分
-    mutant_number = mutant_id.split('_')[-1].zfill(3)
-    mutant_dir = f"mutant_{mutant_number}"
+    # 图文件由进程内图缓存按程序加载，变异体图以相对原程序图的差量保存
+    graph_store = get_graph_store()
 
-    # 构建CFG路径
-    cfg_path = os.path.join(mutants_dir, mutant_dir, "outdir", f"{program_name}-CFG.json")
+    # 图引擎直接在控制流图上枚举路径条件
+    if mode != "llm":
+        cfg_graph = graph_store.get_program_graph(program_name, mutant_id, "CFG")
+        constraint = compute_reachability_constraint(cfg_graph, mutant.get("difference", ""))
+        if constraint is not None:
+            return constraint
+        if mode == "graph":
+            raise ValueError(f"图引擎无法处理变异体 {mutant_id} 的控制流图")
+        logging.info(f"变异体 {mutant_id} 的控制流图无法由图引擎处理，回退到LLM提取可达性")
 
-    # 提取信息
-    cfg_info = extract_cfg_info(cfg_path)
+    # 初始化LLM（未注入时使用进程内共享的客户端）
+    if llm is None:
+        llm = get_llm("deepseek-v3")
+        # llm = get_llm("gpt-3.5-turbo")
 
     # 返回可达性路径
+    cfg_info = graph_store.prompt_fragment(program_name, mutant_id, "CFG", mutant.get("difference", ""))
     return extract_reachability_path(llm, cfg_info, extract_mutation_info(mutant))
 
+def is_sound_reachability(program_name, mutant, constraint):
+    """constraint是否与图引擎对该变异体得出的可靠条件组合一致（见reachability_engine.analyze_reachability）
+
+    只有可靠的条件组合才能直接据此判定不可达、或不经数据依赖图确认就作为求解前提；
+    LLM提取的条件组合与图引擎无法处理的变异体返回False。
+    """
+    try:
+        cfg_graph = get_graph_store().get_program_graph(program_name, mutant.get("mutant_id"), "CFG")
+    except OSError:
+        return False
+    result = analyze_reachability(cfg_graph, mutant.get("difference", ""))
+    return bool(result) and result["sound"] and result["constraint"] == constraint
+
+
+
+def is_loop_mutant(program_name, mutant):
+    """变异点是否位于循环中或可经由循环到达（见reachability_engine.reached_through_loop），此时入口路径条件不能作为
+    必要性判断的前提；控制流图缺失或无法定位变异节点时按是处理"""
+    try:
+        cfg_graph = get_graph_store().get_program_graph(program_name, mutant.get("mutant_id"), "CFG")
+    except OSError:
+        return True
+    return reached_through_loop(cfg_graph, mutant.get("difference", "")) is not False
+
 '''
 if __name__ == "__main__":
     program_name = "ArrayUtilsLastShort"  # 替换成你的目标程序名
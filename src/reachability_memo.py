@@ -0,0 +1,75 @@
+# coding=utf-8
+import threading
+from program_graph import HUNK_PATTERN
+
+
+def parse_original_line(difference):
+    """从diff的hunk头中解析变异语句在原程序中的行号，无法解析时返回None"""
+    match = HUNK_PATTERN.search(difference or "")
+    return int(match.group(1)) if match else None
+
+
+class ReachabilityMemo:
+    """可达性约束的按行记忆：可达性只取决于变异行之前的语句，同一程序同一原始行上的变异体共享一次计算结果
+
+    键为(程序名, 原始行号, 原程序CFG指纹, 提取方式)，原程序图改变时指纹随之改变，旧结果自动失效。
+    并发分析时同一键只计算一次，其余线程等待该次计算完成；计算失败时由等待的线程重新计算。
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.values = {}
+        self.pending = set()
+        self.counters = {}  # program -> {"requests", "computed", "saved"}
+
+    def get_or_compute(self, key, compute):
+        program_name = key[0]
+        with self.condition:
+            counter = self.counters.setdefault(program_name, {"requests": 0, "computed": 0, "saved": 0})
+            counter["requests"] += 1
+            while key in self.pending:
+                self.condition.wait()
+            if key in self.values:
+                counter["saved"] += 1
+                return self.values[key]
+            self.pending.add(key)
+
+        try:
+            value = compute()
+        except BaseException:
+            with self.condition:
+                self.pending.discard(key)
+                self.condition.notify_all()
+            raise
+
+        with self.condition:
+            self.values[key] = value
+            counter["computed"] += 1
+            self.pending.discard(key)
+            self.condition.notify_all()
+        return value
+
+    def stats(self, program_name=None):
+        """按程序统计请求数、实际计算数与节省的计算数"""
+        with self.condition:
+            if program_name is not None:
+                return dict(self.counters.get(program_name, {"requests": 0, "computed": 0, "saved": 0}))
+            return {name: dict(counter) for name, counter in self.counters.items()}
+
+    def clear(self):
+        with self.condition:
+            self.values.clear()
+            self.counters.clear()
+
+
+_default_memo = None
+_default_memo_lock = threading.Lock()
+
+
+def get_reachability_memo():
+    """进程内共享的可达性记忆"""
+    global _default_memo
+    with _default_memo_lock:
+        if _default_memo is None:
+            _default_memo = ReachabilityMemo()
+        return _default_memo
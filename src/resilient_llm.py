@@ -0,0 +1,284 @@
+# coding=utf-8
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+import httpx
+from delegating_chat_model import DelegatingChatModel
+from prompt_stage import message_stage
+import tracing
+
+# 默认配置：单次请求超时、重试次数、退避基数与上限（秒）
+DEFAULT_TIMEOUT = 300.0
+# 流式请求相邻两个输出块之间的最长间隔（秒），首个输出块沿用单次请求超时
+STREAM_IDLE_TIMEOUT = 60.0
+DEFAULT_MAX_RETRIES = 4
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+# 熔断：连续失败达到阈值后拒绝请求，冷却期后放行一次试探请求
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 60.0
+
+# 对冲请求：同一阶段已有足够样本时，请求超过该阶段p95延迟仍未返回则发出一个重复请求
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 1.0
+LATENCY_WINDOW = 200
+
+# 执行单次请求的线程池；超时或被对冲请求抢先的请求无法中断，在后台自然结束
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-attempt")
+_stats_lock = threading.Lock()
+
+# 记入当前span的计数（见tracing.py）
+TRACED_COUNTERS = ("retries", "hedges", "timeouts")
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开期间直接拒绝请求"""
+
+
+class AttemptTimeout(TimeoutError):
+    """单次请求超过超时时间"""
+
+
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error):
+    """429、5xx、超时与连接错误可重试；4xx（鉴权、参数错误等）直接失败"""
+    status = status_code(error)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    return any(cls.__name__ in ("APIConnectionError", "APITimeoutError") for cls in type(error).__mro__)
+
+
+def retry_after(error):
+    """服务端通过Retry-After给出的等待秒数"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+    """指数退避 + 全抖动：在[0, min(上限, base*2^attempt)]内均匀取值"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """连续失败熔断器：closed -> open（拒绝请求） -> half_open（放行一次试探） -> closed/open"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Condition()
+
+    def allow(self, wait=None):
+        """是否放行请求；半开状态下试探请求尚未返回时，wait不为None则最多等待wait秒的试探结果再决定"""
+        deadline = time.monotonic() + (wait or 0.0)
+        with self.lock:
+            while True:
+                if self.state == "open":
+                    if time.monotonic() - self.opened_at < self.reset_seconds:
+                        return False
+                    self.state = "half_open"
+                    return True
+                if self.state == "half_open":
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False  # 试探请求尚未返回
+                    self.lock.wait(remaining)
+                    continue
+                return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.lock.notify_all()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logging.warning(f"LLM熔断器打开：连续失败 {self.failures} 次，{self.reset_seconds} 秒后试探恢复")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self.lock.notify_all()
+
+
+class LatencyTracker:
+    """按阶段记录最近的请求延迟，用于计算对冲阈值"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, stage, fraction, min_samples=HEDGE_MIN_SAMPLES):
+        with self.lock:
+            samples = sorted(self.samples.get(stage, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class ResilientChatModel(DelegatingChatModel):
+    """为任意聊天模型加上单次请求超时、指数退避重试、熔断与对冲请求
+
+    与其他包装模型一样共享内部模型的缓存键，缓存命中时不经过这些逻辑。hedge为False时不发对冲请求；
+    对冲请求会真实发出第二次调用（计入限流配额），先返回者胜出。
+    熔断器半开时，试探请求之外的并发请求等待试探结果（最多timeout秒），试探成功后继续发送而不是直接失败。
+    """
+
+    timeout: float = DEFAULT_TIMEOUT
+    stream_idle_timeout: float = STREAM_IDLE_TIMEOUT
+    max_retries: int = DEFAULT_MAX_RETRIES
+    backoff_base: float = BACKOFF_BASE
+    backoff_max: float = BACKOFF_MAX
+    hedge: bool = True
+    hedge_percentile: float = HEDGE_PERCENTILE
+    hedge_min_samples: int = HEDGE_MIN_SAMPLES
+    hedge_min_delay: float = HEDGE_MIN_DELAY
+    breaker: CircuitBreaker = None
+    latencies: LatencyTracker = None
+    counters: dict = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = self.breaker or CircuitBreaker()
+        self.latencies = self.latencies or LatencyTracker()
+        self.counters = {"calls": 0, "attempts": 0, "retries": 0, "timeouts": 0, "failures": 0,
+                         "hedges": 0, "hedge_wins": 0, "rejected": 0}
+
+    def _count(self, name, amount=1):
+        with _stats_lock:
+            self.counters[name] += amount
+        if name in TRACED_COUNTERS:
+            tracing.record(**{name: amount})
+
+    def _timed_call(self, stage, messages, stop, kwargs):
+        start_time = time.perf_counter()
+        result = self.llm._generate(messages, stop=stop, **kwargs)
+        self.latencies.record(stage, time.perf_counter() - start_time)
+        return result
+
+    def _attempt(self, stage, messages, stop, kwargs):
+        """执行一次（可能带对冲的）请求，超过timeout抛出AttemptTimeout"""
+        deadline = time.monotonic() + self.timeout
+        futures = [_executor.submit(self._timed_call, stage, messages, stop, kwargs)]
+        self._count("attempts")
+        hedge_delay = self.latencies.percentile(stage, self.hedge_percentile, self.hedge_min_samples) \
+            if self.hedge else None
+        if hedge_delay is not None:
+            hedge_delay = max(hedge_delay, self.hedge_min_delay)
+            done, _ = wait(futures, timeout=min(hedge_delay, self.timeout))
+            if not done and time.monotonic() < deadline:
+                futures.append(_executor.submit(self._timed_call, stage, messages, stop, kwargs))
+                self._count("hedges")
+
+        errors = []
+        while futures:
+            done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise AttemptTimeout(f"LLM请求超过 {self.timeout} 秒未返回")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count("hedge_wins")
+                    return future.result()
+                errors.append(future.exception())
+            futures = list(pending)
+        raise errors[0]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._count("calls")
+        stage = message_stage(messages)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow(wait=self.timeout):
+                self._count("rejected")
+                raise CircuitOpenError("LLM熔断器已打开，暂停发送请求")
+            try:
+                result = self._attempt(stage, messages, stop, kwargs)
+            except Exception as e:
+                if isinstance(e, AttemptTimeout):
+                    self._count("timeouts")
+                self.breaker.record_failure()
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = retry_after(e) or backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                self._count("retries")
+                logging.warning(f"LLM请求失败（{type(e).__name__}: {e}），{delay:.2f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _next_chunk(self, iterator, timeout, first):
+        """在执行线程中读取下一个输出块，超过timeout抛出AttemptTimeout（读取无法中断，在后台自然结束）"""
+        future = _executor.submit(next, iterator, None)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise AttemptTimeout(f"LLM流式请求超过 {timeout} 秒未返回" + ("首个输出块" if first else "下一个输出块"))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        """流式请求只在收到第一块之前重试；开始输出后不再对冲或重试
+
+        首个输出块须在timeout秒内到达，之后相邻输出块的间隔不超过stream_idle_timeout秒，否则按超时失败。
+        """
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow(wait=self.timeout):
+                self._count("rejected")
+                raise CircuitOpenError("LLM熔断器已打开，暂停发送请求")
+            started = False
+            iterator = self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                while True:
+                    chunk = self._next_chunk(iterator, self.stream_idle_timeout if started else self.timeout,
+                                             not started)
+                    if chunk is None:
+                        break
+                    if not started:
+                        # 收到首块即视为请求成功：调用方提前结束读取（如给出结论后停止）时熔断器也能恢复
+                        started = True
+                        self.breaker.record_success()
+                    yield chunk
+            except Exception as e:
+                if isinstance(e, AttemptTimeout):
+                    self._count("timeouts")
+                self.breaker.record_failure()
+                if started or not is_retryable(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(retry_after(e) or backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                continue
+            if not started:
+                self.breaker.record_success()
+            return
+
+    def stats(self):
+        with _stats_lock:
+            return dict(self.counters, breaker=self.breaker.state)
@@ -1,12 +1,15 @@
 import json
 
 
-def compare_equivalence(json_file_path, txt_file_path):
-    # 读取JSON文件
+def load_truth(json_file_path):
+    """读取变异体真实等价性 {mutant_id: 是否等价}"""
     with open(json_file_path, 'r', encoding='utf-8') as json_file:
         json_data = json.load(json_file)
+    return {mutant['mutant_id']: mutant['equivalence'] for mutant in json_data}
+
 
-    # 读取TXT文件并解析为字典
+def load_verdicts(txt_file_path):
+    """读取判定结果文件（每行 MUT_001: YES）{mutant_id: 是否判定为等价}"""
     txt_data = {}
     with open(txt_file_path, 'r', encoding='utf-8') as txt_file:
         for line in txt_file:
@@ -17,38 +20,51 @@ def compare_equivalence(json_file_path, txt_file_path):
                     mutant_id = parts[0].strip()
                     equivalence_txt = parts[1].strip().upper()  # 转换为大写确保比较
                     txt_data[mutant_id] = equivalence_txt == 'YES'  # 转换为布尔值
+    return txt_data
 
+
+def equivalence_accuracy(truth, verdicts):
+    """比较真实等价性与判定结果，返回正确数、总数、准确率、不匹配与缺失的变异体"""
     right_count = 0
-    total_mutants = len(json_data)
     mismatched_mutants = []
-
-    # 比较JSON和TXT中的等价性信息
-    for mutant in json_data:
-        mutant_id = mutant['mutant_id']
-        equivalence_json = mutant['equivalence']
-
-        if mutant_id in txt_data:
-            equivalence_txt = txt_data[mutant_id]
-            if equivalence_json == equivalence_txt:
+    missing_mutants = []
+    for mutant_id, equivalence_json in truth.items():
+        if mutant_id in verdicts:
+            if equivalence_json == verdicts[mutant_id]:
                 right_count += 1
             else:
                 mismatched_mutants.append(mutant_id)
         else:
-            print(f"警告: 变异体 {mutant_id} 在TXT文件中未找到")
+            missing_mutants.append(mutant_id)
+    return {
+        "right": right_count,
+        "total": len(truth),
+        "accuracy": right_count / len(truth) if truth else 0.0,
+        "mismatched": mismatched_mutants,
+        "missing": missing_mutants,
+    }
+
+
+def compare_equivalence(json_file_path, txt_file_path):
+    result = equivalence_accuracy(load_truth(json_file_path), load_verdicts(txt_file_path))
+    for mutant_id in result["missing"]:
+        print(f"警告: 变异体 {mutant_id} 在TXT文件中未找到")
 
     # 输出结果
-    print(f"正确匹配的变异体数量: {right_count}")
-    print(f"变异体总数: {total_mutants}")
-    print(f"匹配准确率: {right_count / total_mutants * 100:.2f}%")
+    print(f"正确匹配的变异体数量: {result['right']}")
+    print(f"变异体总数: {result['total']}")
+    print(f"匹配准确率: {result['accuracy'] * 100:.2f}%")
 
-    if mismatched_mutants:
+    if result["mismatched"]:
         print("\n不匹配的变异体编号:")
-        for mutant_id in mismatched_mutants:
+        for mutant_id in result["mismatched"]:
             print(mutant_id)
     else:
         print("\n所有变异体匹配一致")
+    return result
 
 
-json_file_path = '/Users/swan/bishe/LLM4EMD/fail_mutants_equ/ArrayUtils_fail_mutants.json'  # 替换为你的JSON文件路径
-txt_file_path = '/Users/swan/bishe/LLM4EMD/fail_emd_results/ArrayUtils_results'  # 替换为你的TXT文件路径
-compare_equivalence(json_file_path, txt_file_path)
\ No newline at end of file
+if __name__ == "__main__":
+    json_file_path = '/Users/swan/bishe/LLM4EMD/fail_mutants_equ/ArrayUtils_fail_mutants.json'  # 替换为你的JSON文件路径
+    txt_file_path = '/Users/swan/bishe/LLM4EMD/fail_emd_results/ArrayUtils_results'  # 替换为你的TXT文件路径
+    compare_equivalence(json_file_path, txt_file_path)
@@ -0,0 +1,100 @@
+# coding=utf-8
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# 与result_extractor.py相同的判定结果格式
+VERDICT_PATTERN = re.compile(r"等价变异体判定结果：\s*(\w+)")
+
+
+def journal_path(log_filename):
+    """日志文件对应的结果日志：xxx_results.log -> xxx_results.journal.jsonl"""
+    return os.path.splitext(log_filename)[0] + ".journal.jsonl"
+
+
+def parse_verdict(analysis):
+    """从分析文本中取最后一次出现的判定结果（YES/NO），没有时返回None"""
+    matches = VERDICT_PATTERN.findall(analysis or "")
+    return matches[-1].upper() if matches else None
+
+
+class ResultJournal:
+    """只追加的结果日志：每个变异体一行JSON，写入后立即fsync，进程崩溃或中断时已完成的结果不会丢失
+
+    同一变异体可能出现多条记录（失败后重试），读取时以最后一条为准。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._terminate_partial_line()
+
+    def _terminate_partial_line(self):
+        """上次崩溃时末行可能只写了一半，补上换行，避免新记录接在残行之后"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def append(self, program, mutant_id, analysis=None, error=None, time_cost=None, model=None, provenance=None,
+               fingerprints=None):
+        """provenance为复用他人判定结果时的代表变异体信息（见mutant_dedup.py）；
+        fingerprints为影响该结果的各项输入的指纹，增量重跑时据此判断需要重算的部分（见incremental.py）"""
+        record = {
+            "mutant_id": mutant_id,
+            "program": program,
+            "status": "ok" if error is None else "failed",
+            "verdict": parse_verdict(analysis) if error is None else None,
+            "analysis": analysis,
+            "error": error,
+            "time_cost": time_cost,
+            "model": model,
+            "provenance": provenance,
+            "fingerprints": fingerprints,
+            "timestamp": time.time(),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        return record
+
+    def load(self):
+        """返回 {mutant_id: 最后一条记录}；忽略崩溃时写了一半的末行"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["mutant_id"]] = record
+        return records
+
+    def completed(self):
+        """已成功完成且得到判定结果的变异体 {mutant_id: 记录}，续跑时跳过这些变异体；
+        应答被截断、超出预算或缺少判定结果行的记录不算完成，续跑时重新分析"""
+        return {mutant_id: record for mutant_id, record in self.load().items()
+                if record["status"] == "ok" and record["verdict"]}
+
+    def export_results(self, output_file_path):
+        """按result_extractor.py的格式导出判定结果（MUT_001: YES）"""
+        records = self.load()
+        completed = self.completed()
+        missing = [mutant_id for mutant_id, record in records.items()
+                   if record["status"] == "ok" and mutant_id not in completed]
+        if missing:
+            logging.warning(f"{len(missing)} 个变异体的分析结果中没有判定结果，未导出: {', '.join(missing)}")
+        with open(output_file_path, "w", encoding="utf-8") as f:
+            for mutant_id, record in completed.items():
+                f.write(f"{mutant_id}: {record['verdict']}\n")
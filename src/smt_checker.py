@@ -0,0 +1,458 @@
+# coding=utf-8
+import re
+import threading
+import time
+from path_constraint import split_top_level, strip_parens
+from program_graph import (ProgramGraph, extract_condition, extract_identifiers, flow_variable, node_code,
+                           parse_diff_lines, parse_mutated_line)
+
+try:
+    import z3
+except ImportError:  # z3为可选依赖，未安装时求解器阶段直接跳过，全部交给LLM
+    z3 = None
+
+# 单次求解的超时（毫秒），超时视为无法判定
+SOLVER_TIMEOUT_MS = 2000
+
+# Java整数类型 -> 位宽；运算时按Java规则提升为int(32位)或long(64位)
+INTEGER_WIDTHS = {"byte": 8, "short": 16, "char": 16, "int": 32, "long": 64}
+PRIMITIVE_TYPES = ("boolean", "byte", "short", "char", "int", "long", "float", "double")
+
+JAVA_CONSTANTS = {
+    "Integer.MAX_VALUE": (2 ** 31 - 1, 32), "Integer.MIN_VALUE": (-2 ** 31, 32),
+    "Long.MAX_VALUE": (2 ** 63 - 1, 64), "Long.MIN_VALUE": (-2 ** 63, 64),
+    "Short.MAX_VALUE": (2 ** 15 - 1, 32), "Short.MIN_VALUE": (-2 ** 15, 32),
+    "Byte.MAX_VALUE": (2 ** 7 - 1, 32), "Byte.MIN_VALUE": (-2 ** 7, 32),
+}
+
+DECLARATION_PATTERN = re.compile(
+    r"\b(" + "|".join(PRIMITIVE_TYPES) + r")((?:\s*\[\s*\])*)\s+"
+    r"([A-Za-z_$][\w$]*(?:\s*(?:=[^,;(){}]*)?,\s*[A-Za-z_$][\w$]*(?=\s*[=,;]))*)")
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(0[xX][0-9a-fA-F]+[lL]?|\d+[lL]?)(?![\w.])|([A-Za-z_$][\w$]*(?:\s*\.\s*[A-Za-z_$][\w$]*)*)"
+    r"|(>>>|<<|>>|<=|>=|==|!=|&&|\|\||\+\+|--|[-+*/%<>!~&|^?:()\[\]]))")
+
+# 二元运算符的结合力（Java运算符优先级，数值越大结合越紧）
+BINARY_PRECEDENCE = {
+    "||": 1, "&&": 2, "|": 3, "^": 4, "&": 5, "==": 6, "!=": 6,
+    "<": 7, "<=": 7, ">": 7, ">=": 7, "<<": 8, ">>": 8, ">>>": 8,
+    "+": 9, "-": 9, "*": 10, "/": 10, "%": 10,
+}
+TERNARY_PRECEDENCE = 0
+UNARY_PRECEDENCE = 11
+
+# 语句形式：条件语句比较条件表达式，赋值与返回语句比较右侧表达式
+CONDITION_PATTERN = re.compile(r"^(\}?\s*(?:else\s+)?(?:if|while))\s*\((.*)\)\s*\{?$")
+RETURN_PATTERN = re.compile(r"^return\s+(.*?);?$")
+ASSIGNMENT_PATTERN = re.compile(r"^((?:[\w$]+(?:\s*\[\s*\])*\s+)?[A-Za-z_$][\w$]*)\s*=(?!=)\s*(.*?);?$")
+
+
+class Untranslatable(Exception):
+    """表达式超出支持范围（浮点、方法调用、数组元素、自增自减等），交由LLM判断"""
+
+
+def declared_types(program_code):
+    """从Java源码的变量/参数声明中推断变量类型：变量名 -> (类型, 是否数组)"""
+    types = {}
+    for match in DECLARATION_PATTERN.finditer(program_code or ""):
+        type_name, dims = match.group(1), match.group(2)
+        for declarator in match.group(3).split(","):
+            name = declarator.split("=")[0].strip()
+            if name:
+                types.setdefault(name, (type_name, bool(dims.strip())))
+    return types
+
+
+def tokenize(expr):
+    tokens, position = [], 0
+    expr = expr.strip()
+    while position < len(expr):
+        match = TOKEN_PATTERN.match(expr, position)
+        if not match or match.end() == position:
+            raise Untranslatable(f"无法识别的符号: {expr[position:]}")
+        number, name, operator = match.groups()
+        if number:
+            tokens.append(("number", number))
+        elif name:
+            tokens.append(("name", re.sub(r"\s+", "", name)))
+        else:
+            tokens.append(("op", operator))
+        position = match.end()
+    return tokens
+
+
+class Translator:
+    """把Java表达式翻译为z3项：整数按位向量建模（与Java溢出语义一致），布尔按Bool建模
+
+    同一Translator翻译的多个表达式共享变量符号，附加约束（如数组长度非负）记录在axioms中。
+    """
+
+    def __init__(self, types):
+        self.types = types
+        self.symbols = {}
+        self.axioms = []
+
+    # ---- 值与类型 ----
+    @staticmethod
+    def widen(term, width, unsigned=False):
+        if term.size() == width:
+            return term
+        if term.size() > width:
+            return z3.Extract(width - 1, 0, term)
+        extend = z3.ZeroExt if unsigned else z3.SignExt
+        return extend(width - term.size(), term)
+
+    def numeric(self, term):
+        if z3.is_bool(term):
+            raise Untranslatable("布尔值参与了算术运算")
+        return term
+
+    def promote(self, left, right):
+        """Java二元数值提升：任一为long时两边都提升为64位，否则为32位"""
+        left, right = self.numeric(left), self.numeric(right)
+        width = max(left.size(), right.size(), 32)
+        return self.widen(left, width), self.widen(right, width)
+
+    def variable(self, name):
+        if name in self.symbols:
+            return self.symbols[name]
+        if name in JAVA_CONSTANTS:
+            value, width = JAVA_CONSTANTS[name]
+            return z3.BitVecVal(value, width)
+        if name.endswith(".length") and self.types.get(name[:-len(".length")], (None, False))[1]:
+            term = z3.BitVec(name, 32)
+            self.axioms.append(term >= 0)
+        elif name in self.types and not self.types[name][1]:
+            type_name = self.types[name][0]
+            if type_name == "boolean":
+                term = z3.Bool(name)
+            elif type_name in INTEGER_WIDTHS:
+                raw = z3.BitVec(name, INTEGER_WIDTHS[type_name])
+                term = self.widen(raw, max(INTEGER_WIDTHS[type_name], 32), unsigned=type_name == "char")
+            else:
+                raise Untranslatable(f"不支持的类型 {type_name}: {name}")
+        else:
+            raise Untranslatable(f"未知变量: {name}")
+        self.symbols[name] = term
+        return term
+
+    # ---- 语法分析（按Java优先级的Pratt解析） ----
+    def translate(self, expr):
+        self.tokens, self.position = tokenize(expr), 0
+        if not self.tokens:
+            raise Untranslatable("空表达式")
+        term = self.expression(TERNARY_PRECEDENCE)
+        if self.position != len(self.tokens):
+            raise Untranslatable(f"表达式未完全解析: {expr}")
+        return term
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token[0] is None or (expected is not None and token[1] != expected):
+            raise Untranslatable(f"缺少 {expected}")
+        self.position += 1
+        return token
+
+    def expression(self, min_precedence):
+        left = self.unary()
+        while True:
+            kind, value = self.peek()
+            if kind != "op":
+                return left
+            if value == "?" and min_precedence <= TERNARY_PRECEDENCE:
+                self.take()
+                then_term = self.expression(TERNARY_PRECEDENCE)
+                self.take(":")
+                else_term = self.expression(TERNARY_PRECEDENCE)
+                left = self.conditional(left, then_term, else_term)
+                continue
+            precedence = BINARY_PRECEDENCE.get(value)
+            if precedence is None or precedence < min_precedence:
+                return left
+            self.take()
+            right = self.expression(precedence + 1)
+            left = self.binary(value, left, right)
+
+    def unary(self):
+        kind, value = self.take()
+        if kind == "number":
+            literal = value.rstrip("lL")
+            width = 64 if value[-1] in "lL" else 32
+            try:
+                if literal[:2] in ("0x", "0X"):
+                    return z3.BitVecVal(int(literal, 16), width)
+                return z3.BitVecVal(int(literal, 8 if len(literal) > 1 and literal[0] == "0" else 10), width)
+            except ValueError:
+                raise Untranslatable(f"非法整数字面量: {value}")
+        if kind == "name":
+            if value in ("true", "false"):
+                return z3.BoolVal(value == "true")
+            if self.peek()[1] in ("(", "["):
+                raise Untranslatable(f"不支持方法调用或数组元素: {value}")
+            if self.peek()[1] in ("++", "--"):
+                raise Untranslatable("表达式含自增/自减")
+            return self.variable(value)
+        if value == "(":
+            if self.peek()[0] == "name" and self.peek()[1] in PRIMITIVE_TYPES \
+                    and self.position + 1 < len(self.tokens) and self.tokens[self.position + 1][1] == ")":
+                type_name = self.take()[1]
+                self.take(")")
+                return self.cast(type_name, self.expression(UNARY_PRECEDENCE))
+            term = self.expression(TERNARY_PRECEDENCE)
+            self.take(")")
+            return term
+        if value in ("++", "--"):
+            raise Untranslatable("表达式含自增/自减")
+        if value not in ("!", "~", "-", "+"):
+            raise Untranslatable(f"不支持的运算符: {value}")
+        operand = self.expression(UNARY_PRECEDENCE)
+        if value == "!":
+            if not z3.is_bool(operand):
+                raise Untranslatable("!作用于非布尔值")
+            return z3.Not(operand)
+        if value == "~":
+            return ~self.widen(self.numeric(operand), max(operand.size(), 32))
+        if value == "-":
+            return -self.widen(self.numeric(operand), max(operand.size(), 32))
+        return self.widen(self.numeric(operand), max(operand.size(), 32))
+
+    def cast(self, type_name, term):
+        if type_name not in INTEGER_WIDTHS:
+            raise Untranslatable(f"不支持的类型转换: {type_name}")
+        width = INTEGER_WIDTHS[type_name]
+        narrowed = self.widen(self.numeric(term), width)
+        return self.widen(narrowed, max(width, 32), unsigned=type_name == "char")
+
+    def conditional(self, condition, then_term, else_term):
+        if not z3.is_bool(condition):
+            raise Untranslatable("条件表达式的条件不是布尔值")
+        if z3.is_bool(then_term) != z3.is_bool(else_term):
+            raise Untranslatable("条件表达式两个分支类型不同")
+        if not z3.is_bool(then_term):
+            then_term, else_term = self.promote(then_term, else_term)
+        return z3.If(condition, then_term, else_term)
+
+    def binary(self, operator, left, right):
+        if operator in ("&&", "||"):
+            if not (z3.is_bool(left) and z3.is_bool(right)):
+                raise Untranslatable(f"{operator}作用于非布尔值")
+            return z3.And(left, right) if operator == "&&" else z3.Or(left, right)
+        if operator in ("&", "|", "^") and z3.is_bool(left) and z3.is_bool(right):
+            return {"&": z3.And, "|": z3.Or, "^": z3.Xor}[operator](left, right)
+        if operator in ("==", "!=") and z3.is_bool(left) and z3.is_bool(right):
+            return left == right if operator == "==" else left != right
+        if operator in ("<<", ">>", ">>>"):
+            left = self.widen(self.numeric(left), max(left.size(), 32))
+            amount = self.widen(self.numeric(right), left.size()) & (left.size() - 1)
+            return {"<<": lambda: left << amount, ">>": lambda: left >> amount,
+                    ">>>": lambda: z3.LShR(left, amount)}[operator]()
+
+        left, right = self.promote(left, right)
+        if operator in ("/", "%"):
+            # Java整数除零会抛出异常，只支持非零常量除数
+            if not z3.is_bv_value(z3.simplify(right)) or z3.simplify(right).as_long() == 0:
+                raise Untranslatable("除数不是非零常量")
+            return left / right if operator == "/" else z3.SRem(left, right)
+        return {
+            "+": lambda: left + right, "-": lambda: left - right, "*": lambda: left * right,
+            "&": lambda: left & right, "|": lambda: left | right, "^": lambda: left ^ right,
+            "==": lambda: left == right, "!=": lambda: left != right,
+            "<": lambda: left < right, "<=": lambda: left <= right,
+            ">": lambda: left > right, ">=": lambda: left >= right,
+        }[operator]()
+
+
+def changed_expressions(difference):
+    """从diff中取出需比较的(原表达式, 变异表达式, 是否循环条件)：条件语句取条件，返回/赋值语句取右侧表达式
+
+    语句形式不同（如删除语句）时返回None。
+    """
+    original, mutated = parse_diff_lines(difference)
+    for pattern in (CONDITION_PATTERN, RETURN_PATTERN, ASSIGNMENT_PATTERN):
+        original_match, mutated_match = pattern.match(original), pattern.match(mutated)
+        if original_match and mutated_match:
+            if pattern is not RETURN_PATTERN and original_match.group(1).strip() != mutated_match.group(1).strip():
+                return None
+            is_loop = pattern is CONDITION_PATTERN and original_match.group(1).strip().endswith("while")
+            return original_match.groups()[-1], mutated_match.groups()[-1], is_loop
+    return None
+
+
+def format_value(value):
+    """位向量按有符号整数输出"""
+    return value.as_signed_long() if z3.is_bv_value(value) else value
+
+
+def solve(assertions):
+    """返回(结果, 模型文本)，结果为sat/unsat/unknown"""
+    solver = z3.Solver()
+    solver.set("timeout", SOLVER_TIMEOUT_MS)
+    solver.add(*assertions)
+    result = solver.check()
+    if result == z3.sat:
+        model = solver.model()
+        witness = ", ".join(f"{declaration.name()}={format_value(model[declaration])}"
+                            for declaration in sorted(model.decls(), key=lambda decl: decl.name()))
+        return "sat", witness
+    return ("unsat" if result == z3.unsat else "unknown"), None
+
+
+def normalize_condition(text):
+    return re.sub(r"\s+", "", strip_parens(text))
+
+
+def reaching_definitions(graph, node_id, variable):
+    """数据依赖图中到达node_id的variable的定义节点"""
+    return {edge["source"] for edge in graph.in_edges.get(node_id, []) if flow_variable(edge) == variable}
+
+
+def uses_variable(graph, node_id, variable):
+    node = graph.nodes[node_id]
+    if "uses" in node:
+        return variable in node["uses"]
+    return variable in extract_identifiers(node_code(node))
+
+
+def stable_conjuncts(conjuncts, data_graph, line, types):
+    """路径条件中能作为变异点处前提的合取项
+
+    合取项须是单个分支条件（或其否定），且条件中的每个变量都被变异语句使用、
+    到达变异语句的定义与到达该分支谓词的定义相同，即谓词与变异点之间没有重新定义该变量；
+    找不到对应谓词或无法确认的合取项一律不作为前提（只会使不可达与非必要更难成立）。
+    """
+    graph = data_graph if isinstance(data_graph, ProgramGraph) else ProgramGraph(data_graph)
+    targets = graph.nodes_at_line(line)
+    if not targets:
+        return []
+    predicates = {}
+    for node_id, node in graph.nodes.items():
+        if node.get("line") != line:
+            predicates.setdefault(normalize_condition(extract_condition(node_code(node))), []).append(node_id)
+
+    stable = []
+    for conjunct in conjuncts:
+        atom = strip_parens(conjunct)
+        if atom.startswith("!"):
+            atom = strip_parens(atom[1:])
+        candidates = predicates.get(normalize_condition(atom))
+        if not candidates:
+            continue
+        variables = [name for name in extract_identifiers(atom) if name in types]
+        if all(uses_variable(graph, target, variable) and
+               reaching_definitions(graph, target, variable) == reaching_definitions(graph, predicate, variable)
+               for variable in variables for target in targets for predicate in candidates):
+            stable.append(conjunct)
+    return stable
+
+
+def check_mutant(program_code, mutant, reachability_constraint, data_graph=None, sound=False, in_loop=False):
+    """用SMT求解器判定等价性步骤1（不可达）与步骤2（非必要）
+
+    返回dict：outcome为unreachable（路径条件不可满足）、not_necessary（路径约束下原表达式与变异表达式恒等）、
+    distinguishable（存在使两者取值不同的输入，附反例）、inconclusive（超时或无法判定）、
+    untranslatable（无法翻译）；只有前两种给出确定结论（等价）。
+
+    路径条件只有在其中的变量到变异点之前未被重新赋值时才是变异点处的前提：sound为True表示条件组合已保证这一点
+    （见reachability_engine.analyze_reachability）；否则按数据依赖图data_graph（变异体的PDG-DATA）
+    只保留变量未被重新定义的合取项，未提供data_graph时不使用路径条件。
+    in_loop为True表示变异点位于循环中或可经由循环到达（见reachability_engine.reached_through_loop），
+    此时变异点可能被多次执行，必要性判断不以路径条件为前提。
+    """
+    result = {"outcome": "untranslatable", "verdict": None, "reason": None, "model": None, "seconds": 0.0}
+    if z3 is None:
+        result["reason"] = "未安装z3"
+        return result
+
+    start = time.perf_counter()
+    types = declared_types(program_code)
+    translator = Translator(types)
+    constraint_text = (reachability_constraint or "").strip().rstrip("。;；").strip()
+    if not sound and constraint_text.lower() not in ("", "null", "true"):
+        conjuncts = split_top_level(strip_parens(constraint_text), "&&")
+        line = parse_mutated_line(mutant.get("difference", ""))
+        kept = stable_conjuncts(conjuncts, data_graph, line, types) if data_graph is not None and line else []
+        if len(kept) < len(conjuncts):
+            result["reason"] = f"路径条件中 {len(conjuncts) - len(kept)} 个合取项无法确认在变异点处成立，未作为前提"
+        constraint_text = " && ".join(f"({conjunct})" for conjunct in kept)
+    try:
+        if constraint_text.lower() in ("", "null", "true"):
+            constraint = z3.BoolVal(True)
+        elif constraint_text.lower() == "false":
+            constraint = z3.BoolVal(False)
+        else:
+            constraint = translator.translate(constraint_text)
+            if not z3.is_bool(constraint):
+                raise Untranslatable("路径条件不是布尔表达式")
+    except (Untranslatable, z3.Z3Exception) as e:
+        constraint = None
+        result["reason"] = f"路径条件无法翻译: {e}"
+
+    if constraint is not None:
+        status, witness = solve([constraint] + translator.axioms)
+        if status == "unsat":
+            result.update(outcome="unreachable", verdict="YES", reason="路径条件不可满足",
+                          seconds=time.perf_counter() - start)
+            return result
+        if status == "unknown":
+            result.update(outcome="inconclusive", reason="路径条件求解超时",
+                          seconds=time.perf_counter() - start)
+            return result
+        result["model"] = witness  # 可达性见证
+
+    expressions = changed_expressions(mutant.get("difference", ""))
+    if expressions is None:
+        result.update(reason=result["reason"] or "变异语句形式不支持", seconds=time.perf_counter() - start)
+        return result
+    original_text, mutated_text, is_loop = expressions
+    try:
+        original, mutated = translator.translate(original_text), translator.translate(mutated_text)
+        if z3.is_bool(original) != z3.is_bool(mutated):
+            raise Untranslatable("原表达式与变异表达式类型不同")
+        if not z3.is_bool(original):
+            original, mutated = translator.promote(original, mutated)
+    except (Untranslatable, z3.Z3Exception) as e:
+        result.update(reason=f"变异表达式无法翻译: {e}", seconds=time.perf_counter() - start)
+        return result
+
+    # 循环中的语句（含循环条件）在后续迭代中的取值不受入口路径条件约束，路径条件无法翻译时同样只能在全部输入上判断是否恒等
+    assumptions = [constraint] if constraint is not None and not is_loop and not in_loop else []
+    status, witness = solve(assumptions + translator.axioms + [original != mutated])
+    result["seconds"] = time.perf_counter() - start
+    if status == "unsat":
+        result.update(outcome="not_necessary", verdict="YES",
+                      reason=f"在路径约束下 {original_text} 与 {mutated_text} 恒等", model=None)
+    elif status == "sat":
+        result.update(outcome="distinguishable", reason=f"{original_text} 与 {mutated_text} 取值可以不同",
+                      model=witness)
+    else:
+        result.update(outcome="inconclusive", reason="必要性求解超时")
+    return result
+
+
+_lock = threading.Lock()
+_stats = {"mutants": 0, "resolved": 0, "resolved_without_llm": 0, "solver_seconds": 0.0, "outcomes": {}}
+
+
+def record_result(result, llm_calls):
+    """累计求解器统计；llm_calls为得到该结论前实际发出的LLM请求数（如可达性回退到LLM）"""
+    with _lock:
+        _stats["mutants"] += 1
+        _stats["solver_seconds"] += result["seconds"]
+        _stats["outcomes"][result["outcome"]] = _stats["outcomes"].get(result["outcome"], 0) + 1
+        if result["verdict"]:
+            _stats["resolved"] += 1
+            if not llm_calls:
+                _stats["resolved_without_llm"] += 1
+
+
+def solver_report():
+    """求解器耗时与不调用LLM即得出结论的变异体比例"""
+    with _lock:
+        mutants = _stats["mutants"]
+        return dict(_stats, outcomes=dict(_stats["outcomes"]),
+                    solver_seconds=round(_stats["solver_seconds"], 4),
+                    resolved_ratio=round(_stats["resolved"] / mutants, 4) if mutants else 0.0,
+                    resolved_without_llm_ratio=round(_stats["resolved_without_llm"] / mutants, 4) if mutants else 0.0)
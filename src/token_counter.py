@@ -0,0 +1,34 @@
+# coding=utf-8
+import re
+
+try:
+    import tiktoken
+except ImportError:  # 未安装tiktoken时退化为按字符估算
+    tiktoken = None
+
+CJK_PATTERN = re.compile(r"[一-鿿　-〿＀-￯]")
+
+_encoding = None
+
+
+def count_tokens(text):
+    """估算文本的token数：优先使用tiktoken，否则中文按1字1token、其余按4字符1token估算"""
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None and _encoding is not False:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:  # 离线环境下无法下载编码表
+                _encoding = False
+        if _encoding:
+            return len(_encoding.encode(text, disallowed_special=()))
+
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def count_message_tokens(messages):
+    """估算一组聊天消息的token数"""
+    return sum(count_tokens(str(message.content)) for message in messages)
@@ -0,0 +1,270 @@
+# coding=utf-8
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from delegating_chat_model import DelegatingChatModel
+from token_counter import count_message_tokens, count_tokens
+
+# 各阶段累计的计数指标；LLM调用、等待LLM的耗时与token数由TracingChatModel记录，重试/对冲/超时由resilient_llm记录，缓存命中由llm_cache记录
+METRIC_NAMES = ("llm_calls", "llm_seconds", "prompt_tokens", "completion_tokens", "cached_tokens", "estimated_tokens",
+                "cache_hits", "retries", "hedges", "timeouts")
+REPORT_QUANTILES = (0.5, 0.95)
+PROMETHEUS_PREFIX = "llm4emd"
+
+# 当前上下文中打开的span（由外到内），线程池中执行时需复制上下文（contextvars.copy_context）
+_current_spans = contextvars.ContextVar("current_spans", default=())
+_record_lock = threading.Lock()
+
+
+def trace_path(log_filename):
+    """日志文件对应的span日志：xxx_results.log -> xxx_results.trace.jsonl"""
+    return os.path.splitext(log_filename)[0] + ".trace.jsonl"
+
+
+def metrics_path(log_filename):
+    """日志文件对应的Prometheus文本格式指标：xxx_results.log -> xxx_results.prom"""
+    return os.path.splitext(log_filename)[0] + ".prom"
+
+
+def percentile(values, fraction):
+    """最近秩百分位数"""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+class Span:
+    def __init__(self, span_id, parent, stage, attributes):
+        self.span_id = span_id
+        self.parent_id = parent.span_id if parent else None
+        self.stage = stage
+        # 程序名与变异体id从外层span继承
+        self.attributes = dict(parent.attributes) if parent else {}
+        self.attributes.update(attributes)
+        self.metrics = dict.fromkeys(METRIC_NAMES, 0)
+        self.start = time.time()
+        self.start_counter = time.perf_counter()
+        self.seconds = None
+        self.status = "ok"
+        self.error = None
+
+    def to_record(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "stage": self.stage,
+            "program": self.attributes.get("program"),
+            "mutant_id": self.attributes.get("mutant_id"),
+            "start": round(self.start, 4),
+            "seconds": round(self.seconds, 4),
+            "status": self.status,
+            "error": self.error,
+            **self.metrics,
+            "llm_seconds": round(self.metrics["llm_seconds"], 4),
+        }
+
+
+class Tracer:
+    """记录各阶段span（耗时、token数、重试次数），可选逐条追加到JSONL文件
+
+    span的计数指标是包含式的：内层span记录的token数同时计入所有外层span（如mutant）。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = []
+        self.ids = itertools.count(1)
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        spans = _current_spans.get()
+        span = Span(next(self.ids), spans[-1] if spans else None, stage, attributes)
+        token = _current_spans.set(spans + (span,))
+        try:
+            yield span
+        except BaseException as e:
+            span.status, span.error = "failed", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_spans.reset(token)
+            span.seconds = time.perf_counter() - span.start_counter
+            self._finish(span.to_record())
+
+    def _finish(self, record):
+        with self.lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def summary(self, program_name=None):
+        """按(程序, 阶段)汇总：次数、失败数、p50/p95/平均耗时与各计数指标之和；程序"*"为全部程序合计"""
+        with self.lock:
+            records = [record for record in self.records if program_name in (None, record["program"])]
+        groups = {}
+        for record in records:
+            for program in (record["program"] or "-", "*"):
+                groups.setdefault((program, record["stage"]), []).append(record)
+        summary = {}
+        for (program, stage), group in sorted(groups.items()):
+            seconds = [record["seconds"] for record in group]
+            entry = {"count": len(group), "failed": sum(record["status"] != "ok" for record in group),
+                     "mean": round(sum(seconds) / len(seconds), 4)}
+            for fraction in REPORT_QUANTILES:
+                entry[f"p{int(fraction * 100)}"] = round(percentile(seconds, fraction), 4)
+            entry["total_seconds"] = round(sum(seconds), 4)
+            for name in METRIC_NAMES:
+                entry[name] = sum(record[name] for record in group)
+            # 本地开销：阶段耗时中不在等待LLM的部分
+            entry["llm_seconds"] = round(entry["llm_seconds"], 4)
+            entry["overhead_seconds"] = round(entry["total_seconds"] - entry["llm_seconds"], 4)
+            summary.setdefault(program, {})[stage] = entry
+        return summary
+
+    def format_report(self, program_name=None):
+        """文本报表：每个程序每个阶段一行"""
+        lines = [f"{'程序':<24}{'阶段':<14}{'次数':>6}{'失败':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'合计(秒)':>10}"
+                 f"{'输入token':>11}{'输出token':>11}{'缓存token':>11}{'缓存命中':>9}{'重试':>6}"]
+        for program, stages in self.summary(program_name).items():
+            for stage, entry in stages.items():
+                lines.append(f"{program:<24}{stage:<14}{entry['count']:>6}{entry['failed']:>6}{entry['p50']:>10}"
+                             f"{entry['p95']:>10}{entry['total_seconds']:>10}{entry['prompt_tokens']:>11}"
+                             f"{entry['completion_tokens']:>11}{entry['cached_tokens']:>11}"
+                             f"{entry['cache_hits']:>9}{entry['retries']:>6}")
+        return "\n".join(lines)
+
+    def write_prometheus(self, path, program_name=None):
+        """按Prometheus文本格式写出各阶段耗时分位数与计数指标（供node_exporter textfile采集或直接查看）"""
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary"]
+        counters = []
+        for program, stages in self.summary(program_name).items():
+            if program == "*":
+                continue
+            for stage, entry in stages.items():
+                labels = f'program="{program}",stage="{stage}"'
+                for fraction in REPORT_QUANTILES:
+                    lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels},quantile="{fraction}"}} '
+                                 f'{entry[f"p{int(fraction * 100)}"]}')
+                lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_sum{{{labels}}} {entry['total_seconds']}")
+                lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_count{{{labels}}} {entry['count']}")
+                counters.append((labels, entry))
+        for name in ("failed",) + METRIC_NAMES:
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_stage_{name}_total counter")
+            lines.extend(f"{PROMETHEUS_PREFIX}_stage_{name}_total{{{labels}}} {entry[name]}"
+                         for labels, entry in counters)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+_default_tracer = Tracer()
+_default_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """进程内共享的tracer"""
+    return _default_tracer
+
+
+def enable_tracing(path):
+    """之后的span同时追加到path（JSONL），返回tracer以便输出报表"""
+    global _default_tracer
+    with _default_tracer_lock:
+        _default_tracer = Tracer(path)
+        return _default_tracer
+
+
+def span(stage, **attributes):
+    return get_tracer().span(stage, **attributes)
+
+
+def traced(stage):
+    """装饰器：每次调用记录一个stage阶段的span"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(**metrics):
+    """把计数指标累加到当前上下文中所有打开的span；没有打开的span时忽略"""
+    spans = _current_spans.get()
+    if not spans:
+        return
+    with _record_lock:  # 并发提取时多个线程同时累加到外层span
+        for current in spans:
+            for name, value in metrics.items():
+                current.metrics[name] += value
+
+
+def usage_from_message(message):
+    """从模型返回的消息中取(输入token, 输出token, 命中服务端前缀缓存的输入token)，服务端未返回用量时返回None
+
+    OpenAI在prompt_tokens_details.cached_tokens中返回缓存命中数，DeepSeek在prompt_cache_hit_tokens中返回。
+    """
+    usage = getattr(message, "usage_metadata", None)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    cached = token_usage.get("prompt_cache_hit_tokens") or \
+        (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    if usage:
+        return (usage.get("input_tokens", 0), usage.get("output_tokens", 0),
+                (usage.get("input_token_details") or {}).get("cache_read") or cached)
+    if token_usage:
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0), cached
+    return None
+
+
+class TracingChatModel(DelegatingChatModel):
+    """把每次实际发出的LLM请求的token用量记入当前span；服务端未返回用量时按token_counter估算
+
+    LLM缓存命中不会进入_generate，由llm_cache在查询时记为cache_hits。
+    """
+
+    def _record(self, messages, message, text, seconds):
+        usage = usage_from_message(message)
+        if usage is None:
+            prompt_tokens, completion_tokens = count_message_tokens(messages), count_tokens(text)
+            record(llm_calls=1, llm_seconds=seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                   estimated_tokens=prompt_tokens + completion_tokens)
+        else:
+            record(llm_calls=1, llm_seconds=seconds, prompt_tokens=usage[0], completion_tokens=usage[1],
+                   cached_tokens=usage[2])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            result = self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception:
+            record(llm_seconds=time.perf_counter() - start_time)
+            raise
+        self._record(messages, result.generations[0].message, result.generations[0].text,
+                     time.perf_counter() - start_time)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        start_time, aggregate = time.perf_counter(), None
+        try:
+            for chunk in self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                aggregate = chunk if aggregate is None else aggregate + chunk
+                yield chunk
+        finally:  # 调用方提前关闭流时也记录已收到部分的用量
+            if aggregate is not None:
+                self._record(messages, aggregate.message, aggregate.text, time.perf_counter() - start_time)
+            else:
+                record(llm_seconds=time.perf_counter() - start_time)
@@ -0,0 +1,62 @@
+# coding=utf-8
+import re
+import time
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from delegating_chat_model import DelegatingChatModel, supports_streaming
+from token_counter import count_tokens
+
+# 流式输出中的最终判定结果，只在YES/NO完整出现后才算命中，避免把“YE”之类的半截输出当成结论
+FINAL_VERDICT_PATTERN = re.compile(r"等价变异体判定结果：\s*(YES|NO)")
+
+
+class VerdictStreamingChatModel(DelegatingChatModel):
+    """以流式方式调用判定链：逐块读取输出，判定结果出现时记录耗时，early_stop为True时立即结束流
+
+    提前结束时返回截至判定结果（含句号）的文本，格式与完整输出的结论行一致，该文本不写入LLM缓存；
+    首个输出块、判定结果的耗时与输出token数写入返回消息的response_metadata。内部模型不支持流式时退化为普通调用。
+    """
+
+    early_stop: bool = True
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        start_time = time.perf_counter()
+        if not supports_streaming(self.llm):
+            result = self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            text = result.generations[0].text
+            elapsed = time.perf_counter() - start_time
+            verdict_time = elapsed if FINAL_VERDICT_PATTERN.search(text) else None
+            return self._result(text, result.generations[0].message.response_metadata, verdict_time, elapsed, False)
+
+        text, verdict_time, early_stopped, metadata, first_token_time = "", None, False, {}, None
+        stream = self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        try:
+            for chunk in stream:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                searched_from = max(0, len(text) - 32)
+                text += chunk.text
+                metadata.update(chunk.message.response_metadata or {})
+                match = FINAL_VERDICT_PATTERN.search(text, searched_from)
+                if verdict_time is None and match:
+                    verdict_time = time.perf_counter() - start_time
+                    if self.early_stop:
+                        early_stopped = True
+                        end = match.end() + (1 if text[match.end():match.end() + 1] == "。" else 0)
+                        text = text[:end] if len(text) > end else text
+                        break
+        finally:
+            stream.close()  # 关闭生成器即断开HTTP流，服务端停止生成
+        metadata["time_to_first_token"] = round(first_token_time, 4) if first_token_time is not None else None
+        return self._result(text, metadata, verdict_time, time.perf_counter() - start_time, early_stopped)
+
+    @staticmethod
+    def _result(text, metadata, verdict_time, elapsed, early_stopped):
+        metadata = dict(metadata or {})
+        metadata.update({
+            "time_to_verdict": round(verdict_time, 4) if verdict_time is not None else None,
+            "generation_seconds": round(elapsed, 4),
+            "output_tokens": count_tokens(text),
+            "early_stopped": early_stopped,
+        })
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, response_metadata=metadata))])
@@ -0,0 +1,43 @@
+# coding=utf-8
+"""三条提取链并发执行时与串行执行的结果一致"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+import emd_analysis  # noqa: E402
+from fake_llm import FakeChatModel  # noqa: E402
+from graph_store import GraphStore, set_graph_store  # noqa: E402
+
+BENCHMARK_DIR = os.path.join(ROOT, "benchmark")
+
+
+@pytest.fixture
+def bundled_graphs(tmp_path):
+    previous = set_graph_store(GraphStore(os.path.join(BENCHMARK_DIR, "mutant_programs"), str(tmp_path)))
+    yield
+    set_graph_store(previous)
+
+
+def test_concurrent_extraction_matches_serial(bundled_graphs):
+    with open(os.path.join(BENCHMARK_DIR, "mutants", "Mid_mutants.json"), encoding="utf-8") as f:
+        mutant = json.load(f)[0]
+    responses = {"data": "变异影响的变量为：mid\n变量mid的数据依赖路径:\n1. (line 17: mid = c) --mid--> (line 25: return mid)",
+                 "ctrl": "控制依赖路径信息：\n1. (16: if (a >= c)) --True--> (17: mid = c)"}
+
+    serial_llm = FakeChatModel(latency=0.2, responses=responses)
+    serial = emd_analysis.extract_dependency_context("Mid", mutant, serial_llm, concurrent=False)
+    concurrent_llm = FakeChatModel(latency=0.2, responses=responses)
+    start_time = time.perf_counter()
+    concurrent = emd_analysis.extract_dependency_context("Mid", mutant, concurrent_llm, concurrent=True)
+    elapsed = time.perf_counter() - start_time
+
+    assert concurrent == serial
+    assert concurrent[1] == responses["data"] and concurrent[2] == responses["ctrl"]
+    assert concurrent_llm.call_count == serial_llm.call_count
+    assert elapsed < 0.35  # 数据与控制依赖的两次LLM调用并行
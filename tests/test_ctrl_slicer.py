@@ -0,0 +1,47 @@
+# coding=utf-8
+"""控制依赖图遍历：复合条件按短路求值展开所有路径"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from ctrl_slicer import condition_outcomes, extract_ctrl_paths  # noqa: E402
+
+
+def make_ctrl_graph(nodes, edges):
+    return {"nodes": [{"id": node_id, "line": line, "label": code} for node_id, (line, code) in enumerate(nodes)],
+            "edges": [{"id": index, "source": source, "target": target, "type": label}
+                      for index, (source, target, label) in enumerate(edges)]}
+
+
+def test_condition_outcomes_follow_short_circuit():
+    outcomes = condition_outcomes("(a > b && c > d) || !e")
+    assert outcomes[True] == [[("a > b", True), ("c > d", True)],
+                              [("a > b", False), ("!e", True)],
+                              [("a > b", True), ("c > d", False), ("!e", True)]]
+    assert outcomes[False] == [[("a > b", False), ("!e", False)],
+                               [("a > b", True), ("c > d", False), ("!e", False)]]
+    assert condition_outcomes("!(a && b)") == {True: [[("a", False)], [("a", True), ("b", False)]],
+                                               False: [[("a", True), ("b", True)]]}
+
+
+def test_compound_predicate_expands_every_path():
+    # int f(int a, int b, int c, int d) { if (a > b && c > d) { return 1; } else { return 0; } }
+    graph = make_ctrl_graph([(1, "int f(int a, int b, int c, int d)"), (2, "if (a > b && c > d)"), (3, "return 1;"),
+                             (5, "return 0;")],
+                            [(0, 1, ""), (1, 2, "True"), (1, 3, "False")])
+    text = extract_ctrl_paths(graph, "@@ -2 +2 @@\n-    if (a > b && c > d) {\n+    if (a >= b && c > d) {")
+    assert text.split("\n")[1:] == [
+        "1. (2: a > b) --True--> (2: c > d) --True--> (3: return 1;)",
+        "2. (2: a > b) --False--> (5: return 0;)",
+        "3. (2: a > b) --True--> (2: c > d) --False--> (5: return 0;)",
+    ]
+
+
+def test_simple_predicate_is_unchanged():
+    graph = make_ctrl_graph([(1, "int f(int a)"), (2, "if (a > 0)"), (3, "return 1;"), (5, "return 0;")],
+                            [(0, 1, ""), (1, 2, "True"), (1, 3, "False")])
+    text = extract_ctrl_paths(graph, "@@ -2 +2 @@\n-    if (a > 0) {\n+    if (a >= 0) {")
+    assert text.split("\n")[1:] == ["1. (2: if (a > 0)) --True--> (3: return 1;)",
+                                     "2. (2: if (a > 0)) --False--> (5: return 0;)"]
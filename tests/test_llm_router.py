@@ -0,0 +1,84 @@
+# coding=utf-8
+"""多端点路由：按代价选择端点、可重试错误时切换端点，以及在途请求数、延迟与失败的记录"""
+import os
+import random
+import sys
+
+import pytest
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from fake_llm import FakeChatModel, FakeLLMError, FakeOpenAIServer  # noqa: E402
+from llm_router import Endpoint, RouterChatModel  # noqa: E402
+
+PROMPT = [HumanMessage(content="等价变异体判定")]
+
+
+def openai_endpoint(name, server):
+    langchain_openai = pytest.importorskip("langchain_openai")
+    return Endpoint(name, langchain_openai.ChatOpenAI(base_url=server.url, api_key="fake", model="fake",
+                                                      max_retries=0))
+
+
+class BrokenStreamModel(FakeChatModel):
+    """输出首个块后断开的流"""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield ChatGenerationChunk(message=AIMessageChunk(content="等价"))
+        raise FakeLLMError(502)
+
+
+def test_stream_holds_slot_until_finished():
+    endpoint = Endpoint("a", FakeChatModel(latency=0.2, chunk_size=4))
+    router = RouterChatModel([endpoint])
+    stream = router.stream(PROMPT)
+    next(stream)
+    assert endpoint.outstanding == 1
+    list(stream)
+    assert endpoint.outstanding == 0
+    assert endpoint.latency["judge"] >= 0.15  # 整个流的耗时，而不是首个输出块的耗时
+
+
+def test_mid_stream_error_is_charged_to_endpoint():
+    endpoint = Endpoint("a", BrokenStreamModel())
+    router = RouterChatModel([endpoint])
+    with pytest.raises(FakeLLMError):
+        list(router.stream(PROMPT))
+    assert endpoint.outstanding == 0
+    assert endpoint.counters == {"requests": 1, "errors": 1}
+
+
+def test_routes_to_least_cost_endpoint():
+    random.seed(0)
+    with FakeOpenAIServer(latency=0.02) as fast, FakeOpenAIServer(latency=0.3) as slow:
+        router = RouterChatModel([openai_endpoint("slow", slow), openai_endpoint("fast", fast)])
+        for _ in range(20):
+            router.invoke(PROMPT)
+    stats = router.stats()["endpoints"]
+    assert stats["fast"]["requests"] >= 15
+    assert stats["fast"]["latency"]["judge"] < stats["slow"]["latency"]["judge"]
+    assert router.stats()["failovers"] == 0
+
+
+def test_fails_over_on_retryable_errors():
+    random.seed(0)
+    with FakeOpenAIServer(error_rate=1.0, error_status=503) as bad, FakeOpenAIServer() as good:
+        router = RouterChatModel([openai_endpoint("bad", bad), openai_endpoint("good", good)])
+        for _ in range(6):
+            assert "等价变异体判定结果" in router.invoke(PROMPT).content
+    stats = router.stats()
+    assert stats["endpoints"]["good"]["requests"] == 6
+    assert stats["failovers"] == stats["endpoints"]["bad"]["errors"] > 0
+    assert stats["endpoints"]["bad"]["errors"] <= 3  # 连续失败后熔断，不再路由到该端点
+    assert stats["exhausted"] == 0
+
+
+def test_client_error_does_not_fail_over():
+    with FakeOpenAIServer(script=["400"]) as first, FakeOpenAIServer(script=["400"]) as second:
+        router = RouterChatModel([openai_endpoint("first", first), openai_endpoint("second", second)])
+        with pytest.raises(Exception):
+            router.invoke(PROMPT)
+    assert first.counters["requests"] + second.counters["requests"] == 1
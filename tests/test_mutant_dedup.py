@@ -0,0 +1,61 @@
+# coding=utf-8
+"""变异体去重：变异未涉及的数值类型不区分，变异涉及的类型互不合并"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from mutant_dedup import mutant_fingerprint  # noqa: E402
+from program_graph import ProgramGraph  # noqa: E402
+
+# lastIndexOf的简化图：(行号, 语句)与(源, 目标, 标签)，三类图共用
+LAST_INDEX_OF = [
+    (2, "public static int lastIndexOf(final {T}[] array, final {T} valueToFind, int startIndex)"),
+    (6, "if (startIndex < 0)"),
+    (7, "return INDEX_NOT_FOUND"),
+    (11, "for (int i = startIndex; i >= 0; i--)"),
+    (12, "if (valueToFind == array[i])"),
+    (13, "return i"),
+    (16, "return INDEX_NOT_FOUND"),
+]
+EDGES = [(0, 1, ""), (1, 2, "True"), (1, 3, "False"), (3, 4, "True"), (3, 6, "False"), (4, 5, "True"), (4, 3, "False")]
+
+
+class StubGraphStore:
+    """按程序名中的元素类型生成图，mutated为(行号, 变异后语句)"""
+
+    def __init__(self, mutated):
+        self.mutated = mutated
+
+    def get_program_graph(self, program_name, mutant_id, kind):
+        element_type = program_name[len("ArrayUtilsLast"):].lower()
+        nodes = [(line, self.mutated[1] if line == self.mutated[0] else code.replace("{T}", element_type))
+                 for line, code in LAST_INDEX_OF]
+        return ProgramGraph({
+            "nodes": [{"id": node_id, "line": line, "label": code} for node_id, (line, code) in enumerate(nodes)],
+            "edges": [{"id": index, "source": source, "target": target, "label": label, "type": label}
+                      for index, (source, target, label) in enumerate(EDGES)]})
+
+
+def fingerprint(program_name, difference, mutated):
+    mutant = {"mutant_id": "MUT_001", "operator": "ROR", "difference": difference}
+    return mutant_fingerprint(program_name, mutant, StubGraphStore(mutated))
+
+
+def test_index_mutants_merge_across_element_types():
+    difference = "@@ -6 +6 @@\n-        if (startIndex < 0) {\n+        if (startIndex <= 0) {"
+    mutated = (6, "if (startIndex <= 0)")
+    short_print = fingerprint("ArrayUtilsLastShort", difference, mutated)
+    assert short_print is not None
+    assert short_print == fingerprint("ArrayUtilsLastLong", difference, mutated)
+    assert short_print == fingerprint("ArrayUtilsLastFloat", difference, mutated)
+
+
+def test_element_mutants_stay_apart_across_element_types():
+    difference = "@@ -12 +12 @@\n-            if (valueToFind == array[i]) {\n+            if (valueToFind >= array[i]) {"
+    mutated = (12, "if (valueToFind >= array[i])")
+    assert fingerprint("ArrayUtilsLastShort", difference, mutated) != \
+        fingerprint("ArrayUtilsLastLong", difference, mutated)
+    assert fingerprint("ArrayUtilsLastFloat", difference, mutated) != \
+        fingerprint("ArrayUtilsLastDouble", difference, mutated)
@@ -0,0 +1,116 @@
+# coding=utf-8
+"""路径条件中的变量在变异点之前被重新赋值时，不得据此判定不可达或非必要"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+import emd_analysis  # noqa: E402
+import smt_checker  # noqa: E402
+from fake_llm import FakeChatModel  # noqa: E402
+from path_constraint import is_unsatisfiable  # noqa: E402
+from reachability_engine import analyze_reachability, reached_through_loop  # noqa: E402
+
+
+def make_graph(nodes, edges, with_uses=False):
+    graph_nodes = []
+    for node_id, (line, code, defs, uses) in enumerate(nodes):
+        node = {"id": node_id, "line": line, "label": code}
+        if with_uses:
+            node.update(defs=defs, uses=uses)
+        graph_nodes.append(node)
+    return {"nodes": graph_nodes,
+            "edges": [{"source": source, "target": target, "type": kind, "label": label}
+                      for source, target, kind, label in edges]}
+
+
+# int f(int x) { if (x > 0) { return 0; } else { x = x + 1; if (x > 0) return 1; } return 2; }
+REASSIGNED_CFG = make_graph(
+    [(1, "int f(int x)", [], []), (2, "if (x > 0)", [], []), (2, "return 0;", [], []),
+     (3, "x = x + 1;", [], []), (4, "if (x > 0)", [], []), (4, "return 1;", [], []), (5, "return 2;", [], [])],
+    [(0, 1, "", ""), (1, 2, "True", "True"), (1, 3, "False", "False"), (3, 4, "", ""),
+     (4, 5, "True", "True"), (4, 6, "False", "False")])
+REASSIGNED_MUTANT = {"mutant_id": "MUT_001", "difference": "@@ -4 +4 @@\n-            return 1;\n+            return 2;"}
+
+
+def test_reassigned_literal_is_not_contradictory():
+    result = analyze_reachability(REASSIGNED_CFG, REASSIGNED_MUTANT["difference"])
+    assert result["sound"]
+    assert not is_unsatisfiable(result["constraint"])
+    assert "!(x > 0)" not in result["constraint"]
+
+
+# int f(int x, int n) { if (x == 0) return 0; while (n > 0) { if (x == 0) return 1; x--; n--; } return 2; }
+# 首次迭代时x != 0，但回边上的x--使后续迭代可以到达return 1（x=1, n=2）
+LOOP_CFG = make_graph(
+    [(1, "int f(int x, int n)", [], []), (2, "if (x == 0)", [], []), (2, "return 0;", [], []),
+     (3, "while (n > 0)", [], []), (4, "if (x == 0)", [], []), (5, "return 1;", [], []), (6, "x--;", [], []),
+     (7, "n--;", [], []), (9, "return 2;", [], [])],
+    [(0, 1, "", ""), (1, 2, "True", "True"), (1, 3, "False", "False"), (3, 4, "True", "True"),
+     (3, 8, "False", "False"), (4, 5, "True", "True"), (4, 6, "False", "False"), (6, 7, "", ""), (7, 3, "", "")])
+
+
+def test_literal_written_in_loop_is_dropped():
+    result = analyze_reachability(LOOP_CFG, "@@ -5 +5 @@\n-            return 1;\n+            return 2;")
+    assert not is_unsatisfiable(result["constraint"])
+    assert "x == 0" not in result["constraint"]
+    assert reached_through_loop(LOOP_CFG, "@@ -5 +5 @@\n-            return 1;\n+            return 2;")
+    assert not reached_through_loop(LOOP_CFG, "@@ -2 +2 @@\n-    if (x == 0) return 0;\n+    if (x != 0) return 0;")
+
+
+def test_opaque_call_marks_constraint_unsound():
+    graph = make_graph([(1, "int f(int x)", [], []), (2, "if (x > 0)", [], []), (3, "update();", [], []),
+                        (4, "return x;", [], [])],
+                       [(0, 1, "", ""), (1, 2, "True", "True"), (2, 3, "", "")])
+    result = analyze_reachability(graph, "@@ -4 +4 @@\n-return x;\n+return -x;")
+    assert result == {"constraint": "(x > 0)", "sound": False}
+
+
+@pytest.mark.parametrize("sound", [False, True])
+def test_cascade_short_circuits_only_on_sound_constraint(monkeypatch, tmp_path, sound):
+    program_path = tmp_path / "F.java"
+    program_path.write_text("class F {}", encoding="utf-8")
+    monkeypatch.setattr(emd_analysis, "get_reachability_path", lambda *args: "(x > 0) && !(x > 0)")
+    monkeypatch.setattr(emd_analysis, "is_sound_reachability", lambda *args: sound)
+    monkeypatch.setattr(emd_analysis, "extract_dependency_paths", lambda *args: ("data", "ctrl"))
+
+    artifact = emd_analysis._extract_artifact(str(program_path), "F", REASSIGNED_MUTANT, FakeChatModel(), False,
+                                              True, False)
+    if sound:
+        assert artifact["verdict_source"] == "reachability"
+    else:
+        assert artifact["verdict"] is None
+        assert (artifact["data"], artifact["ctrl"]) == ("data", "ctrl")
+
+
+@pytest.mark.skipif(smt_checker.z3 is None, reason="未安装z3")
+def test_solver_ignores_literal_redefined_before_mutant():
+    # if (a > 0) { a = a - 5; if (a > 0) return 1; }，内层条件变异为 a >= 0，a=5时可以区分
+    code = "static int f(int a) { if (a > 0) { a = a - 5; if (a > 0) return 1; } return 0; }"
+    mutant = {"mutant_id": "MUT_002", "difference": "@@ -4 +4 @@\n-        if (a > 0)\n+        if (a >= 0)"}
+    data_graph = make_graph(
+        [(1, "static int f(int a)", ["a"], []), (2, "if (a > 0)", [], ["a"]), (3, "a = a - 5", ["a"], ["a"]),
+         (4, "if (a >= 0)", [], ["a"])],
+        [(0, 1, "Flows", "a"), (0, 2, "Flows", "a"), (2, 3, "Flows", "a")], with_uses=True)
+
+    result = smt_checker.check_mutant(code, mutant, "(a > 0)", data_graph=data_graph)
+    assert result["verdict"] is None
+    assert result["outcome"] == "distinguishable"
+
+    unconfirmed = smt_checker.check_mutant(code, mutant, "(a > 0)")
+    assert unconfirmed["verdict"] is None
+
+
+@pytest.mark.skipif(smt_checker.z3 is None, reason="未安装z3")
+def test_solver_ignores_path_condition_inside_loop():
+    # 首次迭代时 x > 0，循环体中的 x = x - 1 使后续迭代 x == 0，此时 x > 0 与 x >= 0 取值不同（x=1可杀死变异体）
+    code = ("static int f(int x, int n) { if (x <= 0) return 0; "
+            "while (n < 3) { if (x > 0) n = n + 1; x = x - 1; n = n + 1; } return n; }")
+    mutant = {"mutant_id": "MUT_004", "difference": "@@ -4 +4 @@\n-        if (x > 0)\n+        if (x >= 0)"}
+
+    result = smt_checker.check_mutant(code, mutant, "!(x <= 0) && (n < 3)", sound=True, in_loop=True)
+    assert result["verdict"] is None
+    assert result["outcome"] == "distinguishable"
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""LLM容错层：对本地伪OpenAI服务注入错误与延迟，验证退避重试、超时、熔断与对冲请求"""
+import os
+import sys
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from fake_llm import FakeOpenAIServer  # noqa: E402
+from prompt_stage import message_stage  # noqa: E402
+from resilient_llm import (AttemptTimeout, CircuitBreaker, CircuitOpenError, LatencyTracker,  # noqa: E402
+                           ResilientChatModel)
+
+langchain_openai = pytest.importorskip("langchain_openai")
+
+PROMPT = [HumanMessage(content="等价变异体判定")]
+
+
+def resilient(server, **kwargs):
+    llm = langchain_openai.ChatOpenAI(base_url=server.url, api_key="fake", model="fake", max_retries=0)
+    kwargs.setdefault("hedge", False)
+    return ResilientChatModel(llm=llm, backoff_base=0.01, backoff_max=0.05, **kwargs)
+
+
+def test_retries_429_and_5xx_with_backoff():
+    with FakeOpenAIServer(script=["429", "503", "500", "ok"]) as server:
+        llm = resilient(server)
+        assert "等价变异体判定结果" in llm.invoke(PROMPT).content
+    assert server.counters["requests"] == 4
+    assert llm.stats()["retries"] == 3
+    assert llm.stats()["breaker"] == "closed"
+
+
+def test_retry_after_header_is_honoured():
+    with FakeOpenAIServer(script=["429", "ok"], retry_after=0.3) as server:
+        llm = resilient(server)
+        start_time = time.perf_counter()
+        llm.invoke(PROMPT)
+        assert time.perf_counter() - start_time >= 0.3
+
+
+def test_client_errors_are_not_retried():
+    with FakeOpenAIServer(script=["400"]) as server:
+        llm = resilient(server)
+        with pytest.raises(Exception):
+            llm.invoke(PROMPT)
+    assert server.counters["requests"] == 1
+    assert llm.stats()["retries"] == 0
+
+
+def test_attempt_timeout_is_retried():
+    with FakeOpenAIServer(script=["slow", "ok"], slow_latency=1.0) as server:
+        llm = resilient(server, timeout=0.3)
+        start_time = time.perf_counter()
+        llm.invoke(PROMPT)
+        assert time.perf_counter() - start_time < 1.0
+    assert llm.stats()["timeouts"] == 1
+
+
+def test_stream_idle_timeout():
+    with FakeOpenAIServer(chunk_size=4, chunk_latency=0.5) as server:
+        llm = resilient(server, timeout=5.0, stream_idle_timeout=0.2)
+        stream = llm.stream(PROMPT)
+        next(stream)
+        with pytest.raises(AttemptTimeout):
+            list(stream)
+    assert llm.stats()["timeouts"] == 1
+    assert llm.stats()["retries"] == 0  # 已开始输出的流不重试
+
+
+def test_breaker_opens_then_half_open_probe_closes_it():
+    with FakeOpenAIServer(script=["500", "500"]) as server:
+        llm = resilient(server, max_retries=1, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=0.3))
+        with pytest.raises(Exception):
+            llm.invoke(PROMPT)
+        assert llm.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            llm.invoke(PROMPT)
+        assert server.counters["requests"] == 2  # 熔断期间不发请求
+
+        time.sleep(0.35)
+        llm.invoke(PROMPT)  # 冷却期后的试探请求成功
+        assert llm.breaker.state == "closed"
+    assert llm.stats()["rejected"] == 1
+
+
+def test_hedge_request_wins_over_slow_attempt():
+    latencies = LatencyTracker()
+    for _ in range(3):
+        latencies.record(message_stage(PROMPT), 0.05)
+    with FakeOpenAIServer(script=["slow", "ok"], slow_latency=1.5) as server:
+        llm = resilient(server, hedge=True, latencies=latencies, hedge_min_samples=3, hedge_min_delay=0.1)
+        start_time = time.perf_counter()
+        llm.invoke(PROMPT)
+        assert time.perf_counter() - start_time < 1.0
+    assert llm.stats()["hedges"] == 1
+    assert llm.stats()["hedge_wins"] == 1